@@ -1,3 +1,46 @@
+from django.contrib.auth.models import User
 from django.test import TestCase
+from django.urls import reverse
+from cart.services import place_order
+from movies.models import Movie
+from movies.pagination import encode_cursor
 
-# Create your tests here.
+class OrdersPageTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='buyer', password='secret-pass')
+        self.movies = [
+            Movie.objects.create(name=f'Movie {i}', price=i + 1, description='', image='movie_images/a.jpg')
+            for i in range(5)
+        ]
+        for i in range(15):
+            place_order(self.user, {movie.id: i + 1 for movie in self.movies}, 'Ohio')
+        self.client.force_login(self.user)
+
+    def test_orders_load_in_constant_queries(self):
+        # User, orders and their items with movies; the session comes from the cache
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('accounts.orders'))
+
+        orders = response.context['template_data']['orders']
+        self.assertEqual(len(orders), 10)
+        newest = orders[0]
+        self.assertEqual(newest.item_count, 15 * 5)
+        self.assertEqual(sum(item.line_total for item in newest.items), newest.total)
+
+    def test_older_orders_are_paged_by_date(self):
+        response = self.client.get(reverse('accounts.orders'))
+        cursor = response.context['template_data']['next_cursor']
+        first_page = [order.id for order in response.context['template_data']['orders']]
+
+        response = self.client.get(reverse('accounts.orders'), {'cursor': cursor})
+        second_page = [order.id for order in response.context['template_data']['orders']]
+
+        self.assertIsNone(response.context['template_data']['next_cursor'])
+        self.assertEqual(first_page + second_page, list(self.user.order_set.order_by('-date', '-id').values_list('id', flat=True)))
+
+    def test_mistyped_cursor_shows_the_newest_orders(self):
+        newest = self.user.order_set.order_by('-date', '-id').first()
+        for values in (['not-a-date', 'x'], [1, 'x']):
+            with self.subTest(values=values):
+                response = self.client.get(reverse('accounts.orders'), {'cursor': encode_cursor(values)})
+                self.assertEqual(response.context['template_data']['orders'][0].id, newest.id)
@@ -5,6 +5,11 @@ from .forms import CustomUserCreationForm, CustomErrorList
 from django.shortcuts import redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
+from django.db.models import Prefetch
+from cart.models import Item
+from movies.pagination import keyset_page
+
+ORDERS_PAGE_SIZE = 10
 
 @login_required
 def logout(request):
@@ -43,7 +48,22 @@ def signup(request):
 
 @login_required
 def orders(request):
+    # Load a page of orders newest first, with all of their items and movies
+    # fetched by one extra query
+    items = Item.objects.select_related('movie').only(
+        'id', 'price', 'quantity', 'order_id', 'movie__id', 'movie__name'
+    )
+    orders = request.user.order_set.prefetch_related(Prefetch('item_set', queryset=items, to_attr='items'))
+    orders, next_cursor = keyset_page(orders, ('-date', '-id'), request.GET.get('cursor'), ORDERS_PAGE_SIZE)
+
+    for order in orders:
+        order.item_count = 0
+        for item in order.items:
+            item.line_total = item.price * item.quantity
+            order.item_count += item.quantity
+
     template_data = {}
     template_data['title'] = 'Orders'
-    template_data['orders'] = request.user.order_set.all()
+    template_data['orders'] = orders
+    template_data['next_cursor'] = next_cursor
     return render(request, 'accounts/orders.html', {'template_data': template_data})
@@ -1,6 +1,35 @@
-
 from django.contrib import admin
+from .exports import export_items, export_response
 from .models import Order, Item
 
-admin.site.register(Order)
-admin.site.register(Item)
+class ItemInline(admin.TabularInline):
+    model = Item
+    raw_id_fields = ['movie']
+    extra = 0
+
+class OrderAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'state', 'total', 'date']
+    list_filter = ['state']
+    list_select_related = ['user']
+    date_hierarchy = 'date'
+    ordering = ['-date']
+    search_fields = ['user__username']
+    inlines = [ItemInline]
+    actions = ['export_csv', 'export_jsonl']
+
+    @admin.action(description='Export selected orders as CSV')
+    def export_csv(self, request, queryset):
+        return export_response(request, export_items(queryset), 'csv')
+
+    @admin.action(description='Export selected orders as JSON lines')
+    def export_jsonl(self, request, queryset):
+        return export_response(request, export_items(queryset), 'jsonl')
+
+class ItemAdmin(admin.ModelAdmin):
+    list_display = ['id', 'order', 'movie', 'price', 'quantity']
+    list_select_related = ['order__user', 'movie']
+    raw_id_fields = ['order', 'movie']
+    ordering = ['-id']
+
+admin.site.register(Order, OrderAdmin)
+admin.site.register(Item, ItemAdmin)
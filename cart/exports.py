@@ -0,0 +1,107 @@
+"""
+Streaming exports of the order history, one row per order item.
+
+Rows are read with ``iterator(chunk_size=...)`` and encoded as they go, so
+an export of any size runs in constant memory and its first bytes are sent
+before the last rows are read. Used by the order admin actions and by
+``manage.py export_orders``.
+
+Under ASGI, Django reads a sync iterator to the end before sending any of
+it, so responses to ASGI requests stream from an async iterator instead,
+which reads each chunk of rows through sync_to_async.
+"""
+import csv
+import json
+from datetime import datetime, time, timedelta
+from itertools import islice
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from .models import Item
+
+EXPORT_CHUNK_SIZE = 2000
+
+EXPORT_FIELDS = [
+    'order_id', 'date', 'state', 'username', 'movie_id', 'movie', 'price', 'quantity', 'subtotal', 'order_total',
+]
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+def export_items(orders=None, since=None, until=None, state=None):
+    """
+    Return the items to export, in order date order. ``orders`` restricts
+    them to a queryset of orders; ``since`` and ``until`` are inclusive
+    dates. The date and state filters are ranges over the order_date_idx
+    and order_state_date_idx indexes.
+    """
+    items = Item.objects.select_related('order__user', 'movie').only(
+        'price', 'quantity', 'order__date', 'order__state', 'order__total', 'order__user__username', 'movie__name',
+    )
+    if orders is not None:
+        items = items.filter(order__in=orders)
+    if since is not None:
+        items = items.filter(order__date__gte=_start_of_day(since))
+    if until is not None:
+        items = items.filter(order__date__lt=_start_of_day(until + timedelta(days=1)))
+    if state:
+        items = items.filter(order__state=state)
+    return items.order_by('order__date', 'order_id', 'id')
+
+def _start_of_day(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+def export_rows(items, chunk_size=EXPORT_CHUNK_SIZE):
+    for item in items.iterator(chunk_size=chunk_size):
+        order = item.order
+        yield {
+            'order_id': order.id,
+            'date': order.date.isoformat(),
+            'state': order.state,
+            'username': order.user.username,
+            'movie_id': item.movie_id,
+            'movie': item.movie.name,
+            'price': item.price,
+            'quantity': item.quantity,
+            'subtotal': item.price * item.quantity,
+            'order_total': order.total,
+        }
+
+class _Echo:
+    """A file-like object csv.writer writes a line at a time to, returning it"""
+
+    def write(self, value):
+        return value
+
+def stream_csv(rows):
+    writer = csv.DictWriter(_Echo(), fieldnames=EXPORT_FIELDS)
+    yield writer.writeheader()
+    for row in rows:
+        yield writer.writerow(row)
+
+def stream_jsonl(rows):
+    for row in rows:
+        yield json.dumps(row) + '\n'
+
+def stream_export(items, export_format, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield the lines of an export of ``items`` as 'csv' or 'jsonl'"""
+    rows = export_rows(items, chunk_size)
+    return stream_csv(rows) if export_format == 'csv' else stream_jsonl(rows)
+
+async def astream_export(items, export_format, chunk_size=EXPORT_CHUNK_SIZE):
+    """Like stream_export, but yield the lines of each chunk of rows together, without blocking the event loop"""
+    lines = stream_export(items, export_format, chunk_size)
+    # Thread sensitive, so every chunk is read on the thread, and through
+    # the database connection, the first one was
+    next_chunk = sync_to_async(lambda: ''.join(islice(lines, chunk_size)))
+    while chunk := await next_chunk():
+        yield chunk
+
+def export_response(request, items, export_format, filename='orders'):
+    stream = astream_export if isinstance(request, ASGIRequest) else stream_export
+    response = StreamingHttpResponse(stream(items, export_format), content_type=EXPORT_FORMATS[export_format])
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{export_format}"'
+    return response
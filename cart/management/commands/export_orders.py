@@ -0,0 +1,34 @@
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from cart.exports import EXPORT_CHUNK_SIZE, EXPORT_FORMATS, export_items, stream_export
+
+def parse_date(value):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f'Invalid date {value!r}, expected YYYY-MM-DD.')
+
+class Command(BaseCommand):
+    help = 'Stream the order history as CSV or JSON lines, one row per order item'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(EXPORT_FORMATS), default='csv')
+        parser.add_argument('--since', type=str, help='First order date to export (YYYY-MM-DD)')
+        parser.add_argument('--until', type=str, help='Last order date to export (YYYY-MM-DD)')
+        parser.add_argument('--state', help='Only export orders shipped to this state')
+        parser.add_argument('--output', help='Write to this file instead of standard output')
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        items = export_items(
+            since=options['since'] and parse_date(options['since']),
+            until=options['until'] and parse_date(options['until']),
+            state=options['state'],
+        )
+        lines = stream_export(items, options['format'], options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'w', newline='') as output:
+                output.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
@@ -0,0 +1,45 @@
+from itertools import islice
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from cart.models import Item, StateMovieSales
+from movies.caching import bump_version
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-state daily sales rollup from the order history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        rows = Item.objects.annotate(
+            day=TruncDate('order__date')
+        ).values('order__state', 'movie_id', 'day').annotate(
+            total_quantity=Sum('quantity'),
+            total_orders=Count('order', distinct=True)
+        ).order_by()
+
+        rollups = (
+            StateMovieSales(
+                state=row['order__state'],
+                movie_id=row['movie_id'],
+                day=row['day'],
+                quantity=row['total_quantity'],
+                orders=row['total_orders'],
+            )
+            for row in rows.iterator(chunk_size=options['batch_size'])
+        )
+
+        created = 0
+        with transaction.atomic():
+            StateMovieSales.objects.all().delete()
+            while True:
+                batch = list(islice(rollups, options['batch_size']))
+                if not batch:
+                    break
+                StateMovieSales.objects.bulk_create(batch)
+                created += len(batch)
+        bump_version('trending')
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {created} state sales rows.'))
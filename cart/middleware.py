@@ -0,0 +1,37 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from .store import Cart, get_cart_store
+
+class CartMiddleware:
+    """Attach the visitor's cart to request.cart and save it if a view changed it"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        store = self.start(request)
+        response = self.get_response(request)
+        if request.cart.modified:
+            store.save(request, response, request.cart)
+        return response
+
+    async def __acall__(self, request):
+        store = self.start(request)
+        response = await self.get_response(request)
+        if request.cart.modified:
+            await sync_to_async(store.save)(request, response, request.cart)
+        return response
+
+    def start(self, request):
+        store = get_cart_store()
+        # Loaded lazily, the first time a view reads the cart; sync views
+        # already run on a thread under ASGI
+        request.cart = Cart(lambda: store.load(request))
+        return store
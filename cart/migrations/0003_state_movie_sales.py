@@ -0,0 +1,29 @@
+# Generated by Django 5.0.14 on 2026-10-18 20:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0002_order_state'),
+        ('movies', '0006_movie_average_rating'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StateMovieSales',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('state', models.CharField(max_length=50)),
+                ('day', models.DateField()),
+                ('quantity', models.IntegerField(default=0)),
+                ('orders', models.IntegerField(default=0)),
+                ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='movies.movie')),
+            ],
+            options={
+                'unique_together': {('state', 'movie', 'day')},
+            },
+        ),
+    ]
@@ -10,6 +10,16 @@ class Order(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     state = models.CharField(max_length=50, default='Unknown')
 
+    class Meta:
+        indexes = [
+            # Exports over a date range
+            models.Index(fields=['date'], name='order_date_idx'),
+            # Sales by state over a date range
+            models.Index(fields=['state', 'date'], name='order_state_date_idx'),
+            # A user's order history, newest first
+            models.Index(fields=['user', 'date'], name='order_user_date_idx'),
+        ]
+
     def __str__(self):
         return str(self.id) + ' - ' + self.user.username
 
@@ -22,3 +32,22 @@ class Item(models.Model):
 
     def __str__(self):
         return str(self.id) + ' - ' + self.movie.name
+
+class StateMovieSales(models.Model):
+    """Units of a movie sold in a state on a given day.
+
+    Maintained by the purchase flow and rebuilt from order history with
+    ``manage.py rebuild_sales_rollup``.
+    """
+    id = models.AutoField(primary_key=True)
+    state = models.CharField(max_length=50)
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE)
+    day = models.DateField()
+    quantity = models.IntegerField(default=0)
+    orders = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('state', 'movie', 'day')
+
+    def __str__(self):
+        return self.state + ' - ' + str(self.day) + ' - ' + str(self.movie_id)
@@ -0,0 +1,43 @@
+from django.db import transaction
+from django.utils import timezone
+from movies.caching import bump_version
+from movies.models import LeaderboardBucket, Movie
+from .models import Order, Item
+from .utils import record_state_sales
+
+def place_order(user, cart, state):
+    """
+    Create an order and its items for a cart mapping movie ids to quantities.
+
+    Everything is written in one transaction: prices are read once from a
+    locked snapshot of the movies after the order row is inserted, the items
+    are inserted with a single bulk_create and the state sales rollup and the
+    sales leaderboard are updated alongside, so a failure never leaves a
+    partial order behind.
+    """
+    quantities = {int(movie_id): int(quantity) for movie_id, quantity in cart.items()}
+    if not quantities:
+        raise ValueError('Cannot place an order for an empty cart.')
+
+    with transaction.atomic():
+        # Write first: on SQLite a transaction that starts with a read cannot
+        # wait for the write lock, it fails with "database is locked" as soon
+        # as another checkout holds it
+        order = Order.objects.create(user=user, total=0, state=state)
+        prices = dict(
+            Movie.objects.select_for_update().filter(id__in=quantities).values_list('id', 'price')
+        )
+        order.total = sum(price * quantities[movie_id] for movie_id, price in prices.items())
+        order.save(update_fields=['total'])
+
+        items = Item.objects.bulk_create([
+            Item(order=order, movie_id=movie_id, price=price, quantity=quantities[movie_id])
+            for movie_id, price in prices.items()
+        ])
+        record_state_sales(order, items)
+        LeaderboardBucket.add(LeaderboardBucket.SALES, {
+            item.movie_id: (item.price * item.quantity, item.quantity) for item in items
+        }, day=timezone.localdate(order.date))
+        transaction.on_commit(lambda: bump_version('trending'))
+
+    return order
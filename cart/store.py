@@ -0,0 +1,182 @@
+"""
+Cart storage.
+
+The cart is a small mapping of movie ids to quantities. It is kept out of
+the database session so that browsing and filling a cart never writes to
+``django_session``: CartMiddleware loads it lazily into ``request.cart``
+and saves it through the backend named by ``settings.CART_STORE`` only
+when it changed.
+
+Carts are stored in a compact packed form, movie ids and quantities in
+base 36: ``{12: 2, 40: 1}`` becomes ``'c-2.14-1'``.
+"""
+import secrets
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+PAIR_SEPARATOR = '.'
+FIELD_SEPARATOR = '-'
+
+# Keeps the packed cart comfortably below the 4 KB cookie limit
+MAX_ITEMS = 100
+MAX_QUANTITY = 99
+
+def encode_cart(quantities):
+    return PAIR_SEPARATOR.join(
+        f'{_to_base36(movie_id)}{FIELD_SEPARATOR}{_to_base36(quantity)}'
+        for movie_id, quantity in quantities.items()
+    )
+
+def decode_cart(value):
+    """Unpack a stored cart, returning an empty cart if it is malformed"""
+    quantities = {}
+    if not value:
+        return quantities
+    try:
+        for pair in value.split(PAIR_SEPARATOR)[:MAX_ITEMS]:
+            movie_id, quantity = pair.split(FIELD_SEPARATOR)
+            quantity = int(quantity, 36)
+            if quantity > 0:
+                quantities[int(movie_id, 36)] = min(quantity, MAX_QUANTITY)
+    except ValueError:
+        return {}
+    return quantities
+
+def _to_base36(number):
+    digits = ''
+    while True:
+        number, digit = divmod(number, 36)
+        digits = '0123456789abcdefghijklmnopqrstuvwxyz'[digit] + digits
+        if not number:
+            return digits
+
+class Cart(Mapping):
+    """
+    Movie id -> quantity mapping, loaded from the store on first access.
+    Keys may be given as ints or strings.
+    """
+
+    def __init__(self, load=dict):
+        self._load = load
+        self._quantities = None
+        self.modified = False
+
+    @property
+    def quantities(self):
+        if self._quantities is None:
+            self._quantities = self._load()
+        return self._quantities
+
+    def __getitem__(self, movie_id):
+        return self.quantities[int(movie_id)]
+
+    def __iter__(self):
+        return iter(self.quantities)
+
+    def __len__(self):
+        return len(self.quantities)
+
+    def movie_ids(self):
+        return list(self.quantities)
+
+    def set(self, movie_id, quantity):
+        movie_id = int(movie_id)
+        if movie_id not in self.quantities and len(self.quantities) >= MAX_ITEMS:
+            raise ValueError(f'A cart holds at most {MAX_ITEMS} different movies.')
+        self.quantities[movie_id] = max(1, min(int(quantity), MAX_QUANTITY))
+        self.modified = True
+
+    def replace(self, quantities):
+        """Swap in a whole new id -> quantity mapping, e.g. after a batch of changes"""
+        if len(quantities) > MAX_ITEMS:
+            raise ValueError(f'A cart holds at most {MAX_ITEMS} different movies.')
+        quantities = {int(movie_id): max(1, min(int(quantity), MAX_QUANTITY)) for movie_id, quantity in quantities.items()}
+        if quantities != self.quantities:
+            self._quantities = quantities
+            self.modified = True
+
+    def clear(self):
+        if self.quantities:
+            self._quantities = {}
+            self.modified = True
+
+class SignedCookieCartStore:
+    """Keep the cart in a signed cookie, so it costs no server-side storage at all"""
+
+    salt = 'cart.store'
+
+    def load(self, request):
+        return decode_cart(request.get_signed_cookie(settings.CART_COOKIE_NAME, default=None, salt=self.salt))
+
+    def save(self, request, response, cart):
+        if not cart:
+            response.delete_cookie(settings.CART_COOKIE_NAME, samesite='Lax')
+            return
+        response.set_signed_cookie(
+            settings.CART_COOKIE_NAME, encode_cart(cart.quantities), salt=self.salt,
+            max_age=settings.CART_COOKIE_AGE, httponly=True, samesite='Lax',
+            secure=settings.SESSION_COOKIE_SECURE,
+        )
+
+class SessionCartStore:
+    """
+    Keep the cart in the session. Pair it with the cached_db session engine
+    so reads are served from the cache.
+    """
+
+    key = 'cart'
+
+    def load(self, request):
+        return decode_cart(request.session.get(self.key))
+
+    def save(self, request, response, cart):
+        if cart:
+            request.session[self.key] = encode_cart(cart.quantities)
+        elif self.key in request.session:
+            del request.session[self.key]
+
+class MemoryCartStore:
+    """
+    Keep carts in a bounded in-process LRU keyed by a random cookie. Carts
+    are lost on restart and not shared between processes; meant for tests
+    and development.
+    """
+
+    max_entries = 1000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._carts = OrderedDict()
+
+    def load(self, request):
+        token = request.COOKIES.get(settings.CART_COOKIE_NAME)
+        with self._lock:
+            if token not in self._carts:
+                return {}
+            self._carts.move_to_end(token)
+            return decode_cart(self._carts[token])
+
+    def save(self, request, response, cart):
+        token = request.COOKIES.get(settings.CART_COOKIE_NAME) or secrets.token_urlsafe(16)
+        with self._lock:
+            self._carts[token] = encode_cart(cart.quantities)
+            self._carts.move_to_end(token)
+            while len(self._carts) > self.max_entries:
+                self._carts.popitem(last=False)
+        response.set_cookie(settings.CART_COOKIE_NAME, token, httponly=True, samesite='Lax')
+
+    def clear(self):
+        with self._lock:
+            self._carts.clear()
+
+_stores = {}
+
+def get_cart_store():
+    """Return the store configured by settings.CART_STORE, one instance per class"""
+    path = settings.CART_STORE
+    if path not in _stores:
+        _stores[path] = import_string(path)()
+    return _stores[path]
@@ -1,3 +1,260 @@
+import csv
+import json
+import os
+import tempfile
+from datetime import date, timedelta
+from io import StringIO
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from unittest import mock
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from core.queryplans import full_scans
+from movies.models import Movie
+from .exports import export_items, export_rows
+from .models import Order, Item, StateMovieSales
+from .services import place_order
+from .store import Cart, decode_cart, encode_cart, get_cart_store
 
-# Create your tests here.
+class PurchaseTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='buyer', password='secret-pass')
+        self.movie = Movie.objects.create(name='Inception', price=12, description='Dreams', image='movie_images/a.jpg')
+        self.other = Movie.objects.create(name='Heat', price=8, description='Heist', image='movie_images/b.jpg')
+        self.client.force_login(self.user)
+
+    def purchase(self, cart, state='Georgia'):
+        for movie_id, quantity in cart.items():
+            self.client.post(reverse('cart.add', args=[movie_id]), {'quantity': quantity})
+        return self.client.post(reverse('cart.purchase'), {'state': state, 'city': 'Atlanta'})
+
+    def test_purchase_updates_state_rollup(self):
+        self.purchase({str(self.movie.id): '2', str(self.other.id): '1'})
+        self.purchase({str(self.movie.id): '3'})
+
+        rollup = StateMovieSales.objects.get(state='Georgia', movie=self.movie)
+        self.assertEqual(rollup.quantity, 5)
+        self.assertEqual(rollup.orders, 2)
+        self.assertEqual(StateMovieSales.objects.get(movie=self.other).quantity, 1)
+
+    def test_rebuild_sales_rollup_matches_order_history(self):
+        self.purchase({str(self.movie.id): '2'}, state='Texas')
+        self.purchase({str(self.movie.id): '1'}, state='Ohio')
+        StateMovieSales.objects.all().delete()
+
+        call_command('rebuild_sales_rollup', stdout=StringIO())
+
+        totals = dict(StateMovieSales.objects.values_list('state', 'quantity'))
+        self.assertEqual(totals, {'Texas': 2, 'Ohio': 1})
+
+class CartStoreTests(TestCase):
+    def setUp(self):
+        self.movie = Movie.objects.create(name='Inception', price=12, description='Dreams', image='movie_images/a.jpg')
+        self.other = Movie.objects.create(name='Heat', price=8, description='Heist', image='movie_images/b.jpg')
+
+    def test_packed_encoding_round_trips(self):
+        quantities = {12: 2, 40: 1, 123456: 10}
+        self.assertEqual(encode_cart({12: 2, 40: 1}), 'c-2.14-1')
+        self.assertEqual(decode_cart(encode_cart(quantities)), quantities)
+        self.assertEqual(decode_cart('not a cart'), {})
+
+    def test_anonymous_cart_never_touches_the_database(self):
+        with self.assertNumQueries(1):
+            self.client.post(reverse('cart.add', args=[self.movie.id]), {'quantity': '2'})
+        self.client.post(reverse('cart.add', args=[self.other.id]), {'quantity': '1'})
+
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('cart.index'))
+        movies = {movie.name: movie.quantity for movie in response.context['template_data']['movies_in_cart']}
+        self.assertEqual(movies, {'Inception': 2, 'Heat': 1})
+        self.assertEqual(response.context['template_data']['cart_total'], 32)
+        self.assertNotIn('sessionid', self.client.cookies)
+
+        self.client.get(reverse('cart.clear'))
+        self.assertEqual(self.client.get(reverse('cart.index')).context['template_data']['movies_in_cart'], [])
+
+    def test_tampered_cookie_is_ignored(self):
+        self.client.post(reverse('cart.add', args=[self.movie.id]), {'quantity': '2'})
+        self.client.cookies['cart'] = self.client.cookies['cart'].value.replace('-2', '-9')
+
+        self.assertEqual(self.client.get(reverse('cart.index')).context['template_data']['movies_in_cart'], [])
+
+    def test_invalid_quantity_is_rejected(self):
+        response = self.client.post(reverse('cart.add', args=[self.movie.id]), {'quantity': 'lots'})
+        self.assertRedirects(response, reverse('movies.show', args=[self.movie.id]), fetch_redirect_response=False)
+        self.assertNotIn('cart', self.client.cookies)
+
+    async def test_cart_is_saved_by_the_async_middleware_chain(self):
+        await self.async_client.post(reverse('cart.add', args=[self.movie.id]), {'quantity': '2'})
+        response = await self.async_client.get(reverse('cart.index'))
+        self.assertEqual(response.context['template_data']['cart_total'], 24)
+
+    def test_other_stores(self):
+        for store in ['cart.store.SessionCartStore', 'cart.store.MemoryCartStore']:
+            with self.subTest(store=store), self.settings(CART_STORE=store):
+                self.client.post(reverse('cart.add', args=[self.movie.id]), {'quantity': '3'})
+                response = self.client.get(reverse('cart.index'))
+                self.assertEqual(response.context['template_data']['cart_total'], 36)
+                self.client.get(reverse('cart.clear'))
+                self.assertEqual(self.client.get(reverse('cart.index')).context['template_data']['cart_total'], 0)
+
+class CartBatchTests(TestCase):
+    def setUp(self):
+        self.movies = [
+            Movie.objects.create(name=f'Movie {i}', price=i + 1, description='', image='movie_images/a.jpg')
+            for i in range(10)
+        ]
+
+    def batch(self, operations):
+        return self.client.post(reverse('cart.batch'), {'operations': operations}, content_type='application/json')
+
+    def test_fills_a_cart_in_one_query(self):
+        with self.assertNumQueries(1):
+            response = self.batch([{'op': 'add', 'movie_id': movie.id, 'quantity': 2} for movie in self.movies])
+
+        result = response.json()
+        self.assertEqual(len(result['items']), 10)
+        self.assertEqual(result['count'], 20)
+        self.assertEqual(result['total'], 2 * sum(range(1, 11)))
+        self.assertEqual(self.client.get(reverse('cart.index')).context['template_data']['cart_total'], result['total'])
+
+    def test_add_update_and_remove(self):
+        first, second, third = self.movies[:3]
+        self.batch([{'op': 'add', 'movie_id': first.id}, {'op': 'add', 'movie_id': second.id}])
+
+        result = self.batch([
+            {'op': 'add', 'movie_id': first.id, 'quantity': 2},
+            {'op': 'update', 'movie_id': second.id, 'quantity': 0},
+            {'op': 'update', 'movie_id': third.id, 'quantity': 4},
+            {'op': 'remove', 'movie_id': 999},
+        ]).json()
+
+        self.assertEqual([(item['id'], item['quantity']) for item in result['items']], [(first.id, 3), (third.id, 4)])
+        self.assertEqual(result['total'], 1 * 3 + 3 * 4)
+
+    def test_invalid_batch_changes_nothing(self):
+        self.batch([{'op': 'add', 'movie_id': self.movies[0].id}])
+
+        for operations in [
+            [{'op': 'add', 'movie_id': self.movies[1].id}, {'op': 'add', 'movie_id': 999}],
+            [{'op': 'update', 'movie_id': self.movies[1].id, 'quantity': 500}],
+            [{'op': 'buy', 'movie_id': self.movies[1].id}],
+            [],
+        ]:
+            with self.subTest(operations=operations):
+                self.assertEqual(self.batch(operations).status_code, 400)
+
+        self.assertEqual(self.client.post(reverse('cart.batch'), 'nope', content_type='application/json').status_code, 400)
+        movies = self.client.get(reverse('cart.index')).context['template_data']['movies_in_cart']
+        self.assertEqual([(movie.id, movie.quantity) for movie in movies], [(self.movies[0].id, 1)])
+
+class PlaceOrderTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='buyer', password='secret-pass')
+        self.movies = [
+            Movie.objects.create(name=f'Movie {i}', price=i + 1, description='', image='movie_images/a.jpg')
+            for i in range(10)
+        ]
+
+    def test_totals_come_from_price_snapshot(self):
+        order = place_order(self.user, {str(self.movies[2].id): '2', str(self.movies[4].id): 1}, 'Ohio')
+
+        self.assertEqual(order.total, 3 * 2 + 5 * 1)
+        self.assertEqual(sorted(order.item_set.values_list('price', 'quantity')), [(3, 2), (5, 1)])
+
+    def test_query_count_does_not_grow_with_cart_size(self):
+        def count_queries(movies):
+            cart = {movie.id: 1 for movie in movies}
+            with CaptureQueriesContext(connection) as queries:
+                place_order(self.user, cart, 'Ohio')
+            return len(queries)
+
+        self.assertEqual(count_queries(self.movies[:1]), count_queries(self.movies[1:]))
+
+    def test_failure_leaves_no_partial_order(self):
+        with mock.patch('cart.services.record_state_sales', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                place_order(self.user, {self.movies[0].id: 1}, 'Ohio')
+
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(Item.objects.exists())
+
+class OrderExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='buyer', password='secret-pass')
+        self.movie = Movie.objects.create(name='Inception', price=12, description='Dreams', image='movie_images/a.jpg')
+        self.other = Movie.objects.create(name='Heat', price=8, description='Heist', image='movie_images/b.jpg')
+        self.texas = place_order(self.user, {self.movie.id: 2, self.other.id: 1}, 'Texas')
+        self.ohio = place_order(self.user, {self.movie.id: 1}, 'Ohio')
+        Order.objects.filter(id=self.ohio.id).update(date=timezone.now() - timedelta(days=10))
+
+    def export(self, *args):
+        out = StringIO()
+        call_command('export_orders', *args, stdout=out)
+        return out.getvalue()
+
+    def test_command_exports_csv_and_jsonl(self):
+        rows = list(csv.DictReader(StringIO(self.export())))
+        self.assertEqual([(row['state'], row['movie'], row['subtotal']) for row in rows], [
+            ('Ohio', 'Inception', '12'), ('Texas', 'Inception', '24'), ('Texas', 'Heat', '8'),
+        ])
+        self.assertEqual(rows[1]['order_total'], '32')
+
+        lines = self.export('--format', 'jsonl', '--state', 'Texas').splitlines()
+        self.assertEqual([json.loads(line)['movie'] for line in lines], ['Inception', 'Heat'])
+
+        today = timezone.localdate()
+        since = (today - timedelta(days=1)).isoformat()
+        self.assertEqual(len(self.export('--format', 'jsonl', '--since', since).splitlines()), 2)
+        until = (today - timedelta(days=5)).isoformat()
+        self.assertEqual(len(self.export('--format', 'jsonl', '--until', until).splitlines()), 1)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'orders.csv')
+            call_command('export_orders', '--output', path, stdout=StringIO())
+            with open(path, newline='') as output:
+                self.assertEqual(len(list(csv.DictReader(output))), 3)
+
+    def test_filters_use_indexes(self):
+        for items in (
+            export_items(since=date(2024, 1, 1), until=date(2024, 1, 31)),
+            export_items(since=date(2024, 1, 1), state='Texas'),
+        ):
+            sql, params = items.query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+                self.assertEqual(full_scans([row[-1] for row in cursor.fetchall()], sql), [])
+
+    def test_admin_action_streams_selected_orders(self):
+        admin = User.objects.create_superuser(username='admin', password='secret-pass')
+        self.client.force_login(admin)
+        response = self.client.post(reverse('admin:cart_order_changelist'), {
+            'action': 'export_jsonl', '_selected_action': [self.texas.id],
+        })
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="orders.jsonl"')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual({json.loads(line)['order_id'] for line in lines}, {self.texas.id})
+
+    async def test_admin_action_streams_asynchronously_under_asgi(self):
+        admin = await User.objects.acreate(username='admin', is_staff=True, is_superuser=True)
+        await self.async_client.aforce_login(admin)
+        fetched = []
+
+        def rows(items, chunk_size):
+            for row in export_rows(items, chunk_size):
+                fetched.append(row['order_id'])
+                yield row
+
+        with mock.patch('cart.exports.export_rows', rows):
+            response = await self.async_client.post(reverse('admin:cart_order_changelist'), {
+                'action': 'export_csv', '_selected_action': [self.texas.id, self.ohio.id],
+            })
+            self.assertTrue(response.is_async)
+            self.assertEqual(fetched, [])
+            content = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertEqual(fetched, [self.ohio.id, self.texas.id, self.texas.id])
+        self.assertEqual(len(list(csv.DictReader(StringIO(content)))), 3)
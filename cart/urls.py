@@ -5,6 +5,7 @@ from . import views
 urlpatterns = [
     path('', views.index, name='cart.index'),
     path('<int:id>/add/', views.add, name='cart.add'),
+    path('batch/', views.batch, name='cart.batch'),
     path('clear/', views.clear, name='cart.clear'),
     path('checkout/', views.checkout, name='cart.checkout'),
     path('purchase/', views.purchase, name='cart.purchase'),
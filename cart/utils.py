@@ -1,7 +1,105 @@
 
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+from movies.models import Movie
+from .models import StateMovieSales
+from .store import MAX_ITEMS, MAX_QUANTITY
+
+CART_OPERATIONS = ('add', 'update', 'remove')
+
+def load_cart_movies(movie_ids):
+    return Movie.objects.only('id', 'name', 'price', 'image').in_bulk(movie_ids)
+
+def cart_contents(cart, movies=None):
+    """
+    Return the movies in a cart, in the order they were added and each
+    annotated with its quantity and subtotal, together with the cart total.
+    ``movies`` may hold the cart's movies already loaded by id.
+    """
+    if not cart:
+        return [], 0
+    if movies is None:
+        movies = load_cart_movies(cart.keys())
+    # Movies removed from the catalog since they were added are skipped
+    movies_in_cart = [movies[movie_id] for movie_id in cart if movie_id in movies]
+    for movie in movies_in_cart:
+        movie.quantity = cart[movie.id]
+        movie.subtotal = movie.price * movie.quantity
+    return movies_in_cart, calculate_cart_total(cart, movies_in_cart)
+
+def apply_cart_operations(cart, operations):
+    """
+    Apply a list of ``{'op': 'add' | 'update' | 'remove', 'movie_id': ...,
+    'quantity': ...}`` operations to a cart, all or nothing.
+
+    The movie ids are validated with the same single query that loads the
+    movies of the resulting cart, which are returned like cart_contents().
+    Raises ValueError, leaving the cart untouched, if any operation is
+    invalid.
+    """
+    if not isinstance(operations, list) or not operations:
+        raise ValueError('Expected a non-empty list of operations.')
+    if len(operations) > MAX_ITEMS:
+        raise ValueError(f'At most {MAX_ITEMS} operations are allowed per request.')
+
+    changes = []
+    for operation in operations:
+        if not isinstance(operation, dict) or operation.get('op') not in CART_OPERATIONS:
+            raise ValueError(f"Each operation needs an 'op' of {', '.join(CART_OPERATIONS)}.")
+        movie_id = operation.get('movie_id')
+        quantity = operation.get('quantity', 1 if operation['op'] == 'add' else 0)
+        if not _is_int(movie_id) or not _is_int(quantity):
+            raise ValueError("'movie_id' and 'quantity' must be integers.")
+        # Updating to a quantity of 0 removes the movie
+        low = 1 if operation['op'] == 'add' else 0
+        if operation['op'] != 'remove' and not low <= quantity <= MAX_QUANTITY:
+            raise ValueError(f'Quantities must be between {low} and {MAX_QUANTITY}.')
+        changes.append((operation['op'], movie_id, quantity))
+
+    movies = load_cart_movies({movie_id for _, movie_id, _ in changes} | set(cart))
+    unknown = sorted({movie_id for op, movie_id, _ in changes if op != 'remove'} - set(movies))
+    if unknown:
+        raise ValueError(f"Unknown movie ids: {', '.join(map(str, unknown))}.")
+
+    quantities = dict(cart.quantities)
+    for op, movie_id, quantity in changes:
+        if op == 'add':
+            quantities[movie_id] = min(quantities.get(movie_id, 0) + quantity, MAX_QUANTITY)
+        elif op == 'update' and quantity:
+            quantities[movie_id] = quantity
+        else:
+            quantities.pop(movie_id, None)
+    cart.replace(quantities)
+    return cart_contents(cart, movies)
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
 def calculate_cart_total(cart, movies_in_cart):
     total = 0
     for movie in movies_in_cart:
-        quantity = cart[str(movie.id)]
+        quantity = cart[movie.id]
         total += movie.price * int(quantity)
     return total
+
+def record_state_sales(order, items):
+    """Add the items of a freshly placed order to the state sales rollup"""
+    quantities = {item.movie_id: int(item.quantity) for item in items}
+    if not quantities:
+        return
+    day = timezone.localdate(order.date)
+    # Make sure every rollup row exists, then bump them all with one UPDATE,
+    # so the cost does not depend on the number of items in the order
+    StateMovieSales.objects.bulk_create([
+        StateMovieSales(state=order.state, movie_id=movie_id, day=day)
+        for movie_id in quantities
+    ], ignore_conflicts=True)
+    StateMovieSales.objects.filter(
+        state=order.state, day=day, movie_id__in=quantities
+    ).update(
+        quantity=F('quantity') + Case(
+            *[When(movie_id=movie_id, then=Value(quantity)) for movie_id, quantity in quantities.items()],
+            output_field=IntegerField(),
+        ),
+        orders=F('orders') + 1,
+    )
@@ -1,21 +1,19 @@
 
+import json
+from django.http import JsonResponse
 from django.shortcuts import render
+from django.views.decorators.http import require_POST
 from django.shortcuts import get_object_or_404, redirect
 from movies.models import Movie
-from .utils import calculate_cart_total
-from .models import Order, Item
+from .services import place_order
+from .store import MAX_QUANTITY
+from .utils import apply_cart_operations, cart_contents
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 import random
 
 def index(request):
-    cart_total = 0
-    movies_in_cart = []
-    cart = request.session.get('cart', {})
-    movie_ids = list(cart.keys())
-    if (movie_ids != []):
-        movies_in_cart = Movie.objects.filter(id__in=movie_ids)
-        cart_total = calculate_cart_total(cart, movies_in_cart)
+    movies_in_cart, cart_total = cart_contents(request.cart)
 
     template_data = {}
     template_data['title'] = 'Cart'
@@ -25,26 +23,63 @@ def index(request):
 
 def add(request, id):
     get_object_or_404(Movie, id=id)
-    cart = request.session.get('cart', {})
-    cart[id] = request.POST['quantity']
-    request.session['cart'] = cart
+    try:
+        quantity = int(request.POST['quantity'])
+    except ValueError:
+        quantity = 0
+    if not 1 <= quantity <= MAX_QUANTITY:
+        messages.error(request, f'Please choose a quantity between 1 and {MAX_QUANTITY}.')
+        return redirect('movies.show', id=id)
+    try:
+        request.cart.set(id, quantity)
+    except ValueError as error:
+        messages.error(request, str(error))
+        return redirect('movies.show', id=id)
     return redirect('cart.index')
 
+@require_POST
+def batch(request):
+    """
+    Apply a JSON list of add/update/remove operations to the cart in one
+    request and return the updated cart
+    """
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        payload = None
+    if not isinstance(payload, dict):
+        return JsonResponse({'error': 'Expected a JSON object.'}, status=400)
+    try:
+        movies_in_cart, cart_total = apply_cart_operations(request.cart, payload.get('operations'))
+    except ValueError as error:
+        return JsonResponse({'error': str(error)}, status=400)
+
+    return JsonResponse({
+        'items': [
+            {
+                'id': movie.id,
+                'name': movie.name,
+                'price': movie.price,
+                'quantity': movie.quantity,
+                'subtotal': movie.subtotal,
+            }
+            for movie in movies_in_cart
+        ],
+        'count': sum(movie.quantity for movie in movies_in_cart),
+        'total': cart_total,
+    })
+
 def clear(request):
-    request.session['cart'] = {}
+    request.cart.clear()
     return redirect('cart.index')
 
 @login_required
 def checkout(request):
     """Show checkout form for location input"""
-    cart = request.session.get('cart', {})
-    movie_ids = list(cart.keys())
+    movies_in_cart, cart_total = cart_contents(request.cart)
 
-    if (movie_ids == []):
+    if (movies_in_cart == []):
         return redirect('cart.index')
-    
-    movies_in_cart = Movie.objects.filter(id__in=movie_ids)
-    cart_total = calculate_cart_total(cart, movies_in_cart)
 
     template_data = {}
     template_data['title'] = 'Checkout'
@@ -59,10 +94,7 @@ def purchase(request):
     if request.method != 'POST':
         return redirect('cart.checkout')
     
-    cart = request.session.get('cart', {})
-    movie_ids = list(cart.keys())
-
-    if (movie_ids == []):
+    if not request.cart:
         return redirect('cart.index')
     
     # Get location data from form
@@ -73,25 +105,10 @@ def purchase(request):
         messages.error(request, 'Please select your state.')
         return redirect('cart.checkout')
     
-    movies_in_cart = Movie.objects.filter(id__in=movie_ids)
-    cart_total = calculate_cart_total(cart, movies_in_cart)
-    
     # Create order with user-provided location
-    order = Order()
-    order.user = request.user
-    order.total = cart_total
-    order.state = state
-    order.save()
-
-    for movie in movies_in_cart:
-        item = Item()
-        item.movie = movie
-        item.price = movie.price
-        item.order = order
-        item.quantity = cart[str(movie.id)]
-        item.save()
+    order = place_order(request.user, request.cart, state)
 
-    request.session['cart'] = {}
+    request.cart.clear()
     messages.success(request, f'Purchase completed! Order #{order.id} from {city}, {state}')
     
     template_data = {}
@@ -0,0 +1,159 @@
+"""
+Serving static and media files with caching in mind.
+
+serve_file() answers conditional requests (ETag / Last-Modified -> 304)
+and byte ranges (206) itself. It hands the transfer to the front-end server
+with an X-Sendfile style header when ``settings.SENDFILE_HEADER`` is set.
+Otherwise it streams through FileResponse, which lets WSGI servers use
+zero-copy sendfile(). Under ASGI, where Django would read a sync iterator
+to the end before sending any of it, files and ranges stream from an async
+iterator that reads each chunk on a worker thread.
+
+Files whose names carry a content hash never change, so they are sent with
+a far-future, immutable Cache-Control. Everything else must be
+revalidated, which is cheap thanks to the validators.
+"""
+import mimetypes
+import os
+import re
+import stat
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'public, max-age=0, must-revalidate'
+
+# Names written by ManifestStaticFilesStorage, e.g. css/style.6f1d0e2a9b3c.css
+MANIFEST_HASHED_NAME = re.compile(r'\.[0-9a-f]{12}\.[^./]+$')
+
+RANGE_CHUNK_SIZE = 64 * 1024
+
+_BYTE_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+def file_etag(stat_result):
+    return f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+
+def parse_range(header, size):
+    """
+    Return ``(start, end)`` (inclusive) for a single-range Range header,
+    None to send the whole file, or raise ValueError if the range cannot be
+    satisfied
+    """
+    match = _BYTE_RANGE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        # Malformed and multi-part ranges are ignored, as RFC 9110 allows
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if start > end or start >= size:
+            raise ValueError('Range not satisfiable')
+    else:
+        # A suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError('Range not satisfiable')
+        start, end = max(size - length, 0), size - 1
+    return start, end
+
+def _range_applies(request, etag, last_modified):
+    """Honour If-Range: serve the range only if the validator still matches"""
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == int(last_modified)
+
+def _stream_range(path, start, length):
+    with open(path, 'rb') as file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(RANGE_CHUNK_SIZE, length))
+            if not chunk:
+                return
+            length -= len(chunk)
+            yield chunk
+
+async def _astream_range(path, start, length):
+    chunks = _stream_range(path, start, length)
+    # The file is all the generator touches, so any thread may read it
+    next_chunk = sync_to_async(next, thread_sensitive=False)
+    try:
+        while (chunk := await next_chunk(chunks, None)) is not None:
+            yield chunk
+    finally:
+        chunks.close()
+
+def serve_file(request, path, document_root, immutable=None):
+    """
+    Serve ``path`` from ``document_root``. ``immutable`` is a regex matching
+    the paths whose content never changes.
+    """
+    try:
+        full_path = safe_join(document_root, path)
+        stat_result = os.stat(full_path)
+    except (OSError, SuspiciousFileOperation):
+        raise Http404('File not found')
+    if not stat.S_ISREG(stat_result.st_mode):
+        raise Http404('File not found')
+
+    etag = file_etag(stat_result)
+    last_modified = stat_result.st_mtime
+    cache_control = (
+        IMMUTABLE_CACHE_CONTROL if immutable is not None and immutable.search(path) else REVALIDATE_CACHE_CONTROL
+    )
+    content_type, encoding = mimetypes.guess_type(full_path)
+    content_type = content_type or 'application/octet-stream'
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=int(last_modified))
+    if not_modified is not None:
+        if isinstance(not_modified, HttpResponseNotModified):
+            not_modified['Cache-Control'] = cache_control
+        return not_modified
+
+    sendfile_header = getattr(settings, 'SENDFILE_HEADER', None)
+    byte_range = None
+    if sendfile_header:
+        # The front-end server streams the file and handles ranges itself
+        response = HttpResponse(content_type=content_type)
+        if sendfile_header == 'X-Accel-Redirect':
+            response[sendfile_header] = settings.SENDFILE_URL_PREFIX + request.path
+        else:
+            response[sendfile_header] = full_path
+    else:
+        if 'Range' in request.headers and _range_applies(request, etag, last_modified):
+            try:
+                byte_range = parse_range(request.headers['Range'], stat_result.st_size)
+            except ValueError:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = f'bytes */{stat_result.st_size}'
+                return response
+        asynchronous = isinstance(request, ASGIRequest)
+        if byte_range is None and not asynchronous:
+            response = FileResponse(open(full_path, 'rb'), content_type=content_type)
+        else:
+            start, end = byte_range or (0, stat_result.st_size - 1)
+            stream = _astream_range if asynchronous else _stream_range
+            response = StreamingHttpResponse(
+                stream(full_path, start, end - start + 1), status=206 if byte_range else 200,
+                content_type=content_type,
+            )
+            if byte_range:
+                response['Content-Range'] = f'bytes {start}-{end}/{stat_result.st_size}'
+            response['Content-Length'] = end - start + 1
+        response['Accept-Ranges'] = 'bytes'
+
+    if encoding:
+        response['Content-Encoding'] = encoding
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = cache_control
+    return response
@@ -0,0 +1,326 @@
+"""
+Seed large synthetic datasets and time the main entry points of the store
+with the Django test client.
+
+Used by ``manage.py benchmark`` and by the benchmark tests in core/tests.py.
+"""
+import random
+import statistics
+import threading
+import time
+from contextlib import contextmanager
+from io import StringIO
+from datetime import timedelta
+from itertools import islice
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import OperationalError, connection, connections, transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+from cart.models import Order, Item
+from movies import search
+from movies.models import Movie, Petition, Rating
+from cart.services import place_order
+from movies.views import US_STATES, catalog_page
+
+DEFAULT_VOLUMES = {
+    'users': 10000,
+    'movies': 100000,
+    'ratings': 1000000,
+    'orders': 500000,
+    'petitions': 50000,
+    'votes': 250000,
+}
+
+# Titles are built from a small vocabulary so searches match many movies
+TITLE_WORDS = [
+    'Star', 'Night', 'Dream', 'River', 'Shadow', 'Empire', 'Silent', 'Storm', 'Golden', 'Last',
+    'City', 'Ghost', 'Winter', 'Fire', 'Lost', 'Wild', 'Iron', 'Blue', 'Secret', 'Heart',
+]
+
+SEARCH_TERM = 'night'
+
+# Small enough to seed in seconds; concurrency, not data size, is measured
+CONCURRENCY_VOLUMES = {
+    'users': 200,
+    'movies': 2000,
+    'ratings': 5000,
+    'orders': 5000,
+    'petitions': 100,
+    'votes': 500,
+}
+
+def _insert(model, objects, batch_size):
+    """bulk_create an iterable of objects in batches, returning their ids"""
+    objects = iter(objects)
+    ids = []
+    with transaction.atomic():
+        while True:
+            batch = list(islice(objects, batch_size))
+            if not batch:
+                return ids
+            ids += [obj.pk for obj in model.objects.bulk_create(batch)]
+
+def seed_dataset(volumes, batch_size=5000, seed=0, log=None):
+    """
+    Fill the database with synthetic users, movies, ratings, orders and
+    petitions. Denormalized data (rating counters, vote counts, the sales
+    rollup, the leaderboards and the search index) is rebuilt afterwards,
+    just as it would be after a bulk load in production.
+    """
+    rng = random.Random(seed)
+    log = log or (lambda message: None)
+    volumes = {**DEFAULT_VOLUMES, **volumes}
+
+    log(f"Seeding {volumes['users']} users")
+    user_ids = _insert(User, (
+        User(username=f'bench_user_{i}', password='!') for i in range(volumes['users'])
+    ), batch_size)
+
+    log(f"Seeding {volumes['movies']} movies")
+    movie_ids = _insert(Movie, (
+        Movie(
+            name=f'{rng.choice(TITLE_WORDS)} {rng.choice(TITLE_WORDS)} {i}',
+            price=rng.randint(5, 30),
+            description=' '.join(rng.choices(TITLE_WORDS, k=30)).lower(),
+            image='movie_images/benchmark.jpg',
+        )
+        for i in range(volumes['movies'])
+    ), batch_size)
+    prices = dict(Movie.objects.values_list('id', 'price'))
+
+    log(f"Seeding {volumes['ratings']} ratings")
+    ratings_per_user = min(len(movie_ids), -(-volumes['ratings'] // max(len(user_ids), 1)))
+
+    def ratings():
+        remaining = volumes['ratings']
+        for user_id in user_ids:
+            for movie_id in rng.sample(movie_ids, min(ratings_per_user, remaining)):
+                yield Rating(movie_id=movie_id, user_id=user_id, stars=rng.randint(1, 5))
+            remaining -= ratings_per_user
+            if remaining <= 0:
+                return
+    _insert(Rating, ratings(), batch_size)
+
+    log(f"Seeding {volumes['orders']} orders")
+    basket_sizes = [rng.randint(1, 3) for _ in range(volumes['orders'])]
+    baskets = [rng.sample(movie_ids, min(size, len(movie_ids))) for size in basket_sizes]
+    quantities = [[rng.randint(1, 3) for _ in basket] for basket in baskets]
+    order_ids = _insert(Order, (
+        Order(
+            user_id=user_ids[i % len(user_ids)],
+            state=rng.choice(US_STATES),
+            total=sum(prices[movie_id] * quantity for movie_id, quantity in zip(basket, quantities[i])),
+        )
+        for i, basket in enumerate(baskets)
+    ), batch_size)
+    _insert(Item, (
+        Item(order_id=order_id, movie_id=movie_id, price=prices[movie_id], quantity=quantity)
+        for order_id, basket, basket_quantities in zip(order_ids, baskets, quantities)
+        for movie_id, quantity in zip(basket, basket_quantities)
+    ), batch_size)
+
+    # auto_now_add stamps every order with the current time; spread them over
+    # the last year in contiguous id ranges, one UPDATE per day
+    now = timezone.now()
+    with transaction.atomic():
+        for day in range(365):
+            first = day * len(order_ids) // 365
+            last = (day + 1) * len(order_ids) // 365
+            if first < last:
+                Order.objects.filter(id__gte=order_ids[first], id__lte=order_ids[last - 1]).update(
+                    date=now - timedelta(days=364 - day)
+                )
+
+    log(f"Seeding {volumes['petitions']} petitions with {volumes['votes']} votes")
+    petition_ids = _insert(Petition, (
+        Petition(
+            movie_title=f'{rng.choice(TITLE_WORDS)} {rng.choice(TITLE_WORDS)}',
+            description='Please add this movie.',
+            created_by_id=rng.choice(user_ids),
+        )
+        for _ in range(volumes['petitions'])
+    ), batch_size)
+    votes_per_petition = min(len(user_ids), -(-volumes['votes'] // max(len(petition_ids), 1)))
+    Vote = Petition.votes.through
+    _insert(Vote, (
+        Vote(petition_id=petition_id, user_id=user_id)
+        for petition_id in petition_ids
+        for user_id in rng.sample(user_ids, votes_per_petition)
+    ), batch_size)
+
+    log('Rebuilding denormalized data')
+    votes = Vote.objects.filter(petition_id=OuterRef('id')).values('petition_id').annotate(total=Count('id')).values('total')
+    Petition.objects.update(vote_count=Coalesce(Subquery(votes), 0))
+    call_command('reconcile_ratings', stdout=StringIO())
+    call_command('rebuild_sales_rollup', stdout=StringIO())
+    call_command('rebuild_leaderboards', stdout=StringIO())
+    if search.fts_enabled():
+        search.rebuild_index()
+
+@contextmanager
+def count_queries():
+    """Count the queries run on the default database inside the block"""
+    counter = {'queries': 0}
+
+    def wrapper(execute, sql, params, many, context):
+        counter['queries'] += 1
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(wrapper):
+        yield counter
+
+def percentile(samples, percent):
+    if len(samples) == 1:
+        return samples[0]
+    return statistics.quantiles(samples, n=100, method='inclusive')[percent - 1]
+
+def entry_points(client):
+    """
+    Yield ``(name, request, prepare)`` triples where ``request()`` performs
+    one request with ``client`` and ``prepare``, if set, is called untimed
+    before every request.
+    """
+    # Seeded, so every run requests the same movies and runs can be compared
+    rng = random.Random(0)
+    all_ids = list(Movie.objects.order_by('id').values_list('id', flat=True))
+    movie_ids = rng.sample(all_ids, min(len(all_ids), 50))
+
+    yield 'movies.index', lambda: client.get(reverse('movies.index')), None
+    yield 'movies.index search', lambda: client.get(reverse('movies.index'), {'search': SEARCH_TERM}), None
+    yield 'movies.show', lambda: client.get(reverse('movies.show', args=[rng.choice(movie_ids)])), None
+    yield 'movies.petitions', lambda: client.get(reverse('movies.petitions')), None
+    yield 'movies.trending_movies_api', lambda: client.get(reverse('movies.trending_movies_api')), None
+    yield 'accounts.orders', lambda: client.get(reverse('accounts.orders')), None
+
+    def fill_cart():
+        for movie_id in rng.sample(movie_ids, 3):
+            client.post(reverse('cart.add', args=[movie_id]), {'quantity': '1'})
+
+    def purchase():
+        return client.post(reverse('cart.purchase'), {'state': rng.choice(US_STATES), 'city': 'Benchmark'})
+    yield 'cart.purchase', purchase, fill_cart
+
+def run_benchmarks(iterations, user=None, log=None):
+    """Time every entry point and return their latency percentiles and query counts"""
+    log = log or (lambda message: None)
+    client = Client()
+    user = user or User.objects.filter(order__isnull=False).order_by('id').first()
+    client.force_login(user)
+
+    results = {}
+    for name, request, prepare in entry_points(client):
+        prepare = prepare or (lambda: None)
+        # One untimed request warms up template loading and connections
+        prepare()
+        request()
+        latencies = []
+        queries = []
+        for _ in range(iterations):
+            prepare()
+            with count_queries() as counter:
+                start = time.perf_counter()
+                response = request()
+                latencies.append((time.perf_counter() - start) * 1000)
+            if response.status_code >= 400:
+                raise RuntimeError(f'{name} returned HTTP {response.status_code}')
+            queries.append(counter['queries'])
+
+        results[name] = {
+            'p50_ms': round(percentile(latencies, 50), 3),
+            'p90_ms': round(percentile(latencies, 90), 3),
+            'p99_ms': round(percentile(latencies, 99), 3),
+            'mean_ms': round(statistics.fmean(latencies), 3),
+            'queries': max(queries),
+        }
+        log(f"{name}: p50 {results[name]['p50_ms']} ms, p99 {results[name]['p99_ms']} ms, "
+            f"{results[name]['queries']} queries")
+    return results
+
+def compare_results(results, baseline, tolerance):
+    """
+    Return a description of every entry point that got slower than the
+    baseline p50 by more than ``tolerance`` or runs more queries.
+    """
+    regressions = []
+    for name, base in baseline.items():
+        current = results.get(name)
+        if current is None:
+            continue
+        if current['p50_ms'] > base['p50_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p50 {current['p50_ms']} ms vs baseline {base['p50_ms']} ms")
+        if current['queries'] > base['queries']:
+            regressions.append(f"{name}: {current['queries']} queries vs baseline {base['queries']}")
+    return regressions
+
+def run_concurrency_benchmark(duration, readers, writers, seed=0):
+    """
+    Place orders from ``writers`` threads in a tight loop while ``readers``
+    threads load catalog pages and order histories, for ``duration``
+    seconds. Every thread uses its own database connection.
+
+    Returns read latency percentiles, write throughput and the number of
+    operations that failed because the database was locked.
+    """
+    rng = random.Random(seed)
+    users = list(User.objects.filter(username__startswith='bench_user_').order_by('id')[:readers + writers])
+    movie_ids = list(Movie.objects.order_by('id').values_list('id', flat=True)[:500])
+    lock = threading.Lock()
+    reads, writes = [], []
+    errors = {'read': 0, 'write': 0}
+    start_barrier = threading.Barrier(readers + writers + 1)
+    stop = [0.0]
+
+    def run(operation, kind, samples, user):
+        # Open the connection before the clock starts
+        connection.ensure_connection()
+        start_barrier.wait()
+        try:
+            while time.monotonic() < stop[0]:
+                start = time.perf_counter()
+                try:
+                    operation(user)
+                except OperationalError:
+                    with lock:
+                        errors[kind] += 1
+                    continue
+                samples.append((time.perf_counter() - start) * 1000)
+        finally:
+            connections.close_all()
+
+    def read(user):
+        catalog_page('', None)
+        list(Order.objects.filter(user=user).order_by('-date', '-id')[:10])
+
+    def write(user):
+        with lock:
+            cart = {movie_id: rng.randint(1, 3) for movie_id in rng.sample(movie_ids, 3)}
+            state = rng.choice(US_STATES)
+        place_order(user, cart, state)
+
+    threads = [
+        threading.Thread(target=run, args=(read, 'read', reads, users[i % len(users)]))
+        for i in range(readers)
+    ] + [
+        threading.Thread(target=run, args=(write, 'write', writes, users[(readers + i) % len(users)]))
+        for i in range(writers)
+    ]
+    for thread in threads:
+        thread.start()
+    stop[0] = time.monotonic() + duration
+    start_barrier.wait()
+    for thread in threads:
+        thread.join()
+
+    result = {'reads': len(reads), 'writes': len(writes), 'read_errors': errors['read'], 'write_errors': errors['write']}
+    result['reads_per_s'] = round(len(reads) / duration, 1)
+    result['writes_per_s'] = round(len(writes) / duration, 1)
+    for name, samples in (('read', reads), ('write', writes)):
+        if samples:
+            result[f'{name}_p50_ms'] = round(percentile(samples, 50), 3)
+            result[f'{name}_p99_ms'] = round(percentile(samples, 99), 3)
+            result[f'{name}_max_ms'] = round(max(samples), 3)
+    return result
@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.core import checks
+
+@checks.register(checks.Tags.caches)
+def check_api_cache_is_shared(app_configs, **kwargs):
+    """The cache versions behind the ETags must be seen by every worker process"""
+    backend = settings.CACHES[settings.API_CACHE_ALIAS]['BACKEND']
+    if settings.WEB_WORKERS > 1 and backend == 'django.core.cache.backends.locmem.LocMemCache':
+        return [checks.Error(
+            f'The {settings.API_CACHE_ALIAS!r} cache is local to each process, but WEB_CONCURRENCY runs '
+            f'{settings.WEB_WORKERS} workers: a write in one worker would not invalidate the others.',
+            hint='Use a shared backend, e.g. MOVIESSTORE_API_CACHE=file.',
+            id='core.E001',
+        )]
+    return []
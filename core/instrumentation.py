@@ -0,0 +1,241 @@
+"""
+Per-request performance instrumentation.
+
+InstrumentationMiddleware measures every request: latency, the number and
+duration of database queries, template render time and SQL statements run
+more than once (the usual sign of an N+1 query). Measurements are
+aggregated per URL name in an in-process registry that the staff-only
+``core.metrics`` endpoint serves as JSON.
+
+Queries are observed by timing every cursor execution instead of reading
+the DEBUG query log, so the overhead stays low in production. They are
+credited to the request in a context variable, which sync_to_async carries
+to the threads that run the ORM under ASGI, where the per-thread
+connections of the middleware's own thread never see them.
+"""
+import bisect
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.utils import CursorWrapper
+from django.template.backends.django import Template
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (ms) of the latency histogram buckets; the last one is open
+LATENCY_BUCKETS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+
+# Duplicated statements remembered per URL name
+MAX_FINGERPRINTS = 20
+
+_IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+_WHITESPACE = re.compile(r'\s+')
+
+_current_request = ContextVar('instrumented_request', default=None)
+
+def fingerprint(sql):
+    """Normalize a parameterized statement so variants of it compare equal"""
+    return _WHITESPACE.sub(' ', _IN_LIST.sub('IN (...)', sql)).strip()
+
+class RequestMetrics:
+    """Measurements collected while a single request is handled"""
+
+    def __init__(self):
+        self.query_count = 0
+        self.query_time = 0.0
+        self.template_time = 0.0
+        # Raw SQL -> [executions, total seconds]
+        self.statements = {}
+
+    def record_query(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.query_count += 1
+            self.query_time += elapsed
+            statement = self.statements.setdefault(sql, [0, 0.0])
+            statement[0] += 1
+            statement[1] += elapsed
+
+    def duplicates(self):
+        """Return a Counter of statements run more than once, by fingerprint"""
+        counts = Counter()
+        for sql, (executions, _) in self.statements.items():
+            counts[fingerprint(sql)] += executions
+        return Counter({sql: count for sql, count in counts.items() if count > 1})
+
+    def slowest_statements(self, limit=5):
+        ranked = sorted(self.statements.items(), key=lambda item: item[1][1], reverse=True)
+        return [
+            {'sql': fingerprint(sql), 'executions': executions, 'time_ms': round(total * 1000, 3)}
+            for sql, (executions, total) in ranked[:limit]
+        ]
+
+class MetricsRegistry:
+    """Thread-safe aggregate of request measurements per URL name"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def record(self, name, duration, metrics):
+        duplicates = metrics.duplicates()
+        with self._lock:
+            view = self._views.get(name)
+            if view is None:
+                view = self._views[name] = {
+                    'requests': 0,
+                    'total_ms': 0.0,
+                    'max_ms': 0.0,
+                    'histogram': [0] * (len(LATENCY_BUCKETS) + 1),
+                    'queries': 0,
+                    'max_queries': 0,
+                    'query_ms': 0.0,
+                    'template_ms': 0.0,
+                    'duplicates': Counter(),
+                }
+            duration_ms = duration * 1000
+            view['requests'] += 1
+            view['total_ms'] += duration_ms
+            view['max_ms'] = max(view['max_ms'], duration_ms)
+            view['histogram'][bisect.bisect_left(LATENCY_BUCKETS, duration_ms)] += 1
+            view['queries'] += metrics.query_count
+            view['max_queries'] = max(view['max_queries'], metrics.query_count)
+            view['query_ms'] += metrics.query_time * 1000
+            view['template_ms'] += metrics.template_time * 1000
+            if duplicates:
+                view['duplicates'].update(duplicates)
+                if len(view['duplicates']) > MAX_FINGERPRINTS:
+                    view['duplicates'] = Counter(dict(view['duplicates'].most_common(MAX_FINGERPRINTS)))
+
+    def snapshot(self):
+        with self._lock:
+            views = {}
+            for name, view in self._views.items():
+                requests = view['requests']
+                views[name] = {
+                    'requests': requests,
+                    'mean_ms': round(view['total_ms'] / requests, 3),
+                    'max_ms': round(view['max_ms'], 3),
+                    'histogram': {
+                        (f'<={bound}ms' if bound is not None else f'>{LATENCY_BUCKETS[-1]}ms'): count
+                        for bound, count in zip(LATENCY_BUCKETS + [None], view['histogram'])
+                    },
+                    'mean_queries': round(view['queries'] / requests, 2),
+                    'max_queries': view['max_queries'],
+                    'mean_query_ms': round(view['query_ms'] / requests, 3),
+                    'mean_template_ms': round(view['template_ms'] / requests, 3),
+                    'duplicated_sql': [
+                        {'sql': sql, 'executions': count} for sql, count in view['duplicates'].most_common()
+                    ],
+                }
+            return views
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+registry = MetricsRegistry()
+
+_original_render = Template.render
+
+def _timed_render(self, context=None, request=None):
+    metrics = _current_request.get()
+    if metrics is None:
+        return _original_render(self, context, request)
+    start = time.perf_counter()
+    try:
+        return _original_render(self, context, request)
+    finally:
+        metrics.template_time += time.perf_counter() - start
+
+def install_template_timer():
+    """Time top-level template renders; included templates count towards their parent"""
+    Template.render = _timed_render
+
+_original_execute = CursorWrapper._execute_with_wrappers
+
+def _observed_execute(self, sql, params, many, executor):
+    metrics = _current_request.get()
+    if metrics is None:
+        return _original_execute(self, sql, params, many, executor)
+    return metrics.record_query(
+        lambda sql, params, many, context: _original_execute(self, sql, params, many, executor),
+        sql, params, many, {'connection': self.db, 'cursor': self},
+    )
+
+def install_query_observer():
+    """Credit the queries of every connection, on any thread, to the request being handled"""
+    CursorWrapper._execute_with_wrappers = _observed_execute
+
+class InstrumentationMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'INSTRUMENTATION_ENABLED', True)
+        self.server_timing = getattr(settings, 'INSTRUMENTATION_SERVER_TIMING', True)
+        self.slow_request_ms = getattr(settings, 'INSTRUMENTATION_SLOW_REQUEST_MS', None)
+        if self.enabled:
+            install_template_timer()
+            install_query_observer()
+        # Stay async under ASGI so async views are not pushed onto a thread
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not self.enabled:
+            return self.get_response(request)
+
+        metrics = RequestMetrics()
+        token = _current_request.set(metrics)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_request.reset(token)
+        return self.finish(request, response, metrics, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+
+        metrics = RequestMetrics()
+        token = _current_request.set(metrics)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_request.reset(token)
+        return self.finish(request, response, metrics, time.perf_counter() - start)
+
+    def finish(self, request, response, metrics, duration):
+        match = request.resolver_match
+        name = (match.view_name or match._func_path) if match else '<unresolved>'
+        registry.record(name, duration, metrics)
+
+        if self.server_timing:
+            response['Server-Timing'] = (
+                f'db;dur={metrics.query_time * 1000:.2f};desc="{metrics.query_count} queries", '
+                f'tpl;dur={metrics.template_time * 1000:.2f}, '
+                f'total;dur={duration * 1000:.2f}'
+            )
+
+        if self.slow_request_ms is not None and duration * 1000 >= self.slow_request_ms:
+            logger.warning(
+                'Slow request %s %s (%s): %.1f ms, %d queries in %.1f ms; top statements: %s',
+                request.method, request.path, name, duration * 1000, metrics.query_count,
+                metrics.query_time * 1000, metrics.slowest_statements(),
+            )
+        return response
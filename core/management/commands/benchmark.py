@@ -0,0 +1,70 @@
+import json
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+from django.utils import timezone
+from core.benchmark import DEFAULT_VOLUMES, compare_results, run_benchmarks, seed_dataset
+from movies.models import Movie
+
+class Command(BaseCommand):
+    help = (
+        'Seed a separate benchmark database with synthetic data, time the main '
+        'entry points and compare the results with a stored baseline'
+    )
+
+    def add_arguments(self, parser):
+        for name, default in DEFAULT_VOLUMES.items():
+            parser.add_argument(f'--{name}', type=int, default=default, help=f'Number of {name} to seed (default {default})')
+        parser.add_argument('--iterations', type=int, default=20, help='Timed requests per entry point')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for the synthetic data')
+        parser.add_argument('--database-name', help='File for the benchmark database (in memory by default)')
+        parser.add_argument('--keepdb', action='store_true', help='Keep and reuse an already seeded benchmark database')
+        parser.add_argument('--cache', action='store_true', help='Leave the caches enabled instead of timing the database work')
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+        parser.add_argument('--baseline', help='Compare the results with this JSON file')
+        parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed p50 slowdown over the baseline (default 0.2)')
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError('--iterations must be at least 1.')
+        volumes = {name: options[name] for name in DEFAULT_VOLUMES}
+
+        if options['database_name']:
+            connection.settings_dict['TEST']['NAME'] = options['database_name']
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+
+        overrides = {'DEBUG': False, 'ALLOWED_HOSTS': ['*']}
+        if not options['cache']:
+            overrides['CACHES'] = {
+                alias: {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'} for alias in settings.CACHES
+            }
+        try:
+            with override_settings(**overrides):
+                if not Movie.objects.exists():
+                    seed_dataset(volumes, options['batch_size'], options['seed'], log=self.stdout.write)
+                results = run_benchmarks(options['iterations'], log=self.stdout.write)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+
+        report = {
+            'timestamp': timezone.now().isoformat(),
+            'volumes': volumes,
+            'iterations': options['iterations'],
+            'cache': options['cache'],
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+        if options['baseline']:
+            with open(options['baseline']) as baseline:
+                regressions = compare_results(results, json.load(baseline)['results'], options['tolerance'])
+            if regressions:
+                for regression in regressions:
+                    self.stdout.write(self.style.ERROR(regression))
+                raise CommandError(f'{len(regressions)} regressions against the baseline.')
+            self.stdout.write(self.style.SUCCESS('No regressions against the baseline.'))
@@ -0,0 +1,69 @@
+import json
+import os
+import shutil
+import tempfile
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import override_settings
+from core.benchmark import CONCURRENCY_VOLUMES, run_concurrency_benchmark, seed_dataset
+
+class Command(BaseCommand):
+    help = (
+        'Seed a file-backed benchmark database, then measure read latency while '
+        'concurrent checkouts write to it, once for every SQLite pragma profile'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--profile', action='append', dest='profiles', choices=sorted(settings.SQLITE_PROFILES),
+            help='Pragma profile from settings.SQLITE_PROFILES to measure (repeatable, default all)',
+        )
+        parser.add_argument('--duration', type=float, default=5.0, help='Seconds to run each profile')
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--writers', type=int, default=4)
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('The concurrency benchmark measures SQLite pragma profiles.')
+        if options['readers'] < 1 or options['writers'] < 1:
+            raise CommandError('--readers and --writers must be at least 1.')
+        profiles = options['profiles'] or sorted(settings.SQLITE_PROFILES)
+
+        # Journal modes only matter for a database file, not an in-memory one
+        directory = tempfile.mkdtemp(prefix='moviesstore-concurrency-')
+        connection.settings_dict['TEST']['NAME'] = os.path.join(directory, 'benchmark.sqlite3')
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        results = {}
+        try:
+            with override_settings(DEBUG=False):
+                seed_dataset(CONCURRENCY_VOLUMES, log=self.stdout.write)
+                for profile in profiles:
+                    # Reconnect so the profile's pragmas are applied
+                    connections.close_all()
+                    with override_settings(SQLITE_PRAGMAS=settings.SQLITE_PROFILES[profile]):
+                        connection.ensure_connection()
+                        results[profile] = run_concurrency_benchmark(
+                            options['duration'], options['readers'], options['writers']
+                        )
+                    connections.close_all()
+                    self.report(profile, results[profile])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            shutil.rmtree(directory, ignore_errors=True)
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump({'readers': options['readers'], 'writers': options['writers'],
+                           'duration': options['duration'], 'results': results}, output, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+    def report(self, profile, result):
+        self.stdout.write(
+            f"{profile}: {result['reads_per_s']} reads/s "
+            f"(p50 {result.get('read_p50_ms')} ms, p99 {result.get('read_p99_ms')} ms, "
+            f"max {result.get('read_max_ms')} ms, {result['read_errors']} locked), "
+            f"{result['writes_per_s']} orders/s "
+            f"(p50 {result.get('write_p50_ms')} ms, {result['write_errors']} locked)"
+        )
@@ -0,0 +1,78 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from core.queryplans import explain, full_scans, is_read_query
+from movies.models import Movie
+
+class Command(BaseCommand):
+    help = 'Run EXPLAIN QUERY PLAN on the queries of the main views and fail if any does a full table scan'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--username',
+            help='User to log in as for pages that need an account (defaults to the first user)',
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Query plans can only be checked on SQLite.')
+
+        pages = [
+            ('movies.index', [], {}),
+            ('movies.index', [], {'search': 'the'}),
+            ('movies.page', [], {}),
+            ('movies.typeahead', [], {'q': 'the'}),
+            ('movies.petitions', [], {}),
+            ('movies.trending_movies_api', [], {}),
+            ('cart.index', [], {}),
+            ('accounts.orders', [], {}),
+        ]
+        movie_id = Movie.objects.order_by('id').values_list('id', flat=True).first()
+        if movie_id is not None:
+            pages += [
+                ('movies.show', [movie_id], {}),
+                ('movies.reviews', [movie_id], {}),
+            ]
+
+        if options['username']:
+            user = User.objects.get(username=options['username'])
+        else:
+            user = User.objects.order_by('id').first()
+
+        # Bypass the caches so every view actually reaches the database
+        dummy_caches = {alias: {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'} for alias in settings.CACHES}
+        client = Client()
+        failures = 0
+        with override_settings(CACHES=dummy_caches, ALLOWED_HOSTS=['*']):
+            if user is not None:
+                client.force_login(user)
+            for name, url_args, params in pages:
+                with CaptureQueriesContext(connection) as queries:
+                    client.get(reverse(name, args=url_args), params)
+                failures += self.check_queries(name, params, queries.captured_queries, options['verbosity'])
+            client.logout()
+
+        if failures:
+            raise CommandError(f'{failures} queries do a full table scan.')
+        self.stdout.write(self.style.SUCCESS('No full table scans found.'))
+
+    def check_queries(self, name, params, queries, verbosity):
+        label = name + (f' {params}' if params else '')
+        reads = [query['sql'] for query in queries if is_read_query(query['sql'])]
+        self.stdout.write(f'{label}: {len(reads)} queries')
+
+        failures = 0
+        for sql in reads:
+            plan = explain(sql)
+            scans = full_scans(plan, sql)
+            if scans:
+                failures += 1
+                self.stdout.write(self.style.ERROR(f'  Full scan: {sql}'))
+            if scans or verbosity > 1:
+                for step in plan:
+                    self.stdout.write(f'    {step}')
+        return failures
@@ -0,0 +1,133 @@
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from core.benchmark import percentile
+
+DEFAULT_PATHS = [
+    '/movies/api/trending-movies/',
+    '/movies/page/',
+    '/movies/search/?q=night',
+]
+
+# Servers started by --spawn: name -> (command, port)
+SERVERS = {
+    'wsgi': (['gunicorn', '--workers', '1', '--threads', '{concurrency}', '--bind', '127.0.0.1:{port}',
+              'moviesstore.wsgi:application'], 8101),
+    'asgi': (['uvicorn', '--workers', '1', '--host', '127.0.0.1', '--port', '{port}',
+              'moviesstore.asgi:application'], 8102),
+}
+
+class Command(BaseCommand):
+    help = (
+        'Fire concurrent requests at one or more running servers and report '
+        'throughput and latency percentiles, e.g. to compare the WSGI and ASGI '
+        'deployments of the read endpoints'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--target', action='append', default=[], metavar='NAME=URL',
+            help='Server to load, e.g. wsgi=http://127.0.0.1:8000 (repeatable)',
+        )
+        parser.add_argument(
+            '--spawn', action='store_true',
+            help='Start gunicorn (wsgi) and uvicorn (asgi) against this project and load both',
+        )
+        parser.add_argument('--path', action='append', dest='paths', help='Path to request (repeatable)')
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per target')
+        parser.add_argument('--timeout', type=float, default=10.0)
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1 or options['requests'] < 1:
+            raise CommandError('--concurrency and --requests must be at least 1.')
+        targets = {}
+        for target in options['target']:
+            name, sep, url = target.partition('=')
+            if not sep or not url.startswith(('http://', 'https://')):
+                raise CommandError(f'Invalid --target {target!r}, expected NAME=URL.')
+            targets[name] = url.rstrip('/')
+
+        processes = []
+        try:
+            if options['spawn']:
+                for name, url, process in self.spawn(options['concurrency']):
+                    processes.append(process)
+                    targets.setdefault(name, url)
+            if not targets:
+                raise CommandError('Give at least one --target or use --spawn.')
+
+            paths = options['paths'] or DEFAULT_PATHS
+            for name, url in targets.items():
+                result = self.load(url, paths, options['concurrency'], options['requests'], options['timeout'])
+                self.stdout.write(
+                    f"{name}: {result['throughput']:.1f} req/s, p50 {result['p50_ms']:.1f} ms, "
+                    f"p90 {result['p90_ms']:.1f} ms, p99 {result['p99_ms']:.1f} ms, "
+                    f"mean {result['mean_ms']:.1f} ms, {result['errors']} errors"
+                )
+        finally:
+            for process in processes:
+                process.terminate()
+                process.wait()
+
+    def spawn(self, concurrency):
+        for name, (command, port) in SERVERS.items():
+            if shutil.which(command[0]) is None:
+                raise CommandError(f'{command[0]} is not installed; install it or pass --target instead.')
+            command = [part.format(port=port, concurrency=concurrency) for part in command]
+            process = subprocess.Popen(command, cwd=settings.BASE_DIR, stdout=subprocess.DEVNULL, stderr=sys.stderr)
+            url = f'http://127.0.0.1:{port}'
+            self.wait_until_up(url, process)
+            yield name, url, process
+
+    def wait_until_up(self, url, process, timeout=15):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise CommandError(f'Server for {url} exited with status {process.returncode}.')
+            try:
+                urllib.request.urlopen(url + DEFAULT_PATHS[0], timeout=1).read()
+                return
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.2)
+        process.terminate()
+        raise CommandError(f'Server for {url} did not start within {timeout} seconds.')
+
+    def load(self, url, paths, concurrency, requests, timeout):
+        def fetch(i):
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(url + paths[i % len(paths)], timeout=timeout) as response:
+                    response.read()
+                    ok = response.status < 400
+            except (urllib.error.URLError, ConnectionError, TimeoutError):
+                ok = False
+            return (time.perf_counter() - start) * 1000, ok
+
+        # Warm up every path before timing
+        for i in range(len(paths)):
+            fetch(i)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            samples = list(executor.map(fetch, range(requests)))
+        elapsed = time.perf_counter() - start
+
+        latencies = [latency for latency, ok in samples if ok]
+        if not latencies:
+            raise CommandError(f'Every request to {url} failed.')
+        return {
+            'throughput': len(latencies) / elapsed,
+            'p50_ms': percentile(latencies, 50),
+            'p90_ms': percentile(latencies, 90),
+            'p99_ms': percentile(latencies, 99),
+            'mean_ms': statistics.fmean(latencies),
+            'errors': len(samples) - len(latencies),
+        }
@@ -0,0 +1,30 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from core.routers import replica_alias
+from core.sqlite import copy_database
+
+class Command(BaseCommand):
+    help = 'Copy the primary SQLite database into the read replica, once or every --interval seconds'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, help='Keep copying, waiting this many seconds between copies')
+        parser.add_argument(
+            '--pages', type=int, default=-1,
+            help='Pages copied per step; smaller steps hold the replica lock for less time (default all)',
+        )
+
+    def handle(self, *args, **options):
+        alias = replica_alias()
+        if alias is None:
+            raise CommandError('No replica database is configured; set MOVIESSTORE_REPLICA_DB.')
+        while True:
+            start = time.perf_counter()
+            try:
+                copy_database(connections[DEFAULT_DB_ALIAS], connections[alias], options['pages'])
+            except ValueError as error:
+                raise CommandError(error)
+            self.stdout.write(f'Replica {alias} synced in {(time.perf_counter() - start) * 1000:.1f} ms')
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
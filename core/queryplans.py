@@ -0,0 +1,34 @@
+"""
+Helpers to run EXPLAIN QUERY PLAN over the queries a view executes and spot
+full table scans. SQLite only.
+"""
+import re
+from django.db import connection
+
+# A SCAN step reads a whole table or index. It is fine over an FTS virtual
+# table, a subquery or the schema catalog
+ALLOWED_SCAN = re.compile(r'VIRTUAL TABLE|^SCAN \(|^SCAN CONSTANT ROW|^SCAN sqlite_master')
+
+# Walking a table in index order is fine for a query that filters nothing,
+# an ordered listing stopping at its LIMIT; with a WHERE clause it reads
+# every entry the filter could not use the index to skip
+INDEX_SCAN = re.compile(r'USING (COVERING )?INDEX|USING INTEGER PRIMARY KEY')
+
+WHERE = re.compile(r'\bWHERE\b', re.IGNORECASE)
+
+def explain(sql):
+    """Return the detail column of every step of the query plan of ``sql``"""
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+        return [row[-1] for row in cursor.fetchall()]
+
+def full_scans(plan, sql):
+    """Return the steps of ``plan``, the query plan of ``sql``, that read every row of a table"""
+    filtered = WHERE.search(sql)
+    return [
+        step for step in plan
+        if step.startswith('SCAN ') and not ALLOWED_SCAN.search(step) and (filtered or not INDEX_SCAN.search(step))
+    ]
+
+def is_read_query(sql):
+    return sql.lstrip().upper().startswith(('SELECT', 'WITH'))
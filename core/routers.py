@@ -0,0 +1,127 @@
+"""
+Primary/replica database routing.
+
+Writes always go to the primary (``default``) database. Reads made while a
+request is handled go to the replica named by
+``settings.DATABASE_REPLICA_ALIAS`` when one is configured, except:
+
+- inside a transaction, so read-modify-write code sees its own writes;
+- during unsafe (POST, ...) requests;
+- for a client that wrote something in the last
+  ``settings.REPLICA_STICKY_SECONDS``, so e.g. the order history shown
+  right after a purchase includes it (read-your-writes).
+
+Reads outside a request (management commands, shell) stay on the primary,
+and so do reads inside ``primary_reads()``: whatever is cached under a
+version stamp a write just bumped must be built from the primary, or the
+replica's stale rows would stay cached under the new version until the
+next write.
+Stickiness is tracked with a cookie set by ReplicaRoutingMiddleware, so it
+holds across processes.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+STICKY_COOKIE_NAME = 'primary_until'
+
+_request_state = ContextVar('replica_routing', default=None)
+
+_primary_reads = ContextVar('primary_reads', default=False)
+
+def replica_alias():
+    """Return the configured replica alias, or None without a replica"""
+    alias = getattr(settings, 'DATABASE_REPLICA_ALIAS', None)
+    return alias if alias in connections else None
+
+@contextmanager
+def primary_reads():
+    """Send the reads made inside the block to the primary, in sync and async code alike"""
+    token = _primary_reads.set(True)
+    try:
+        yield
+    finally:
+        _primary_reads.reset(token)
+
+class RoutingState:
+    def __init__(self, use_replica):
+        self.use_replica = use_replica
+        self.wrote = False
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _request_state.get()
+        if state is None or not state.use_replica or _primary_reads.get():
+            return DEFAULT_DB_ALIAS
+        alias = replica_alias()
+        if alias is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None:
+            state.wrote = True
+            # Later reads in the same request must see the write too
+            state.use_replica = False
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica is a copy of the primary, so objects from either relate
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas are copied from the primary, never migrated themselves
+        return db == DEFAULT_DB_ALIAS
+
+class ReplicaRoutingMiddleware:
+    """Decide per request whether reads may use the replica and keep writers on the primary"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        state = self.start(request)
+        token = _request_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_state.reset(token)
+        return self.finish(response, state)
+
+    async def __acall__(self, request):
+        state = self.start(request)
+        token = _request_state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_state.reset(token)
+        return self.finish(response, state)
+
+    def start(self, request):
+        try:
+            sticky_until = float(request.COOKIES.get(STICKY_COOKIE_NAME, 0))
+        except ValueError:
+            sticky_until = 0
+        use_replica = request.method in ('GET', 'HEAD', 'OPTIONS') and sticky_until < time.time()
+        return RoutingState(use_replica)
+
+    def finish(self, response, state):
+        if state.wrote and replica_alias() is not None:
+            seconds = settings.REPLICA_STICKY_SECONDS
+            response.set_cookie(
+                STICKY_COOKIE_NAME, str(int(time.time() + seconds)), max_age=seconds,
+                httponly=True, samesite='Lax',
+            )
+        return response
@@ -0,0 +1,57 @@
+"""
+SQLite connection tuning.
+
+Every new SQLite connection is configured with the pragmas in
+``settings.SQLITE_PRAGMAS`` (see the profiles in settings.py). With the
+``concurrent`` profile the database runs in write-ahead-log mode, so
+readers keep reading the last committed state while a purchase is being
+written instead of waiting for the write lock. The journal mode of the
+databases in ``settings.SQLITE_KEEP_JOURNAL_MODE`` is left as it is.
+"""
+import re
+from django.conf import settings
+
+# journal_mode has to be switched before the other pragmas take effect
+PRAGMA_ORDER = ['journal_mode']
+
+_NAME = re.compile(r'^[a-z_]+$')
+_VALUE = re.compile(r'^(-?\d+|[a-z]+)$', re.IGNORECASE)
+
+def pragma_statements(pragmas):
+    """Return the PRAGMA statements for a mapping of pragma names to values"""
+    names = sorted(pragmas, key=lambda name: (name not in PRAGMA_ORDER, name))
+    statements = []
+    for name in names:
+        value = str(pragmas[name])
+        if not _NAME.match(name) or not _VALUE.match(value):
+            raise ValueError(f'Invalid SQLite pragma {name}={value}')
+        statements.append(f'PRAGMA {name} = {value}')
+    return statements
+
+def configure_connection(sender, connection, **kwargs):
+    """connection_created receiver applying settings.SQLITE_PRAGMAS"""
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+    if str(connection.settings_dict['NAME']) in getattr(settings, 'SQLITE_KEEP_JOURNAL_MODE', []):
+        pragmas = {name: value for name, value in pragmas.items() if name != 'journal_mode'}
+    if not pragmas:
+        return
+    # Run on the raw connection so the pragmas don't show up as request queries
+    for statement in pragma_statements(pragmas):
+        connection.connection.execute(statement)
+
+def copy_database(source, target, pages=-1):
+    """
+    Copy the SQLite database of connection ``source`` into ``target`` with
+    the online backup API. Readers of the source are not blocked; readers
+    of the target see either the old or the new copy.
+    """
+    if source.vendor != 'sqlite' or target.vendor != 'sqlite':
+        raise ValueError('Only SQLite databases can be copied.')
+    if source.in_atomic_block:
+        # The backup would wait forever for the transaction to end
+        raise ValueError('Cannot copy a database from inside a transaction.')
+    source.ensure_connection()
+    target.ensure_connection()
+    source.connection.backup(target.connection, pages=pages)
@@ -0,0 +1,300 @@
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+from io import StringIO
+from types import SimpleNamespace
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.conf import settings
+from django.db import connection, connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from cart.services import place_order
+from movies.caching import get_cache
+from movies.models import Movie, Petition, Rating, Review
+from .assets import IMMUTABLE_CACHE_CONTROL, MANIFEST_HASHED_NAME, REVALIDATE_CACHE_CONTROL
+from .benchmark import compare_results, run_benchmarks, seed_dataset
+from .checks import check_api_cache_is_shared
+from .instrumentation import RequestMetrics, registry
+from .queryplans import explain, full_scans
+from .routers import STICKY_COOKIE_NAME, PrimaryReplicaRouter
+from .sqlite import configure_connection, pragma_statements
+
+class QueryPlanTests(TestCase):
+    def test_full_scans_are_detected(self):
+        def scans(sql):
+            return full_scans(explain(sql), sql)
+
+        self.assertEqual(scans('SELECT * FROM movies_movie WHERE price > 3'), ['SCAN movies_movie'])
+        self.assertEqual(scans('SELECT * FROM movies_movie ORDER BY name, id LIMIT 5'), [])
+        self.assertEqual(scans('SELECT * FROM cart_order WHERE state = 1 AND date > 2'), [])
+        # An ordered walk of a whole index does not make up for the filter
+        self.assertEqual(
+            scans('SELECT * FROM movies_movie WHERE price > 3 ORDER BY name, id LIMIT 5'),
+            ['SCAN movies_movie USING INDEX movie_name_id_idx'],
+        )
+
+    def test_views_do_not_scan_tables(self):
+        user = User.objects.create_user(username='buyer', password='secret-pass')
+        movie = Movie.objects.create(name='Inception', price=12, description='Dreams', image='movie_images/a.jpg')
+        Review.objects.create(movie=movie, user=user, comment='Great')
+        Petition.objects.create(movie_title='Heat', description='Please', created_by=user)
+        place_order(user, {movie.id: 1}, 'Ohio')
+
+        output = StringIO()
+        call_command('check_query_plans', stdout=output)
+        self.assertIn('No full table scans found.', output.getvalue())
+
+# Upper bounds on the queries each entry point may run, whatever the data size
+QUERY_BUDGETS = {
+    'movies.index': 3,
+    'movies.index search': 4,
+    'movies.show': 6,
+    'movies.petitions': 4,
+    'movies.trending_movies_api': 1,
+    'accounts.orders': 4,
+    # Includes the savepoints that TestCase turns transactions into
+    'cart.purchase': 16,
+}
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+    'api': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+})
+class BenchmarkTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_dataset({'users': 20, 'movies': 60, 'ratings': 300, 'orders': 80, 'petitions': 30, 'votes': 90}, batch_size=50)
+
+    def test_seeded_data_is_consistent(self):
+        self.assertEqual(Movie.objects.count(), 60)
+        self.assertEqual(Rating.objects.count(), 300)
+        self.assertEqual(sum(Movie.objects.values_list('rating_count', flat=True)), 300)
+        self.assertEqual(sum(Petition.objects.values_list('vote_count', flat=True)), 90)
+
+    def test_entry_points_stay_within_query_budgets(self):
+        results = run_benchmarks(iterations=2)
+
+        self.assertEqual(set(results), set(QUERY_BUDGETS))
+        for name, budget in QUERY_BUDGETS.items():
+            self.assertLessEqual(results[name]['queries'], budget, name)
+
+    def test_compare_results_reports_regressions(self):
+        baseline = {'movies.index': {'p50_ms': 10.0, 'queries': 3}}
+        self.assertEqual(compare_results({'movies.index': {'p50_ms': 11.0, 'queries': 3}}, baseline, 0.2), [])
+        self.assertEqual(len(compare_results({'movies.index': {'p50_ms': 13.0, 'queries': 4}}, baseline, 0.2)), 2)
+
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        registry.reset()
+        self.staff = User.objects.create_user(username='staff', password='secret-pass', is_staff=True)
+        self.movie = Movie.objects.create(name='Inception', price=12, description='Dreams', image='movie_images/a.jpg')
+
+    def test_requests_are_recorded_per_url_name(self):
+        response = self.client.get(reverse('movies.index'))
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries", tpl;dur=[\d.]+, total;dur=[\d.]+$')
+
+        views = registry.snapshot()
+        self.assertEqual(views['movies.index']['requests'], 1)
+        self.assertGreater(views['movies.index']['mean_template_ms'], 0)
+        self.assertEqual(sum(views['movies.index']['histogram'].values()), 1)
+
+    async def test_queries_are_counted_under_asgi(self):
+        # A sync view run on a worker thread and an async view using the async ORM
+        for url in (reverse('movies.index'), reverse('movies.reviews', args=[self.movie.id])):
+            response = await self.async_client.get(url)
+            queries = int(re.search(r'desc="(\d+) queries"', response['Server-Timing']).group(1))
+            self.assertGreater(queries, 0, url)
+
+    def test_duplicated_statements_are_fingerprinted(self):
+        metrics = RequestMetrics()
+        execute = lambda sql, params, many, context: None
+        for movie_id in range(3):
+            metrics.record_query(execute, 'SELECT * FROM movies_movie WHERE id = %s', [movie_id], False, {})
+        metrics.record_query(execute, 'SELECT * FROM movies_movie WHERE id IN (%s, %s)', [1, 2], False, {})
+        metrics.record_query(execute, 'SELECT * FROM movies_movie WHERE id IN (%s)', [1], False, {})
+
+        self.assertEqual(metrics.duplicates(), {
+            'SELECT * FROM movies_movie WHERE id = %s': 3,
+            'SELECT * FROM movies_movie WHERE id IN (...)': 2,
+        })
+
+    def test_metrics_endpoint_is_staff_only(self):
+        self.client.get(reverse('movies.index'))
+        self.assertEqual(self.client.get(reverse('core.metrics')).status_code, 302)
+
+        self.client.force_login(self.staff)
+        data = self.client.get(reverse('core.metrics')).json()
+        self.assertIn('movies.index', data['views'])
+        self.assertIn('caches', data)
+
+    def test_slow_requests_are_logged(self):
+        with self.settings(INSTRUMENTATION_SLOW_REQUEST_MS=0), self.assertLogs('core.instrumentation', 'WARNING') as logs:
+            self.client.get(reverse('movies.show', args=[self.movie.id]))
+        self.assertIn('movies.show', logs.output[0])
+
+class SqlitePragmaTests(TestCase):
+    def test_connections_are_configured(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], settings.SQLITE_PRAGMAS['busy_timeout'])
+
+    def test_journal_mode_comes_first_and_values_are_checked(self):
+        self.assertEqual(
+            pragma_statements({'synchronous': 'normal', 'journal_mode': 'wal', 'cache_size': -2000}),
+            ['PRAGMA journal_mode = wal', 'PRAGMA cache_size = -2000', 'PRAGMA synchronous = normal'],
+        )
+        with self.assertRaises(ValueError):
+            pragma_statements({'journal_mode': 'wal; DROP TABLE movies_movie'})
+
+    def test_kept_databases_stay_in_their_journal_mode(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        kept, other = os.path.join(directory, 'kept.sqlite3'), os.path.join(directory, 'other.sqlite3')
+        with self.settings(SQLITE_PRAGMAS={'journal_mode': 'wal', 'synchronous': 'normal'}, SQLITE_KEEP_JOURNAL_MODE=[kept]):
+            for name, journal_mode in ((kept, 'delete'), (other, 'wal')):
+                raw = sqlite3.connect(name)
+                self.addCleanup(raw.close)
+                configure_connection(None, SimpleNamespace(vendor='sqlite', settings_dict={'NAME': name}, connection=raw))
+                self.assertEqual(raw.execute('PRAGMA journal_mode').fetchone()[0], journal_mode)
+                self.assertEqual(raw.execute('PRAGMA synchronous').fetchone()[0], 1)
+
+class ApiCacheCheckTests(TestCase):
+    def test_local_api_cache_is_rejected_with_several_workers(self):
+        self.assertEqual(check_api_cache_is_shared(None), [])
+        with self.settings(WEB_WORKERS=4):
+            self.assertEqual([error.id for error in check_api_cache_is_shared(None)], ['core.E001'])
+            file_cache = {**settings.CACHES, 'api': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache'}}
+            with self.settings(CACHES=file_cache):
+                self.assertEqual(check_api_cache_is_shared(None), [])
+
+class ReplicaRoutingTests(TransactionTestCase):
+    # The replica is copied from committed data, which TestCase never has
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        connections.settings['replica'] = {
+            **connections['default'].settings_dict, 'NAME': os.path.join(directory, 'replica.sqlite3'),
+        }
+        self.addCleanup(self.remove_replica)
+
+        self.user = User.objects.create_user(username='buyer', password='secret-pass')
+        self.movie = Movie.objects.create(name='Inception', price=12, description='Dreams', image='movie_images/a.jpg')
+        self.client.force_login(self.user)
+        call_command('sync_replica', stdout=StringIO())
+
+    def remove_replica(self):
+        connections['replica'].close()
+        del connections['replica']
+        del connections.settings['replica']
+
+    def test_reads_use_the_replica_until_it_is_synced(self):
+        Movie.objects.create(name='Heat', price=8, description='Heist', image='movie_images/b.jpg')
+
+        self.assertEqual(self.client.get(reverse('movies.index')).context['template_data']['movies'], [self.movie])
+        call_command('sync_replica', stdout=StringIO())
+        self.assertEqual(len(self.client.get(reverse('movies.index')).context['template_data']['movies']), 2)
+
+    def test_writers_read_their_writes(self):
+        self.client.post(reverse('cart.add', args=[self.movie.id]), {'quantity': '1'})
+        response = self.client.post(reverse('cart.purchase'), {'state': 'Ohio', 'city': 'Columbus'})
+        self.assertIn(STICKY_COOKIE_NAME, response.cookies)
+
+        orders = lambda: self.client.get(reverse('accounts.orders')).context['template_data']['orders']
+        self.assertEqual(len(orders()), 1)
+
+        # Once the sticky window is over, reads go back to the stale replica
+        del self.client.cookies[STICKY_COOKIE_NAME]
+        self.assertEqual(len(orders()), 0)
+        call_command('sync_replica', stdout=StringIO())
+        self.assertEqual(len(orders()), 1)
+
+    def test_versioned_caches_are_built_from_the_primary(self):
+        get_cache().clear()
+        anonymous = self.client_class()
+        trending = lambda **headers: anonymous.get(reverse('movies.trending_movies_api'), headers=headers)
+        show = lambda: anonymous.get(reverse('movies.show', args=[self.movie.id]))
+        etag = trending()['ETag']
+        self.assertNotContains(show(), 'Mind bending')
+
+        self.client.post(reverse('cart.add', args=[self.movie.id]), {'quantity': '1'})
+        self.client.post(reverse('cart.purchase'), {'state': 'Ohio', 'city': 'Columbus'})
+        self.client.post(reverse('movies.create_review', args=[self.movie.id]), {'comment': 'Mind bending'})
+
+        # The replica has not caught up, but the bumped versions are not
+        # filled from it
+        response = trending(**{'If-None-Match': etag})
+        self.assertEqual(response.json()['data']['Ohio']['movie'], 'Inception')
+        self.assertContains(show(), 'Mind bending')
+        call_command('sync_replica', stdout=StringIO())
+        self.assertEqual(trending(**{'If-None-Match': response['ETag']}).status_code, 304)
+        self.assertContains(show(), 'Mind bending')
+
+    def test_reads_outside_requests_use_the_primary(self):
+        self.assertEqual(PrimaryReplicaRouter().db_for_read(Movie), 'default')
+
+class AssetServingTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        for name in ['thumbnails/0123456789abcdef-200.webp', 'movie_images/poster.jpg']:
+            os.makedirs(os.path.join(media_root, os.path.dirname(name)), exist_ok=True)
+            with open(os.path.join(media_root, name), 'wb') as file:
+                file.write(bytes(range(100)))
+
+    def test_hashed_files_are_cached_forever(self):
+        response = self.client.get('/media/thumbnails/0123456789abcdef-200.webp')
+        self.assertEqual(response['Cache-Control'], IMMUTABLE_CACHE_CONTROL)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertEqual(b''.join(response.streaming_content), bytes(range(100)))
+
+        response = self.client.get('/media/movie_images/poster.jpg')
+        self.assertEqual(response['Cache-Control'], REVALIDATE_CACHE_CONTROL)
+        self.assertTrue(MANIFEST_HASHED_NAME.search('css/style.6f1d0e2a9b3c.css'))
+        self.assertFalse(MANIFEST_HASHED_NAME.search('css/style.css'))
+
+    def test_conditional_requests(self):
+        response = self.client.get('/media/movie_images/poster.jpg')
+        etag, last_modified = response['ETag'], response['Last-Modified']
+
+        self.assertEqual(self.client.get('/media/movie_images/poster.jpg', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(
+            self.client.get('/media/movie_images/poster.jpg', HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304
+        )
+
+    def test_byte_ranges(self):
+        url = '/media/movie_images/poster.jpg'
+        response = self.client.get(url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/100')
+        self.assertEqual(b''.join(response.streaming_content), bytes(range(10, 20)))
+
+        response = self.client.get(url, HTTP_RANGE='bytes=-5')
+        self.assertEqual(b''.join(response.streaming_content), bytes(range(95, 100)))
+        self.assertEqual(self.client.get(url, HTTP_RANGE='bytes=200-').status_code, 416)
+        # A stale If-Range gets the whole, current file
+        self.assertEqual(self.client.get(url, HTTP_RANGE='bytes=0-1', HTTP_IF_RANGE='"stale"').status_code, 200)
+
+    async def test_files_and_ranges_stream_asynchronously_under_asgi(self):
+        url = '/media/movie_images/poster.jpg'
+        for headers, status, content in (({}, 200, bytes(range(100))), ({'Range': 'bytes=10-19'}, 206, bytes(range(10, 20)))):
+            response = await self.async_client.get(url, headers=headers)
+            self.assertEqual(response.status_code, status)
+            self.assertTrue(response.is_async)
+            self.assertEqual(response['Content-Length'], str(len(content)))
+            self.assertEqual(b''.join([chunk async for chunk in response.streaming_content]), content)
+
+    @override_settings(SENDFILE_HEADER='X-Accel-Redirect')
+    def test_sendfile_hands_over_to_the_server(self):
+        response = self.client.get('/media/movie_images/poster.jpg')
+        self.assertEqual(response['X-Accel-Redirect'], '/internal/media/movie_images/poster.jpg')
+        self.assertEqual(response.content, b'')
+
+    def test_paths_outside_the_root_are_not_served(self):
+        self.assertEqual(self.client.get('/media/../manage.py').status_code, 404)
+        self.assertEqual(self.client.get('/media/movie_images/').status_code, 404)
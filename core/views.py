@@ -0,0 +1,34 @@
+import re
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import JsonResponse
+from django.views.decorators.cache import never_cache
+from django.views.decorators.http import require_safe
+from movies.caching import cache_stats
+from movies.thumbnails import THUMBNAIL_DIR
+from .assets import MANIFEST_HASHED_NAME, serve_file
+from .instrumentation import registry
+
+# Thumbnails are named after their content hash
+IMMUTABLE_MEDIA = re.compile(rf'^{re.escape(THUMBNAIL_DIR)}/')
+
+@never_cache
+@staff_member_required
+def metrics(request):
+    """Request metrics per URL name and cache hit rates for this process"""
+    if request.method == 'POST' and request.POST.get('reset'):
+        registry.reset()
+    return JsonResponse({
+        'views': registry.snapshot(),
+        'caches': dict(cache_stats),
+    })
+
+@require_safe
+def media(request, path):
+    """Uploaded files and their thumbnails"""
+    return serve_file(request, path, settings.MEDIA_ROOT, immutable=IMMUTABLE_MEDIA)
+
+@require_safe
+def static(request, path):
+    """Collected static files, in the "manifest" asset mode"""
+    return serve_file(request, path, settings.STATIC_ROOT, immutable=MANIFEST_HASHED_NAME)
@@ -1,8 +1,11 @@
 from django.shortcuts import render
+from movies.views import recommended_movies
 
 def index(request):
     template_data = {}
     template_data['title'] = 'Movies Store'
+    if request.user.is_authenticated:
+        template_data['recommended_movies'] = recommended_movies(request.user.id)
     return render(request, 'home/index.html', {'template_data': template_data})
 
 def about(request):
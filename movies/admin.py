@@ -4,12 +4,21 @@ from .models import Movie, Review, Petition
 class MovieAdmin(admin.ModelAdmin):
     ordering = ['name']
     search_fields = ['name']
+    readonly_fields = ['average_rating', 'rating_count', 'rating_sum']
+
+class ReviewAdmin(admin.ModelAdmin):
+    list_display = ['id', 'movie', 'user', 'date', 'reported']
+    list_filter = ['reported']
+    list_select_related = ['movie', 'user']
+    ordering = ['-date']
 
 class PetitionAdmin(admin.ModelAdmin):
-    list_display = ['movie_title', 'created_by', 'created_date', 'get_vote_count']
+    list_display = ['movie_title', 'created_by', 'created_date', 'vote_count']
+    list_select_related = ['created_by']
+    readonly_fields = ['vote_count']
     ordering = ['-created_date']
     search_fields = ['movie_title', 'created_by__username']
 
 admin.site.register(Movie, MovieAdmin)
-admin.site.register(Review)
+admin.site.register(Review, ReviewAdmin)
 admin.site.register(Petition, PetitionAdmin)
\ No newline at end of file
@@ -0,0 +1,72 @@
+import random
+import time
+from collections import defaultdict
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from core.routers import primary_reads
+
+def get_cache():
+    return caches[settings.API_CACHE_ALIAS]
+
+def _version_key(namespace):
+    return f'{namespace}:version'
+
+def _new_version():
+    # Seed versions from the clock so a version key lost to culling or a
+    # restart never falls back to a number that was already handed out; the
+    # random low digits keep two bumps in the same millisecond apart
+    return int(time.time() * 1000) * 1000 + random.randrange(1000)
+
+def get_version(namespace):
+    """Return the current version stamp for a cached namespace"""
+    cache = get_cache()
+    version = cache.get(_version_key(namespace))
+    if version is None:
+        cache.add(_version_key(namespace), _new_version(), timeout=None)
+        version = cache.get(_version_key(namespace))
+    return version
+
+async def aget_version(namespace):
+    """Async version of get_version, for async views"""
+    cache = get_cache()
+    version = await cache.aget(_version_key(namespace))
+    if version is None:
+        await cache.aadd(_version_key(namespace), _new_version(), timeout=None)
+        version = await cache.aget(_version_key(namespace))
+    return version
+
+def bump_version(namespace):
+    """Invalidate everything cached under a namespace"""
+    # A fresh stamp rather than incr(), which the file based backend runs as
+    # a read and a write: two racing increments could both store the same
+    # number, leaving a version that was current before one of the writes
+    version = _new_version()
+    get_cache().set(_version_key(namespace), version, timeout=None)
+    return version
+
+# Hit and miss counts of get_or_set per cached object name, for this process
+cache_stats = defaultdict(lambda: {'hits': 0, 'misses': 0})
+
+def get_or_set(namespace, name, builder, timeout=DEFAULT_TIMEOUT):
+    """
+    Return the object cached as ``name`` under the current version of
+    ``namespace``, calling ``builder`` to produce and store it on a miss.
+    """
+    cache = get_cache()
+    cache_key = f'{namespace}:{get_version(namespace)}:{name}'
+    value = cache.get(cache_key)
+    if value is not None:
+        cache_stats[name]['hits'] += 1
+        return value
+
+    cache_stats[name]['misses'] += 1
+    # Built from the primary, since the replica may lag the write that
+    # bumped the version
+    with primary_reads():
+        value = builder()
+    cache.set(cache_key, value, timeout)
+    return value
+
+def movie_cache_namespace(movie_id):
+    return f'movie:{movie_id}'
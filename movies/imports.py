@@ -0,0 +1,93 @@
+"""
+Reading and validating catalog files for ``manage.py import_movies``.
+
+A catalog is a CSV file with a header row, or a JSON lines file, with a
+``name``, ``price``, ``description`` and ``image`` for every movie. The
+image is a local path, relative to the catalog file unless absolute.
+
+Images are stored under a name derived from their content hash
+(``movie_images/<hash>.<ext>``), so an image shared by many movies, or
+imported twice, is only stored once.
+"""
+import csv
+import json
+import os
+from django.core.files import File
+from django.core.files.storage import default_storage
+from PIL import Image
+from . import thumbnails
+from .models import Movie
+
+IMPORT_FORMATS = ('csv', 'jsonl')
+
+IMAGE_DIR = Movie._meta.get_field('image').upload_to.rstrip('/')
+
+MAX_NAME_LENGTH = Movie._meta.get_field('name').max_length
+
+def detect_format(path):
+    extension = os.path.splitext(path)[1].lstrip('.').lower()
+    return 'jsonl' if extension in ('jsonl', 'ndjson') else 'csv'
+
+def read_rows(path, file_format):
+    """Yield the rows of a catalog file as dicts, or None for unparsable lines"""
+    with open(path, newline='', encoding='utf-8') as source:
+        if file_format == 'csv':
+            yield from csv.DictReader(source)
+            return
+        for line in source:
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield row if isinstance(row, dict) else None
+
+def validate_row(row, base_dir):
+    """
+    Return the movie fields of a catalog row, with the resolved image path
+    as ``image``, or raise ValueError describing what is wrong with it
+    """
+    if row is None:
+        raise ValueError('not a JSON object')
+    name = str(row.get('name') or '').strip()
+    if not name or len(name) > MAX_NAME_LENGTH:
+        raise ValueError(f'name must be 1 to {MAX_NAME_LENGTH} characters')
+    try:
+        price = int(row.get('price'))
+    except (TypeError, ValueError):
+        raise ValueError(f"price {row.get('price')!r} is not a whole number")
+    if price < 0:
+        raise ValueError('price cannot be negative')
+    description = str(row.get('description') or '').strip()
+    if not description:
+        raise ValueError('description is missing')
+    image = str(row.get('image') or '').strip()
+    if not image:
+        raise ValueError('image is missing')
+    image = os.path.join(base_dir, os.path.expanduser(image))
+    if not os.path.isfile(image):
+        raise ValueError(f'image {image} does not exist')
+    return {'name': name, 'price': price, 'description': description, 'image': image}
+
+def hash_image(path):
+    """Check that a file is an image Pillow can read and return its content hash"""
+    with open(path, 'rb') as image:
+        try:
+            with Image.open(image) as parsed:
+                parsed.verify()
+        except (OSError, SyntaxError) as error:
+            raise ValueError(f'image {path} is not readable: {error}')
+        return thumbnails.content_hash(File(image))
+
+def image_name(image_hash, path):
+    extension = os.path.splitext(path)[1].lower() or '.jpg'
+    return f'{IMAGE_DIR}/{image_hash}{extension}'
+
+def store_image(path, image_hash, storage=default_storage):
+    """Copy an image into storage unless it is already there; return its name and whether it was copied"""
+    name = image_name(image_hash, path)
+    if storage.exists(name):
+        return name, False
+    with open(path, 'rb') as image:
+        return storage.save(name, File(image)), True
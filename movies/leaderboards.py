@@ -0,0 +1,105 @@
+"""
+Top-K leaderboards of the catalog.
+
+Purchases, ratings and petition votes add their deltas to per day and
+all-time LeaderboardBucket rows as they happen (see
+LeaderboardBucket.add), so a board is one aggregate over a handful of
+compact rows instead of a scan of every order item, rating or vote. The
+7 and 30 day windows sum the day buckets.
+
+Each process keeps the boards it has built in memory and rebuilds one once
+it is REFRESH_SECONDS old, so reads cost O(K) however busy the store is.
+The age alone decides: a change made by another process, or by
+``manage.py rebuild_leaderboards``, shows up within REFRESH_SECONDS
+whatever cache backend is configured. ``manage.py rebuild_leaderboards`` recomputes the buckets
+from the orders, ratings and votes.
+"""
+import time
+from datetime import timedelta
+from django.db.models import F, FloatField, Sum
+from django.db.models.functions import Cast
+from django.utils import timezone
+from core.routers import primary_reads
+from .models import LeaderboardBucket, Movie, Petition
+
+LEADERBOARD_SIZE = 10
+
+# Averages of fewer ratings are too noisy to rank
+MIN_RATINGS = 3
+
+# How stale a board may get
+REFRESH_SECONDS = 5
+
+# Name -> (bucket board, title, what is ranked)
+LEADERBOARDS = {
+    'top_sellers': (LeaderboardBucket.SALES, 'Top sellers', 'units'),
+    'top_revenue': (LeaderboardBucket.SALES, 'Top grossing', 'revenue'),
+    'top_rated': (LeaderboardBucket.RATINGS, 'Top rated', 'average'),
+    'most_petitioned': (LeaderboardBucket.PETITIONS, 'Most petitioned', 'votes'),
+}
+
+# Window -> number of days, None for all time
+WINDOWS = {'7d': 7, '30d': 30, 'all': None}
+
+# (name, window) -> (day, built at, entries)
+_boards = {}
+
+def top(name, window='all'):
+    """
+    Return the entries of a leaderboard, best first, as dicts with the
+    item ``id``, its ``name``, the ranked ``score`` and the ``count`` of
+    units, ratings or votes behind it. Raises KeyError for an unknown
+    board or window.
+    """
+    if name not in LEADERBOARDS or window not in WINDOWS:
+        raise KeyError(f'Unknown leaderboard {name!r} ({window!r})')
+    today = timezone.localdate()
+    now = time.monotonic()
+    board = _boards.get((name, window))
+    if board is not None:
+        built_day, built_at, entries = board
+        # Windows move at midnight even when no bucket changed
+        if built_day == today and now - built_at < REFRESH_SECONDS:
+            return entries
+    with primary_reads():
+        entries = build(name, window, today)
+    _boards[(name, window)] = (today, now, entries)
+    return entries
+
+def build(name, window, today=None):
+    """Compute a leaderboard from the buckets"""
+    board, _, ranked = LEADERBOARDS[name]
+    days = WINDOWS[window]
+    buckets = LeaderboardBucket.objects.filter(board=board)
+    if days is None:
+        buckets = buckets.filter(day=LeaderboardBucket.ALL_TIME)
+    else:
+        today = today or timezone.localdate()
+        buckets = buckets.filter(day__gt=today - timedelta(days=days))
+    rows = buckets.values('item_id').annotate(total_value=Sum('value'), total_count=Sum('count'))
+    if ranked == 'average':
+        rows = rows.annotate(
+            score=Cast('total_value', FloatField()) / Cast('total_count', FloatField())
+        ).filter(total_count__gte=MIN_RATINGS)
+    else:
+        rows = rows.annotate(score=F('total_value' if ranked == 'revenue' else 'total_count')).filter(score__gt=0)
+    rows = list(rows.order_by('-score', '-total_count', 'item_id')[:LEADERBOARD_SIZE])
+
+    ids = [row['item_id'] for row in rows]
+    if board == LeaderboardBucket.PETITIONS:
+        names = dict(Petition.objects.filter(id__in=ids).values_list('id', 'movie_title'))
+    else:
+        names = dict(Movie.objects.filter(id__in=ids).values_list('id', 'name'))
+    return [
+        {
+            'id': row['item_id'],
+            'name': names[row['item_id']],
+            'score': round(row['score'], 2) if ranked == 'average' else row['score'],
+            'count': row['total_count'],
+        }
+        for row in rows if row['item_id'] in names
+    ]
+
+def clear():
+    """Forget the boards built by this process"""
+    _boards.clear()
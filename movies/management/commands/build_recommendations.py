@@ -0,0 +1,71 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from movies.models import Rating, Recommendation, RecommendationRun
+
+class Command(BaseCommand):
+    help = (
+        'Train item-item collaborative filtering on every rating and store the "recommended for you" '
+        'movies of the users who rated since the last run, or of every user with --full'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Rescore every user, e.g. to drop the recommendations of users whose ratings were deleted',
+        )
+        parser.add_argument('--batch-size', type=int, default=10000, help='Ratings fetched per query')
+
+    def handle(self, *args, **options):
+        try:
+            import numpy as np
+            from movies import recommendations
+        except ImportError as error:
+            raise CommandError(f'Building recommendations needs NumPy and SciPy ({error}).')
+
+        # Taken before any rating is read, so ratings made during the run
+        # are scored again by the next one
+        started_at = timezone.now()
+        last_run = RecommendationRun.objects.order_by('-started_at').first()
+        full = options['full'] or last_run is None
+
+        if not full:
+            changed = set(
+                Rating.objects.filter(updated_at__gte=last_run.started_at).values_list('user_id', flat=True)
+            )
+            if not changed:
+                self.stdout.write('Recommendations are up to date.')
+                return
+
+        users, movies, matrix = recommendations.rating_matrix(
+            *recommendations.load_ratings(options['batch_size'])
+        )
+        rows = list(range(len(users))) if full else np.flatnonzero(np.isin(users, list(changed))).tolist()
+        similarities = recommendations.movie_similarities(matrix)
+
+        batch = {}
+        for row, columns, scores in recommendations.recommend(matrix, similarities, rows):
+            batch[int(users[row])] = list(zip(movies[columns].tolist(), scores.tolist()))
+            if len(batch) >= recommendations.CHUNK_SIZE:
+                self.save(batch)
+                batch = {}
+        self.save(batch)
+
+        if full:
+            Recommendation.objects.filter(user__rating__isnull=True).delete()
+        RecommendationRun.objects.create(started_at=started_at, full=full, users=len(rows))
+        self.stdout.write(self.style.SUCCESS(
+            f"Recommendations rebuilt for {len(rows)} users ({'full' if full else 'incremental'})."
+        ))
+
+    def save(self, recommended):
+        """Replace the recommendations of a batch of users"""
+        if not recommended:
+            return
+        with transaction.atomic():
+            Recommendation.objects.filter(user_id__in=recommended).delete()
+            Recommendation.objects.bulk_create([
+                Recommendation(user_id=user_id, movie_id=movie_id, rank=rank, score=score)
+                for user_id, entries in recommended.items()
+                for rank, (movie_id, score) in enumerate(entries)
+            ])
@@ -0,0 +1,60 @@
+from collections import defaultdict
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from movies.caching import bump_version, movie_cache_namespace
+from movies.models import Movie, SimilarMovie
+
+class Command(BaseCommand):
+    help = (
+        'Precompute the similar movies shown on every movie page from descriptions and co-purchases. '
+        'Only movies added since the last build are scored unless --full is given.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Score every movie again, e.g. to pick up new orders and edited descriptions',
+        )
+        parser.add_argument('--neighbors', type=int, help='Neighbors kept per movie')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        try:
+            from movies import similarity
+        except ImportError as error:
+            raise CommandError(f'Building similar movies needs NumPy and SciPy ({error}).')
+        count = options['neighbors'] or similarity.NEIGHBOR_COUNT
+        if count < 1:
+            raise CommandError('--neighbors must be at least 1.')
+
+        if options['full']:
+            scored_ids = set(Movie.objects.values_list('id', flat=True))
+            neighbors = similarity.compute_neighbors(count=count)
+        else:
+            scored_ids = set(Movie.objects.filter(similar_movies_built=False).values_list('id', flat=True))
+            if not scored_ids:
+                self.stdout.write('Similar movies are up to date.')
+                return
+            existing = defaultdict(list)
+            rows = SimilarMovie.objects.order_by('movie_id', 'rank').values_list('movie_id', 'neighbor_id', 'score')
+            for movie_id, neighbor_id, score in rows.iterator(chunk_size=options['batch_size']):
+                existing[movie_id].append((neighbor_id, score))
+            neighbors = similarity.compute_neighbors(scored_ids, existing, count=count)
+
+        with transaction.atomic():
+            if options['full']:
+                SimilarMovie.objects.all().delete()
+            else:
+                SimilarMovie.objects.filter(movie_id__in=neighbors).delete()
+            SimilarMovie.objects.bulk_create([
+                SimilarMovie(movie_id=movie_id, neighbor_id=neighbor_id, rank=rank, score=score)
+                for movie_id, entries in neighbors.items()
+                for rank, (neighbor_id, score) in enumerate(entries)
+            ], batch_size=options['batch_size'])
+            Movie.objects.filter(id__in=scored_ids).update(similar_movies_built=True)
+        for movie_id in neighbors:
+            bump_version(movie_cache_namespace(movie_id))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Scored {len(scored_ids)} movies and updated the similar movies of {len(neighbors)}.'
+        ))
@@ -0,0 +1,61 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+import django
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from movies import thumbnails
+from movies.caching import bump_version, movie_cache_namespace
+from movies.models import Movie
+
+def process_image(image_name, image_hash, force):
+    """Hash an image if needed and generate its thumbnails; runs in a worker process"""
+    try:
+        if not image_hash:
+            with default_storage.open(image_name) as image:
+                image_hash = thumbnails.content_hash(image)
+        return image_hash, thumbnails.generate_thumbnails(image_name, image_hash, force=force), None
+    except (OSError, ValueError) as error:
+        return image_hash, 0, str(error)
+
+class Command(BaseCommand):
+    help = 'Generate the thumbnails of every movie image in parallel, filling in missing image hashes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Worker processes (default: one per CPU)')
+        parser.add_argument('--force', action='store_true', help='Regenerate thumbnails that already exist')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError('--workers must be at least 1.')
+        movies = list(Movie.objects.exclude(image='').only('id', 'image', 'image_hash').order_by('id'))
+        # Workers only touch files; don't let them inherit open database connections
+        connections.close_all()
+
+        hashed = []
+        generated = failed = 0
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=django.setup) as executor:
+            results = executor.map(
+                process_image,
+                [movie.image.name for movie in movies],
+                [movie.image_hash for movie in movies],
+                [options['force']] * len(movies),
+                chunksize=16,
+            )
+            for movie, (image_hash, written, error) in zip(movies, results):
+                if error:
+                    failed += 1
+                    self.stderr.write(f'{movie.image.name}: {error}')
+                    continue
+                generated += written
+                if image_hash != movie.image_hash:
+                    movie.image_hash = image_hash
+                    hashed.append(movie)
+
+        Movie.objects.bulk_update(hashed, ['image_hash'], batch_size=500)
+        for movie in hashed:
+            bump_version(movie_cache_namespace(movie.id))
+        self.stdout.write(
+            f'{generated} thumbnails generated for {len(movies) - failed} images '
+            f'({len(hashed)} newly hashed, {failed} failed).'
+        )
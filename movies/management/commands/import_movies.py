@@ -0,0 +1,125 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from movies import imports, search
+from movies.models import Movie, MovieImport
+
+class Command(BaseCommand):
+    help = (
+        'Import movies and their local images from a CSV or JSON lines catalog. Progress is checkpointed '
+        'with every batch, so running the command again resumes where it stopped.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Catalog file with name, price, description and image columns')
+        parser.add_argument('--format', choices=imports.IMPORT_FORMATS, help='Default: from the file extension')
+        parser.add_argument('--batch-size', type=int, default=500, help='Movies written per transaction')
+        parser.add_argument('--workers', type=int, default=8, help='Threads hashing and copying images')
+        parser.add_argument('--restart', action='store_true', help='Ignore the checkpoint and import from the first row')
+
+    def handle(self, *args, **options):
+        path = os.path.abspath(options['path'])
+        if not os.path.isfile(path):
+            raise CommandError(f'{path} does not exist.')
+        if options['batch_size'] < 1 or options['workers'] < 1:
+            raise CommandError('--batch-size and --workers must be at least 1.')
+        file_format = options['format'] or imports.detect_format(path)
+        base_dir = os.path.dirname(path)
+
+        checkpoint, _ = MovieImport.objects.get_or_create(source=path)
+        if options['restart']:
+            checkpoint.rows_done = 0
+        skipped_rows = checkpoint.rows_done
+        if skipped_rows:
+            self.stdout.write(f'Resuming after row {skipped_rows}.')
+
+        rows = islice(imports.read_rows(path, file_format), skipped_rows, None)
+        self.stats = {'imported': 0, 'invalid': 0, 'copied': 0, 'deduplicated': 0}
+        # Content hashes of the images seen so far, by path, and where each
+        # distinct image ended up in storage
+        self.hashes = {}
+        self.stored = {}
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            while True:
+                batch = list(islice(rows, options['batch_size']))
+                if not batch:
+                    break
+                self.import_batch(batch, checkpoint, base_dir, executor)
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f"{checkpoint.rows_done} rows done, {self.stats['imported']} movies imported "
+                    f'({self.rate(elapsed)} rows/s)'
+                )
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {self.stats['imported']} movies in {elapsed:.1f}s ({self.rate(elapsed)} rows/s): "
+            f"{self.stats['invalid']} invalid rows skipped, {self.stats['copied']} images copied, "
+            f"{self.stats['deduplicated']} already stored."
+        ))
+        if self.stats['imported']:
+            self.stdout.write('Run generate_thumbnails to prepare the thumbnails of the new images.')
+
+    def rate(self, elapsed):
+        return round((self.stats['imported'] + self.stats['invalid']) / elapsed) if elapsed else 0
+
+    def import_batch(self, batch, checkpoint, base_dir, executor):
+        first_row = checkpoint.rows_done + 1
+        movies = []
+        for number, row in enumerate(batch, first_row):
+            try:
+                movies.append((number, imports.validate_row(row, base_dir)))
+            except ValueError as error:
+                self.invalid(number, error)
+
+        # Hash (and check) the images not seen before, then store each new
+        # image once, however many movies share it
+        new_paths = list({fields['image'] for _, fields in movies} - set(self.hashes))
+        for image_path, result in zip(new_paths, executor.map(self.try_hash, new_paths)):
+            self.hashes[image_path] = result
+        valid = []
+        for number, fields in movies:
+            result = self.hashes[fields['image']]
+            if isinstance(result, ValueError):
+                self.invalid(number, result)
+            else:
+                valid.append(fields)
+        names = {
+            fields['image']: imports.image_name(self.hashes[fields['image']], fields['image']) for fields in valid
+        }
+        to_store = {name: image_path for image_path, name in names.items() if name not in self.stored}
+        results = executor.map(
+            lambda image_path: imports.store_image(image_path, self.hashes[image_path]), to_store.values()
+        )
+        for name, (stored_name, copied) in zip(to_store, results):
+            self.stored[name] = stored_name
+            self.stats['copied' if copied else 'deduplicated'] += 1
+
+        with transaction.atomic():
+            created = Movie.objects.bulk_create([
+                Movie(
+                    name=fields['name'], price=fields['price'], description=fields['description'],
+                    image=self.stored[names[fields['image']]],
+                    image_hash=self.hashes[fields['image']],
+                )
+                for fields in valid
+            ])
+            # bulk_create sends no post_save, which usually indexes movies
+            search.index_movies(created)
+            checkpoint.rows_done += len(batch)
+            checkpoint.save()
+        self.stats['imported'] += len(created)
+
+    def try_hash(self, image_path):
+        try:
+            return imports.hash_image(image_path)
+        except (OSError, ValueError) as error:
+            return ValueError(str(error))
+
+    def invalid(self, number, error):
+        self.stats['invalid'] += 1
+        self.stderr.write(f'Row {number}: {error}')
@@ -0,0 +1,71 @@
+from itertools import chain, islice
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from cart.models import Item
+from movies.models import LeaderboardBucket, Movie, Petition, Rating
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the leaderboard buckets: sales per day and all time from the order history, ratings per '
+        'day from when they were last changed and all time from their counters, petition votes all time'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        Bucket = LeaderboardBucket
+        revenue = Sum(F('price') * F('quantity'))
+        sales_by_day = Item.objects.annotate(day=TruncDate('order__date')).values('movie_id', 'day').annotate(
+            revenue=revenue, units=Sum('quantity'),
+        ).order_by()
+        sales = Item.objects.values('movie_id').annotate(revenue=revenue, units=Sum('quantity')).order_by()
+        ratings_by_day = Rating.objects.annotate(day=TruncDate('updated_at')).values('movie_id', 'day').annotate(
+            stars=Sum('stars'), ratings=Count('id'),
+        ).order_by()
+
+        buckets = chain(
+            (
+                Bucket(board=Bucket.SALES, day=row['day'], item_id=row['movie_id'],
+                       value=row['revenue'], count=row['units'])
+                for row in sales_by_day.iterator(chunk_size=options['batch_size'])
+            ),
+            (
+                Bucket(board=Bucket.SALES, day=Bucket.ALL_TIME, item_id=row['movie_id'],
+                       value=row['revenue'], count=row['units'])
+                for row in sales.iterator(chunk_size=options['batch_size'])
+            ),
+            (
+                Bucket(board=Bucket.RATINGS, day=row['day'], item_id=row['movie_id'],
+                       value=row['stars'], count=row['ratings'])
+                for row in ratings_by_day.iterator(chunk_size=options['batch_size'])
+            ),
+            (
+                Bucket(board=Bucket.RATINGS, day=Bucket.ALL_TIME, item_id=movie_id, value=stars, count=ratings)
+                for movie_id, stars, ratings in Movie.objects.filter(rating_count__gt=0).values_list(
+                    'id', 'rating_sum', 'rating_count'
+                ).iterator(chunk_size=options['batch_size'])
+            ),
+            (
+                Bucket(board=Bucket.PETITIONS, day=Bucket.ALL_TIME, item_id=petition_id, count=votes)
+                for petition_id, votes in Petition.objects.filter(vote_count__gt=0).values_list(
+                    'id', 'vote_count'
+                ).iterator(chunk_size=options['batch_size'])
+            ),
+        )
+
+        created = 0
+        with transaction.atomic():
+            # Votes carry no timestamp, so their day buckets cannot be
+            # recomputed and are kept as recorded
+            Bucket.objects.filter(Q(board__in=[Bucket.SALES, Bucket.RATINGS]) | Q(day=Bucket.ALL_TIME)).delete()
+            while True:
+                batch = list(islice(buckets, options['batch_size']))
+                if not batch:
+                    break
+                Bucket.objects.bulk_create(batch)
+                created += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {created} leaderboard buckets.'))
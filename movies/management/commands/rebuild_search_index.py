@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand, CommandError
+from movies import search
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index of the movie catalog'
+
+    def handle(self, *args, **options):
+        if not search.fts_enabled():
+            raise CommandError('The FTS5 search index is not available on this database.')
+        indexed = search.rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} movies.'))
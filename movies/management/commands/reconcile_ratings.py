@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce
+from movies.models import Movie
+
+class Command(BaseCommand):
+    help = 'Check the stored rating counters of every movie against its ratings and repair any drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Only report drifted movies and exit with an error if there are any',
+        )
+
+    def handle(self, *args, **options):
+        drifted = Movie.objects.annotate(
+            actual_count=Count('ratings'),
+            actual_sum=Coalesce(Sum('ratings__stars'), 0),
+        ).filter(
+            ~Q(rating_count=F('actual_count')) | ~Q(rating_sum=F('actual_sum'))
+        ).values_list('id', 'name', 'rating_count', 'rating_sum', 'actual_count', 'actual_sum')
+
+        # Drift is expected to be rare, so the mismatches are loaded up front
+        # rather than updating rows underneath an open cursor
+        drifted = list(drifted)
+        for movie_id, name, rating_count, rating_sum, actual_count, actual_sum in drifted:
+            self.stdout.write(
+                f'{movie_id} - {name}: stored {rating_count} ratings / {rating_sum} stars, '
+                f'actual {actual_count} ratings / {actual_sum} stars'
+            )
+            if not options['check']:
+                Movie.objects.filter(id=movie_id).update(
+                    rating_count=actual_count,
+                    rating_sum=actual_sum,
+                    average_rating=actual_sum / actual_count if actual_count else None,
+                )
+
+        if options['check']:
+            if drifted:
+                raise CommandError(f'{len(drifted)} movies have drifted rating counters.')
+            self.stdout.write(self.style.SUCCESS('Rating counters are consistent.'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'{len(drifted)} movies repaired.'))
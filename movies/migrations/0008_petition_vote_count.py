@@ -0,0 +1,26 @@
+# Generated by Django 5.0.14 on 2026-10-18 20:20
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_vote_counts(apps, schema_editor):
+    Petition = apps.get_model('movies', 'Petition')
+    for petition_id, votes in Petition.objects.annotate(votes_total=Count('votes')).values_list('id', 'votes_total'):
+        Petition.objects.filter(id=petition_id).update(vote_count=votes)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0007_movie_rating_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='petition',
+            name='vote_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_vote_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.14 on 2026-10-18 20:25
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0011_review_movie_date_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='petition',
+            index=models.Index(fields=['created_date'], name='petition_created_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(condition=models.Q(('reported', True)), fields=['date'], name='review_reported_idx'),
+        ),
+    ]
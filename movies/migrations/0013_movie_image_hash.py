@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-18 20:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0012_review_petition_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='image_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=16),
+        ),
+    ]
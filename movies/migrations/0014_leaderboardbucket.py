@@ -0,0 +1,27 @@
+# Generated by Django 5.0.14 on 2026-10-18 20:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0013_movie_image_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaderboardBucket',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('board', models.CharField(max_length=16)),
+                ('day', models.DateField()),
+                ('item_id', models.IntegerField()),
+                ('value', models.BigIntegerField(default=0)),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('board', 'day', 'item_id')},
+            },
+        ),
+    ]
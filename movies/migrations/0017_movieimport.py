@@ -0,0 +1,22 @@
+# Generated by Django 5.0.14 on 2026-10-18 21:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0016_recommendations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovieImport',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('source', models.CharField(max_length=1024, unique=True)),
+                ('rows_done', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
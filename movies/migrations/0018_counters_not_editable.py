@@ -0,0 +1,33 @@
+# Generated by Django 5.0.14 on 2026-10-18 21:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0017_movieimport'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='movie',
+            name='average_rating',
+            field=models.FloatField(blank=True, default=0.0, editable=False, null=True),
+        ),
+        migrations.AlterField(
+            model_name='movie',
+            name='rating_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='movie',
+            name='rating_sum',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='petition',
+            name='vote_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+    ]
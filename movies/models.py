@@ -1,7 +1,25 @@
 
-from django.db import models
+from datetime import date
+from django.db import models, transaction
 from django.contrib.auth.models import User
-from django.db.models import Avg
+from django.db.models import Case, F, FloatField, IntegerField, Value, When
+from django.db.models.functions import Cast, NullIf
+from django.utils import timezone
+from . import thumbnails
+
+def counters_excluded(instance, kwargs, counters):
+    """
+    Return save() keyword arguments that leave ``counters`` out of a full
+    save of an existing row. They are only changed with F() updates, so the
+    values in memory may be stale and must never be written back.
+    """
+    if instance._state.adding or kwargs.get('update_fields') is not None:
+        return kwargs
+    deferred = instance.get_deferred_fields()
+    return {**kwargs, 'update_fields': [
+        field.attname for field in instance._meta.concrete_fields
+        if not field.primary_key and field.name not in counters and field.attname not in deferred
+    ]}
 
 class Movie(models.Model):
     id = models.AutoField(primary_key=True)
@@ -9,11 +27,72 @@ class Movie(models.Model):
     price = models.IntegerField()
     description = models.TextField()
     image = models.ImageField(upload_to='movie_images/')
-    average_rating = models.FloatField(default=0.0, null=True, blank=True)
+    # Kept in sync with the ratings by apply_rating_change
+    average_rating = models.FloatField(default=0.0, null=True, blank=True, editable=False)
+    rating_count = models.IntegerField(default=0, editable=False)
+    rating_sum = models.IntegerField(default=0, editable=False)
+    # Hash of the image content, naming its thumbnails (movies.thumbnails)
+    image_hash = models.CharField(max_length=16, blank=True, default='', editable=False)
+    # Whether build_similar_movies has scored the movie (SimilarMovie)
+    similar_movies_built = models.BooleanField(default=False, editable=False)
+
+    class Meta:
+        indexes = [
+            # Catalog pages are walked in (name, id) order
+            models.Index(fields=['name', 'id'], name='movie_name_id_idx'),
+        ]
 
     def __str__(self):
         return str(self.id) + ' - ' + self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored image so a save can tell if it was replaced
+        instance._saved_image = instance.__dict__.get('image')
+        return instance
+
+    COUNTERS = ('average_rating', 'rating_count', 'rating_sum')
+
+    def save(self, *args, **kwargs):
+        kwargs = counters_excluded(self, kwargs, self.COUNTERS)
+        image_changed = (
+            'image' not in self.get_deferred_fields() and self.image.name != getattr(self, '_saved_image', None)
+        )
+        if image_changed:
+            self.image_hash = self.hash_image()
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'image_hash'}
+        # Read by the post_save receiver that generates thumbnails
+        self._image_changed = image_changed
+        super().save(*args, **kwargs)
+        self._saved_image = self.image.name
+
+    def hash_image(self):
+        if not self.image:
+            return ''
+        if not self.image._committed:
+            # A fresh upload, written to storage by save()
+            return thumbnails.content_hash(self.image)
+        try:
+            with self.image.open('rb') as image:
+                return thumbnails.content_hash(image)
+        except OSError:
+            # The file is missing; generate_thumbnails fills the hash in later
+            return ''
+
+    @classmethod
+    def apply_rating_change(cls, movie_id, count_delta, stars_delta):
+        """Shift the rating counters of a movie in a single UPDATE"""
+        # The right hand side of an UPDATE sees the old column values, so the
+        # new average is computed from the old counters plus the deltas
+        cls.objects.filter(id=movie_id).update(
+            rating_count=F('rating_count') + count_delta,
+            rating_sum=F('rating_sum') + stars_delta,
+            average_rating=Cast(F('rating_sum') + stars_delta, FloatField()) /
+                NullIf(F('rating_count') + count_delta, 0),
+        )
+
 class Review(models.Model):
     id = models.AutoField(primary_key=True)
     comment = models.CharField(max_length=255)
@@ -22,6 +101,14 @@ class Review(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     reported = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            # Reviews of a movie are listed newest first
+            models.Index(fields=['movie', 'date'], name='review_movie_date_idx'),
+            # Moderation only ever looks at the few reported reviews
+            models.Index(fields=['date'], condition=models.Q(reported=True), name='review_reported_idx'),
+        ]
+
     def __str__(self):
         return str(self.id) + ' - ' + self.movie.name
 
@@ -32,12 +119,22 @@ class Petition(models.Model):
     created_date = models.DateTimeField(auto_now_add=True)
     created_by = models.ForeignKey(User, on_delete=models.CASCADE)
     votes = models.ManyToManyField(User, related_name='petition_votes', blank=True)
+    # Kept in sync with votes by the m2m_changed receiver in signals.py
+    vote_count = models.IntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_date'], name='petition_created_date_idx'),
+        ]
 
     def __str__(self):
         return str(self.id) + ' - ' + self.movie_title
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **counters_excluded(self, kwargs, ('vote_count',)))
+
     def get_vote_count(self):
-        return self.votes.count()
+        return self.vote_count
 
     def has_user_voted(self, user):
         return self.votes.filter(id=user.id).exists()
@@ -46,17 +143,166 @@ class Rating(models.Model):
     movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='ratings')
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     stars = models.IntegerField(choices=[(i, i) for i in range(1, 6)]) # 1 to 5 stars
+    # Lets build_recommendations rescore only the users who rated since its last run
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         # Ensures a user can only rate a specific movie once
         unique_together = ('movie', 'user')
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored stars so a later save can apply just the change,
+        # and when they were last changed, which is the day they count on
+        instance._saved_stars = instance.__dict__.get('stars')
+        instance._saved_updated_at = instance.__dict__.get('updated_at')
+        return instance
+
+    @property
+    def counted_on(self):
+        """The day of the ratings leaderboard bucket the rating is counted in"""
+        return timezone.localdate(self.updated_at)
+
     def save(self, *args, **kwargs):
-        # Call the original save method first
-        super().save(*args, **kwargs)
-        
-        # After saving a rating, recalculate and update the movie's average rating
-        # We access the related movie through the 'movie' foreign key
-        movie_ratings = self.movie.ratings.all()
-        self.movie.average_rating = movie_ratings.aggregate(Avg('stars'))['stars__avg']
-        self.movie.save()
\ No newline at end of file
+        with transaction.atomic():
+            adding = self._state.adding
+            previous_stars = getattr(self, '_saved_stars', None)
+            previous_updated_at = getattr(self, '_saved_updated_at', None)
+            if not adding and previous_stars is None:
+                previous_stars, previous_updated_at = Rating.objects.filter(pk=self.pk).values_list(
+                    'stars', 'updated_at'
+                ).first() or (None, None)
+
+            super().save(*args, **kwargs)
+
+            # Update the movie's counters in place instead of re-aggregating
+            # every rating of the movie
+            if adding or previous_stars is None:
+                Movie.apply_rating_change(self.movie_id, 1, self.stars)
+                LeaderboardBucket.add(LeaderboardBucket.RATINGS, {self.movie_id: (self.stars, 1)}, day=self.counted_on)
+            else:
+                if previous_stars != self.stars:
+                    Movie.apply_rating_change(self.movie_id, 0, self.stars - previous_stars)
+                # The windowed boards count a rating on the day it was last saved,
+                # so move it from that day's bucket to today's with its new stars
+                previous_day = timezone.localdate(previous_updated_at) if previous_updated_at else self.counted_on
+                if previous_day != self.counted_on:
+                    LeaderboardBucket.add(LeaderboardBucket.RATINGS, {self.movie_id: (-previous_stars, -1)}, day=previous_day)
+                    LeaderboardBucket.add(LeaderboardBucket.RATINGS, {self.movie_id: (self.stars, 1)}, day=self.counted_on)
+                elif previous_stars != self.stars:
+                    LeaderboardBucket.add(
+                        LeaderboardBucket.RATINGS, {self.movie_id: (self.stars - previous_stars, 0)}, day=self.counted_on
+                    )
+            self._saved_stars = self.stars
+            self._saved_updated_at = self.updated_at
+
+class LeaderboardBucket(models.Model):
+    """
+    What a movie or petition gained on a leaderboard on one day: units
+    sold and revenue, ratings and their stars, or petition votes. Each
+    change also goes to an all-time row (day = ALL_TIME), so all-time
+    boards never sum day buckets. Read through movies.leaderboards.
+    """
+    SALES = 'sales'
+    RATINGS = 'ratings'
+    PETITIONS = 'petitions'
+    ALL_TIME = date.min
+
+    id = models.AutoField(primary_key=True)
+    board = models.CharField(max_length=16)
+    day = models.DateField()
+    # Movie id, or petition id on the petitions board
+    item_id = models.IntegerField()
+    # Revenue on the sales board, stars on the ratings board
+    value = models.BigIntegerField(default=0)
+    # Units sold, ratings or votes
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('board', 'day', 'item_id')
+
+    def __str__(self):
+        return f'{self.board} - {self.day} - {self.item_id}'
+
+    @classmethod
+    def add(cls, board, deltas, day=None):
+        """
+        Add ``{item_id: (value delta, count delta)}`` to the buckets of
+        ``day`` (today by default) and to the all-time buckets, with one
+        INSERT and one UPDATE whatever the number of items
+        """
+        if not deltas:
+            return
+        days = [day or timezone.localdate(), cls.ALL_TIME]
+        cls.objects.bulk_create([
+            cls(board=board, day=bucket_day, item_id=item_id) for item_id in deltas for bucket_day in days
+        ], ignore_conflicts=True)
+        cls.objects.filter(board=board, day__in=days, item_id__in=deltas).update(
+            value=F('value') + Case(
+                *[When(item_id=item_id, then=Value(value)) for item_id, (value, _) in deltas.items()],
+                output_field=IntegerField(),
+            ),
+            count=F('count') + Case(
+                *[When(item_id=item_id, then=Value(count)) for item_id, (_, count) in deltas.items()],
+                output_field=IntegerField(),
+            ),
+        )
+
+class SimilarMovie(models.Model):
+    """
+    One of the precomputed most similar movies of a movie, ranked from 0.
+    Built by ``manage.py build_similar_movies`` (see movies.similarity).
+    """
+    id = models.AutoField(primary_key=True)
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='similar_movies')
+    neighbor = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='neighbor_of')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        # Also the index the movie page reads its neighbors through
+        unique_together = ('movie', 'rank')
+
+    def __str__(self):
+        return f'{self.movie_id} - {self.rank} - {self.neighbor_id}'
+
+class Recommendation(models.Model):
+    """
+    A movie recommended to a user from the ratings of similar movies,
+    ranked from 0. Built by ``manage.py build_recommendations`` (see
+    movies.recommendations).
+    """
+    id = models.AutoField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='recommendations')
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='recommended')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        # Also the index the home page reads recommendations through
+        unique_together = ('user', 'rank')
+
+    def __str__(self):
+        return f'{self.user_id} - {self.rank} - {self.movie_id}'
+
+class RecommendationRun(models.Model):
+    """When build_recommendations ran and how many users it scored"""
+    id = models.AutoField(primary_key=True)
+    started_at = models.DateTimeField()
+    full = models.BooleanField(default=False)
+    users = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.started_at} - {self.users} users'
+
+class MovieImport(models.Model):
+    """How far ``manage.py import_movies`` got through a source file"""
+    id = models.AutoField(primary_key=True)
+    source = models.CharField(max_length=1024, unique=True)
+    # Rows of the source, valid or not, that no longer need importing
+    rows_done = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.source} - {self.rows_done} rows'
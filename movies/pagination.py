@@ -0,0 +1,125 @@
+import base64
+import binascii
+import json
+from datetime import date
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.db import models
+from django.db.models import Q
+
+def _encode_value(value):
+    # Keep full microsecond precision so rows sharing a millisecond are not skipped
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f'Cannot store {type(value).__name__} in a cursor')
+
+def encode_cursor(values):
+    data = json.dumps(values, default=_encode_value, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+def cursor_int(value):
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ValueError(f'{value!r} is not an integer')
+    return value
+
+def cursor_float(value):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f'{value!r} is not a number')
+    return float(value)
+
+def cursor_str(value):
+    if not isinstance(value, str):
+        raise ValueError(f'{value!r} is not a string')
+    return value
+
+def cursor_datetime(value):
+    parsed = parse_datetime(cursor_str(value))
+    if parsed is None:
+        raise ValueError(f'{value!r} is not a datetime')
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+def cursor_date(value):
+    return date.fromisoformat(cursor_str(value))
+
+def cursor_parser(field):
+    """Return the function checking a cursor value stored for a model field"""
+    if isinstance(field, models.DateTimeField):
+        return cursor_datetime
+    if isinstance(field, models.DateField):
+        return cursor_date
+    if isinstance(field, (models.IntegerField, models.AutoField)):
+        return cursor_int
+    if isinstance(field, models.FloatField):
+        return cursor_float
+    if isinstance(field, (models.CharField, models.TextField)):
+        return cursor_str
+    raise TypeError(f'Cannot page on {type(field).__name__}')
+
+def decode_cursor(cursor, parsers):
+    """
+    Return the values stored in a cursor, each checked by the matching
+    function of ``parsers``, or None if the cursor is not valid
+    """
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError):
+        return None
+    if not isinstance(values, list) or len(values) != len(parsers):
+        return None
+    try:
+        return [parse(value) for parse, value in zip(parsers, values)]
+    except (TypeError, ValueError):
+        # A crafted cursor would otherwise fail in the query
+        return None
+
+def keyset_filter(ordering, values):
+    """
+    Build the condition selecting rows after ``values`` in ``ordering``,
+    e.g. ('name', 'id') gives name > x OR (name = x AND id > y).
+    """
+    condition = Q()
+    for position in reversed(range(len(ordering))):
+        field = ordering[position].lstrip('-')
+        lookup = 'lt' if ordering[position].startswith('-') else 'gt'
+        after = Q(**{f'{field}__{lookup}': values[position]})
+        if position < len(ordering) - 1:
+            after |= Q(**{field: values[position]}) & condition
+        condition = after
+    return condition
+
+def _page_queryset(queryset, ordering, cursor, page_size):
+    parsers = [cursor_parser(queryset.model._meta.get_field(field.lstrip('-'))) for field in ordering]
+    values = decode_cursor(cursor, parsers)
+    if values is not None:
+        queryset = queryset.filter(keyset_filter(ordering, values))
+    # One extra row tells whether there is a next page
+    return queryset.order_by(*ordering)[:page_size + 1]
+
+def _split_page(rows, ordering, page_size):
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        next_cursor = encode_cursor([getattr(last, field.lstrip('-')) for field in ordering])
+    return rows, next_cursor
+
+def keyset_page(queryset, ordering, cursor, page_size):
+    """
+    Return one page of ``queryset`` in ``ordering`` starting after ``cursor``
+    together with the cursor of the next page (None on the last page).
+
+    The last field of ``ordering`` must be unique so every row has a
+    distinct position. Unlike OFFSET pagination, the cost of a page does not
+    grow with how deep into the results it is.
+    """
+    rows = list(_page_queryset(queryset, ordering, cursor, page_size))
+    return _split_page(rows, ordering, page_size)
+
+async def akeyset_page(queryset, ordering, cursor, page_size):
+    """Async version of keyset_page"""
+    rows = [row async for row in _page_queryset(queryset, ordering, cursor, page_size)]
+    return _split_page(rows, ordering, page_size)
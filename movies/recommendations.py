@@ -0,0 +1,107 @@
+"""
+"Recommended for you" by item-item collaborative filtering.
+
+Two movies are similar when the same users rate them above or below their
+own average (cosine of the mean-centered rating columns). Only the
+SIMILAR_COUNT most similar movies of each movie are kept. A user's score
+for a movie they have not rated is the similarity-weighted average of
+their stars for its neighbors, shrunk towards zero when few of them were
+rated.
+
+Ratings are streamed into compact NumPy arrays and every product runs a
+chunk of movies or users at a time, so memory stays bounded by the size
+of the rating matrix itself. ``manage.py build_recommendations`` stores
+the results in Recommendation.
+
+Needs NumPy and SciPy, which only the batch command imports.
+"""
+from itertools import islice
+import numpy as np
+from scipy import sparse
+from .models import Rating
+from .similarity import normalize_rows, top_neighbors
+
+RECOMMENDATION_COUNT = 8
+
+# Neighbors kept per movie
+SIMILAR_COUNT = 50
+
+# Added to the sum of similarities a score is divided by, so one lucky
+# neighbor cannot outrank many good ones
+SHRINKAGE = 1.0
+
+CHUNK_SIZE = 500
+
+def load_ratings(chunk_size=10000):
+    """Return the ratings as arrays of user ids, movie ids and stars"""
+    rows = Rating.objects.values_list('user_id', 'movie_id', 'stars').order_by().iterator(chunk_size=chunk_size)
+    chunks = []
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        chunks.append(np.array(chunk, dtype=np.int32))
+    ratings = np.concatenate(chunks) if chunks else np.empty((0, 3), dtype=np.int32)
+    return ratings[:, 0], ratings[:, 1], ratings[:, 2]
+
+def rating_matrix(user_ids, movie_ids, stars):
+    """Return the distinct user and movie ids and the users x movies star matrix"""
+    users, user_rows = np.unique(user_ids, return_inverse=True)
+    movies, movie_columns = np.unique(movie_ids, return_inverse=True)
+    matrix = sparse.csr_matrix(
+        (stars.astype(np.float32), (user_rows, movie_columns)), shape=(len(users), len(movies))
+    )
+    return users, movies, matrix
+
+def movie_similarities(matrix, count=SIMILAR_COUNT):
+    """Return a movies x movies matrix of each movie's ``count`` most similar movies"""
+    ratings_per_user = np.diff(matrix.indptr)
+    means = np.asarray(matrix.sum(axis=1)).ravel() / np.maximum(ratings_per_user, 1)
+    centered = matrix.copy()
+    centered.data -= np.repeat(means, ratings_per_user).astype(np.float32)
+    columns = normalize_rows(centered.T.tocsr())
+    columns_t = columns.T.tocsc()
+
+    rows, neighbors, scores = [], [], []
+    for start in range(0, columns.shape[0], CHUNK_SIZE):
+        products = (columns[start:start + CHUNK_SIZE] @ columns_t).tocsr()
+        for offset in range(products.shape[0]):
+            begin, end = products.indptr[offset], products.indptr[offset + 1]
+            candidates, values = products.indices[begin:end], products.data[begin:end]
+            # Only positive similarities say anything about what a user will like
+            keep = (candidates != start + offset) & (values > 0)
+            best, best_scores = top_neighbors(candidates[keep], values[keep], count)
+            rows.append(np.full(len(best), start + offset))
+            neighbors.append(best)
+            scores.append(best_scores)
+    size = columns.shape[0]
+    if not rows:
+        return sparse.csr_matrix((size, size), dtype=np.float32)
+    return sparse.csr_matrix(
+        (np.concatenate(scores), (np.concatenate(rows), np.concatenate(neighbors))), shape=(size, size)
+    )
+
+def recommend(matrix, similarities, rows, count=RECOMMENDATION_COUNT):
+    """
+    Yield ``(row, movie columns, scores)`` with the ``count`` best movies,
+    best first, for each user row of ``matrix`` in ``rows``
+    """
+    similarities_t = similarities.T.tocsr()
+    for start in range(0, len(rows), CHUNK_SIZE):
+        chunk = rows[start:start + CHUNK_SIZE]
+        ratings = matrix[chunk]
+        rated = ratings.copy()
+        rated.data[:] = 1
+        weighted = (ratings @ similarities_t).tocsr()
+        weights = (rated @ similarities_t).tocsr()
+        # Both products share the same sparsity pattern, since every star
+        # and kept similarity is positive
+        weighted.sort_indices()
+        weights.sort_indices()
+        for offset, row in enumerate(chunk):
+            begin, end = weighted.indptr[offset], weighted.indptr[offset + 1]
+            columns = weighted.indices[begin:end]
+            scores = weighted.data[begin:end] / (weights.data[begin:end] + SHRINKAGE)
+            unrated = ~np.isin(columns, ratings.indices[ratings.indptr[offset]:ratings.indptr[offset + 1]])
+            best, best_scores = top_neighbors(columns[unrated], scores[unrated], count)
+            yield row, best, best_scores
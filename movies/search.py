@@ -0,0 +1,112 @@
+"""
+Full-text search over movie names and descriptions.
+
+On SQLite the movies are mirrored into an FTS5 virtual table (created by
+migration 0010 and kept in sync by the receivers in signals.py), which gives
+prefix matching and BM25 relevance ranking without scanning the catalog.
+Other databases, or SQLite builds without FTS5, fall back to ``icontains``.
+"""
+import re
+from asgiref.sync import sync_to_async
+from django.db import connection
+from .models import Movie
+from .pagination import cursor_float, cursor_int, decode_cursor, encode_cursor
+
+FTS_TABLE = 'movies_movie_fts'
+
+# Matches in the name weigh ten times more than matches in the description
+FTS_RANK = 'bm25(10.0, 1.0)'
+
+_fts_enabled = False
+
+def fts_enabled():
+    """Return True if the FTS5 index is available on the default database"""
+    global _fts_enabled
+    if not _fts_enabled and connection.vendor == 'sqlite':
+        _fts_enabled = FTS_TABLE in connection.introspection.table_names()
+    return _fts_enabled
+
+async def afts_enabled():
+    if _fts_enabled:
+        return True
+    return await sync_to_async(fts_enabled)()
+
+def build_match_query(text):
+    """Turn free text into an FTS5 query where every word is a prefix term"""
+    terms = re.findall(r'\w+', text)
+    return ' '.join('"' + term + '"*' for term in terms)
+
+def index_movies(movies):
+    """Add or refresh movies in the search index"""
+    if not fts_enabled():
+        return
+    rows = [(movie.id, movie.name, movie.description) for movie in movies]
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(row[0],) for row in rows])
+        cursor.executemany(f'INSERT INTO {FTS_TABLE} (rowid, name, description) VALUES (%s, %s, %s)', rows)
+
+def unindex_movies(movie_ids):
+    if not fts_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(movie_id,) for movie_id in movie_ids])
+
+def rebuild_index():
+    """Re-create the index contents from the movies table, returning the row count"""
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, description) '
+            f'SELECT id, name, description FROM {Movie._meta.db_table}'
+        )
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rank) VALUES ('rank', %s)", [FTS_RANK])
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+        cursor.execute(f'SELECT COUNT(*) FROM {FTS_TABLE}')
+        return cursor.fetchone()[0]
+
+# Cursors of search pages hold the (rank, movie id) of the last match
+RANK_CURSOR = (cursor_float, cursor_int)
+
+def ranked_movie_ids(text, after=None, limit=20):
+    """
+    Return ``(movie_id, rank)`` pairs matching ``text``, best match first.
+    ``after`` is the ``(rank, movie_id)`` of the last row already seen.
+    """
+    query = build_match_query(text)
+    if not query:
+        return []
+    sql = f'SELECT rowid, rank FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s'
+    params = [query]
+    if after is not None:
+        sql += ' AND (rank > %s OR (rank = %s AND rowid > %s))'
+        params += [after[0], after[0], after[1]]
+    sql += ' ORDER BY rank, rowid LIMIT %s'
+    params.append(limit)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+def _split_ranked(ranked, page_size):
+    next_cursor = None
+    if len(ranked) > page_size:
+        ranked = ranked[:page_size]
+        movie_id, rank = ranked[-1]
+        next_cursor = encode_cursor([rank, movie_id])
+    return ranked, next_cursor
+
+def search_page(queryset, text, cursor, page_size):
+    """
+    Return one page of ``queryset`` matching ``text`` ordered by relevance,
+    and the cursor of the next page (None on the last page).
+    """
+    ranked, next_cursor = _split_ranked(ranked_movie_ids(text, decode_cursor(cursor, RANK_CURSOR), page_size + 1), page_size)
+    movies = queryset.in_bulk([movie_id for movie_id, rank in ranked])
+    return [movies[movie_id] for movie_id, rank in ranked if movie_id in movies], next_cursor
+
+async def asearch_page(queryset, text, cursor, page_size):
+    """Async version of search_page"""
+    # Django has no async raw cursor, so only the FTS lookup runs in a thread
+    ranked = await sync_to_async(ranked_movie_ids)(text, decode_cursor(cursor, RANK_CURSOR), page_size + 1)
+    ranked, next_cursor = _split_ranked(ranked, page_size)
+    movies = await queryset.ain_bulk([movie_id for movie_id, rank in ranked])
+    return [movies[movie_id] for movie_id, rank in ranked if movie_id in movies], next_cursor
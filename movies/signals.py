@@ -0,0 +1,87 @@
+from collections import Counter
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from . import search, thumbnails
+from .caching import bump_version, movie_cache_namespace
+from .models import LeaderboardBucket, Movie, Petition, Rating, Review
+
+@receiver(post_delete, sender=Rating)
+def rating_deleted(sender, instance, **kwargs):
+    stars = getattr(instance, '_saved_stars', None) or instance.stars
+    Movie.apply_rating_change(instance.movie_id, -1, -stars)
+    # Taken off the day the rating was counted on, not today
+    LeaderboardBucket.add(LeaderboardBucket.RATINGS, {instance.movie_id: (-stars, -1)}, day=instance.counted_on)
+
+def _shift_vote_counts(petition_votes, sign):
+    # Group petitions by how many votes they gain or lose so each distinct
+    # delta costs a single UPDATE
+    by_delta = {}
+    for petition_id, votes in petition_votes.items():
+        by_delta.setdefault(votes, []).append(petition_id)
+    for votes, petition_ids in by_delta.items():
+        Petition.objects.filter(id__in=petition_ids).update(vote_count=F('vote_count') + sign * votes)
+    LeaderboardBucket.add(LeaderboardBucket.PETITIONS, {
+        petition_id: (0, sign * votes) for petition_id, votes in petition_votes.items()
+    })
+
+@receiver(m2m_changed, sender=Petition.votes.through)
+def petition_votes_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'post_add':
+        # pk_set only holds the votes that were actually added
+        if reverse:
+            _shift_vote_counts(Counter(pk_set), 1)
+        else:
+            _shift_vote_counts({instance.pk: len(pk_set)}, 1)
+    elif action in ('pre_remove', 'pre_clear'):
+        # pk_set may name votes that do not exist, so look up the rows that
+        # are about to go before they are deleted
+        rows = sender.objects.filter(**{'user_id' if reverse else 'petition_id': instance.pk})
+        if action == 'pre_remove':
+            rows = rows.filter(**{'petition_id__in' if reverse else 'user_id__in': pk_set})
+        instance._removed_petition_votes = Counter(rows.values_list('petition_id', flat=True))
+    elif action in ('post_remove', 'post_clear'):
+        _shift_vote_counts(instance.__dict__.pop('_removed_petition_votes', {}), -1)
+
+@receiver(pre_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    # Cascading deletes of the vote rows do not send m2m_changed
+    _shift_vote_counts(Counter(Petition.objects.filter(votes=instance).values_list('id', flat=True)), -1)
+
+@receiver(post_save, sender=Movie)
+def movie_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or {'name', 'description'} & set(update_fields):
+        search.index_movies([instance])
+
+@receiver(post_save, sender=Movie)
+def movie_image_saved(sender, instance, **kwargs):
+    if getattr(instance, '_image_changed', False) and instance.image_hash:
+        name, image_hash = instance.image.name, instance.image_hash
+        transaction.on_commit(lambda: thumbnails.generate_thumbnails(name, image_hash))
+
+@receiver(post_delete, sender=Movie)
+def movie_deleted(sender, instance, **kwargs):
+    search.unindex_movies([instance.id])
+    LeaderboardBucket.objects.exclude(board=LeaderboardBucket.PETITIONS).filter(item_id=instance.id).delete()
+
+@receiver(post_delete, sender=Petition)
+def petition_deleted(sender, instance, **kwargs):
+    LeaderboardBucket.objects.filter(board=LeaderboardBucket.PETITIONS, item_id=instance.id).delete()
+
+@receiver(post_save, sender=Movie)
+@receiver(post_delete, sender=Movie)
+def invalidate_movie_page(sender, instance, **kwargs):
+    # Wait for the commit so a concurrent request cannot cache the old rows
+    # under the new version
+    namespace = movie_cache_namespace(instance.id)
+    transaction.on_commit(lambda: bump_version(namespace))
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+@receiver(post_save, sender=Rating)
+@receiver(post_delete, sender=Rating)
+def invalidate_movie_page_of(sender, instance, **kwargs):
+    namespace = movie_cache_namespace(instance.movie_id)
+    transaction.on_commit(lambda: bump_version(namespace))
@@ -0,0 +1,150 @@
+"""
+Similar movie recommendations.
+
+Two movies are similar when their descriptions share distinctive words
+(cosine of TF-IDF vectors) and when they are bought in the same orders
+(cosine of their order vectors). The two scores are blended with
+CO_PURCHASE_WEIGHT. The top NEIGHBOR_COUNT movies of each movie are found
+with sparse matrix products, a chunk of movies at a time.
+``manage.py build_similar_movies`` stores them in SimilarMovie.
+
+Newly added movies can be scored on their own. Similarity is symmetric, so
+their rows also show which existing neighbor lists they belong to, and the
+rest of the catalog is never multiplied again.
+
+Needs NumPy and SciPy, which only the batch command imports.
+"""
+import re
+from collections import Counter, defaultdict
+import numpy as np
+from scipy import sparse
+from cart.models import Item
+from .models import Movie
+
+NEIGHBOR_COUNT = 8
+
+# Share of the score that comes from co-purchases, the rest from descriptions
+CO_PURCHASE_WEIGHT = 0.5
+
+# Movies scored per matrix product; bounds the memory used by a product
+CHUNK_SIZE = 500
+
+STOP_WORDS = frozenset((
+    'a an and are as at be but by for from has have he her his in into is it its of on or '
+    'she that the their them they this to was were when where which while who will with'
+).split())
+
+_WORD = re.compile(r'[a-z0-9]{2,}')
+
+def tokenize(text):
+    return [word for word in _WORD.findall(text.lower()) if word not in STOP_WORDS]
+
+def normalize_rows(matrix):
+    """Scale every row of a sparse matrix to unit length, leaving empty rows empty"""
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return sparse.csr_matrix(sparse.diags(1 / norms) @ matrix)
+
+def tfidf_matrix(documents):
+    """Return the normalized TF-IDF vectors (documents x terms) of some texts"""
+    vocabulary = {}
+    rows, columns, counts = [], [], []
+    for row, text in enumerate(documents):
+        for word, count in Counter(tokenize(text)).items():
+            rows.append(row)
+            columns.append(vocabulary.setdefault(word, len(vocabulary)))
+            counts.append(count)
+    matrix = sparse.csr_matrix(
+        (np.asarray(counts, dtype=np.float64), (rows, columns)), shape=(len(documents), len(vocabulary))
+    )
+    # Sublinear term frequency and smoothed inverse document frequency
+    matrix.data = 1 + np.log(matrix.data)
+    document_frequency = np.bincount(matrix.indices, minlength=len(vocabulary))
+    idf = np.log((1 + len(documents)) / (1 + document_frequency)) + 1
+    return normalize_rows(matrix @ sparse.diags(idf))
+
+def purchase_matrix(position):
+    """Return the normalized order vectors (movies x orders) of the movies in ``position``"""
+    orders = {}
+    rows, columns = [], []
+    pairs = Item.objects.values_list('movie_id', 'order_id').distinct().order_by()
+    for movie_id, order_id in pairs.iterator(chunk_size=10000):
+        if movie_id in position:
+            rows.append(position[movie_id])
+            columns.append(orders.setdefault(order_id, len(orders)))
+    matrix = sparse.csr_matrix(
+        (np.ones(len(rows)), (rows, columns)), shape=(len(position), len(orders))
+    )
+    return normalize_rows(matrix)
+
+def load_vectors():
+    """Return the ids of every movie with their description and order vectors"""
+    movies = list(Movie.objects.order_by('id').values_list('id', 'description'))
+    ids = np.array([movie_id for movie_id, _ in movies], dtype=np.int64)
+    position = {movie_id: row for row, (movie_id, _) in enumerate(movies)}
+    return ids, tfidf_matrix([description for _, description in movies]), purchase_matrix(position)
+
+def score_rows(descriptions, purchases, rows):
+    """
+    Yield ``(row, columns, scores)`` with the non-zero similarities of each
+    movie in ``rows`` to every other movie
+    """
+    text_weight = 1 - CO_PURCHASE_WEIGHT
+    descriptions_t = descriptions.T.tocsc()
+    purchases_t = purchases.T.tocsc()
+    for start in range(0, len(rows), CHUNK_SIZE):
+        chunk = rows[start:start + CHUNK_SIZE]
+        scores = (
+            text_weight * (descriptions[chunk] @ descriptions_t)
+            + CO_PURCHASE_WEIGHT * (purchases[chunk] @ purchases_t)
+        ).tocsr()
+        for offset, row in enumerate(chunk):
+            begin, end = scores.indptr[offset], scores.indptr[offset + 1]
+            columns, values = scores.indices[begin:end], scores.data[begin:end]
+            keep = (columns != row) & (values > 0)
+            yield row, columns[keep], values[keep]
+
+def top_neighbors(columns, scores, count):
+    """Return the positions of the ``count`` best scores, best first"""
+    if len(scores) > count:
+        best = np.argpartition(-scores, count)[:count]
+        columns, scores = columns[best], scores[best]
+    # Break ties by column so rebuilds are stable
+    order = np.lexsort((columns, -scores))
+    return columns[order], scores[order]
+
+def compute_neighbors(movie_ids=None, existing=None, count=NEIGHBOR_COUNT):
+    """
+    Return ``{movie id: [(neighbor id, score), ...]}`` with the best
+    neighbors of ``movie_ids``, or of every movie if it is None.
+
+    ``existing`` maps the other movies to their current neighbor lists. Those
+    lists that one of ``movie_ids`` now belongs in are returned as well, so
+    that movies can be added without scoring the whole catalog again.
+    """
+    ids, descriptions, purchases = load_vectors()
+    if movie_ids is None:
+        rows = list(range(len(ids)))
+    else:
+        rows = sorted(int(row) for row in np.flatnonzero(np.isin(ids, list(movie_ids))))
+    scored = set(ids[rows].tolist())
+
+    neighbors = {}
+    candidates = defaultdict(list)
+    for row, columns, scores in score_rows(descriptions, purchases, rows):
+        best_columns, best_scores = top_neighbors(columns, scores, count)
+        movie_id = int(ids[row])
+        neighbors[movie_id] = list(zip(ids[best_columns].tolist(), best_scores.tolist()))
+        if existing is not None:
+            for other_id, score in zip(ids[columns].tolist(), scores.tolist()):
+                if other_id not in scored:
+                    candidates[other_id].append((movie_id, score))
+
+    for movie_id, entries in candidates.items():
+        current = existing.get(movie_id, [])
+        if len(current) >= count and max(score for _, score in entries) <= current[-1][1]:
+            continue
+        merged = sorted(current + entries, key=lambda entry: (-entry[1], entry[0]))[:count]
+        if merged != current:
+            neighbors[movie_id] = merged
+    return neighbors
@@ -0,0 +1,21 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+from movies.thumbnails import thumbnail_srcsets
+
+register = template.Library()
+
+@register.simple_tag
+def movie_picture(movie, height, css_class='', loading='lazy'):
+    """
+    Render a movie image as a <picture> of thumbnails for ``height`` pixels,
+    in WebP with a JPEG fallback, at 1x and 2x density
+    """
+    srcsets = thumbnail_srcsets(movie, int(height))
+    if not srcsets:
+        return format_html('<img src="{}" class="{}" alt="{}">', movie.image.url, css_class, movie.name)
+    *sources, (_, fallback) = srcsets
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" class="{}" alt="{}" loading="{}"></picture>',
+        format_html_join('', '<source type="{}" srcset="{}">', sources),
+        fallback.split(' ', 1)[0], fallback, css_class, movie.name, loading,
+    )
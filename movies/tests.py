@@ -1,3 +1,666 @@
-from django.test import TestCase
+import json
+import shutil
+import tempfile
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
+from PIL import Image
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from cart.models import Order, Item
+from cart.services import place_order
+from cart.utils import record_state_sales
+from . import leaderboards, search, thumbnails
+from .caching import cache_stats, get_cache
+from .models import LeaderboardBucket, Movie, MovieImport, Petition, Rating, Recommendation, Review, SimilarMovie
+from .pagination import encode_cursor
+from .views import catalog_page
 
-# Create your tests here.
+class TrendingMoviesApiTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='buyer', password='secret-pass')
+        self.movie = Movie.objects.create(name='Inception', price=12, description='Dreams', image='movie_images/a.jpg')
+        self.other = Movie.objects.create(name='Heat', price=8, description='Heist', image='movie_images/b.jpg')
+        get_cache().clear()
+
+    def test_most_popular_movie_per_state(self):
+        order = Order.objects.create(user=self.user, total=0, state='Texas')
+        record_state_sales(order, [
+            Item(order=order, movie=self.movie, price=12, quantity=1),
+            Item(order=order, movie=self.other, price=8, quantity=4),
+        ])
+
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('movies.trending_movies_api'))
+
+        data = response.json()['data']
+        self.assertEqual(data['Texas'], {'movie': 'Heat', 'purchases': 4, 'trending': True})
+        self.assertEqual(data['Ohio']['movie'], 'No purchases')
+        self.assertEqual(len(data), 50)
+
+    def test_response_is_cached_until_next_order(self):
+        url = reverse('movies.trending_movies_api')
+        first = self.client.get(url)
+        etag = first['ETag']
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).content, first.content)
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.client.force_login(self.user)
+        self.client.post(reverse('cart.add', args=[self.movie.id]), {'quantity': '1'})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('cart.purchase'), {'state': 'Ohio', 'city': 'Columbus'})
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data']['Ohio']['movie'], 'Inception')
+
+class RatingCounterTests(TestCase):
+    def setUp(self):
+        self.movie = Movie.objects.create(name='Inception', price=12, description='Dreams', image='movie_images/a.jpg')
+        self.alice = User.objects.create_user(username='alice', password='secret-pass')
+        self.bob = User.objects.create_user(username='bob', password='secret-pass')
+
+    def assertCounters(self, count, total, average):
+        self.movie.refresh_from_db()
+        self.assertEqual((self.movie.rating_count, self.movie.rating_sum), (count, total))
+        self.assertEqual(self.movie.average_rating, average)
+
+    def test_counters_follow_insert_change_and_delete(self):
+        Rating.objects.create(movie=self.movie, user=self.alice, stars=4)
+        Rating.objects.create(movie=self.movie, user=self.bob, stars=1)
+        self.assertCounters(2, 5, 2.5)
+
+        Rating.objects.update_or_create(movie=self.movie, user=self.bob, defaults={'stars': 5})
+        self.assertCounters(2, 9, 4.5)
+
+        Rating.objects.filter(user=self.alice).delete()
+        self.assertCounters(1, 5, 5.0)
+
+        self.bob.delete()
+        self.assertCounters(0, 0, None)
+
+    def test_saving_a_stale_movie_keeps_the_counters(self):
+        stale = Movie.objects.get(id=self.movie.id)
+        Rating.objects.create(movie=self.movie, user=self.alice, stars=4)
+        stale.name = 'Inception (2010)'
+        stale.save()
+        self.assertCounters(1, 4, 4.0)
+        self.assertEqual(self.movie.name, 'Inception (2010)')
+
+    def test_reconcile_ratings_repairs_drift(self):
+        Rating.objects.create(movie=self.movie, user=self.alice, stars=3)
+        Movie.objects.filter(id=self.movie.id).update(rating_count=7, rating_sum=2)
+
+        with self.assertRaises(CommandError):
+            call_command('reconcile_ratings', '--check', stdout=StringIO())
+        call_command('reconcile_ratings', stdout=StringIO())
+
+        self.assertCounters(1, 3, 3.0)
+
+class PetitionVoteTests(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create_user(username=f'user{i}', password='secret-pass') for i in range(3)]
+        self.petitions = [
+            Petition.objects.create(movie_title=f'Movie {i}', description='Please', created_by=self.users[0])
+            for i in range(4)
+        ]
+
+    def vote_counts(self):
+        return list(Petition.objects.order_by('id').values_list('vote_count', flat=True))
+
+    def test_vote_count_follows_votes(self):
+        first, second = self.petitions[:2]
+        first.votes.add(self.users[0], self.users[1])
+        first.votes.add(self.users[1])
+        self.users[2].petition_votes.add(first, second)
+        self.assertEqual(self.vote_counts(), [3, 1, 0, 0])
+
+        first.votes.remove(self.users[0], self.users[0])
+        self.users[2].petition_votes.remove(second, self.petitions[3])
+        self.assertEqual(self.vote_counts(), [2, 0, 0, 0])
+
+        self.users[1].delete()
+        first.votes.clear()
+        self.assertEqual(self.vote_counts(), [0, 0, 0, 0])
+
+    def test_saving_a_stale_petition_keeps_the_vote_count(self):
+        stale = Petition.objects.get(id=self.petitions[0].id)
+        stale.votes.add(self.users[1])
+        stale.description = 'Pretty please'
+        stale.save()
+        self.assertEqual(self.vote_counts()[0], 1)
+
+    def test_vote_petition_view_toggles_vote(self):
+        self.client.force_login(self.users[1])
+        url = reverse('movies.vote_petition', args=[self.petitions[0].id])
+        self.client.get(url)
+        self.assertEqual(self.vote_counts()[0], 1)
+        self.client.get(url)
+        self.assertEqual(self.vote_counts()[0], 0)
+
+    def test_petitions_page_query_count_is_constant(self):
+        for petition in self.petitions:
+            petition.votes.add(self.users[1])
+        self.client.force_login(self.users[1])
+
+        # User, petitions and the user's votes; the session comes from the cache
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('movies.petitions'))
+        self.assertContains(response, 'Remove Vote', count=4)
+
+class CatalogPaginationTests(TestCase):
+    def setUp(self):
+        # Duplicate names make sure the id tie-breaker is honoured
+        for name in ['Alien', 'Heat', 'Heat', 'Up', 'Jaws'] * 11:
+            Movie.objects.create(name=name, price=5, description='Long text', image='movie_images/a.jpg')
+
+    def test_pages_walk_the_whole_catalog_in_order(self):
+        seen = []
+        movies, cursor = catalog_page('', None)
+        seen.extend(movies)
+        while cursor:
+            movies, cursor = catalog_page('', cursor)
+            seen.extend(movies)
+
+        self.assertEqual([movie.id for movie in seen], list(Movie.objects.order_by('name', 'id').values_list('id', flat=True)))
+        self.assertNotIn('description', seen[0].__dict__)
+
+    def test_fragment_endpoint_continues_a_search(self):
+        response = self.client.get(reverse('movies.index'), {'search': 'heat'})
+        self.assertEqual(len(response.context['template_data']['movies']), 22)
+        self.assertIsNone(response.context['template_data']['next_cursor'])
+
+        response = self.client.get(reverse('movies.index'))
+        cursor = response.context['template_data']['next_cursor']
+        result = self.client.get(reverse('movies.page'), {'cursor': cursor}).json()
+        self.assertIn('Heat', result['html'])
+        self.assertIsNotNone(result['next_cursor'])
+
+    def test_invalid_cursor_starts_from_the_beginning(self):
+        movies, _ = catalog_page('', 'not-a-cursor')
+        self.assertEqual(movies[0].name, 'Alien')
+
+    def test_cursor_with_mistyped_values_starts_from_the_beginning(self):
+        for values in (['a', 'x'], [1, 2], ['a', True], ['a', None]):
+            with self.subTest(values=values):
+                cursor = encode_cursor(values)
+                response = self.client.get(reverse('movies.index'), {'cursor': cursor})
+                self.assertEqual(response.context['template_data']['movies'][0].name, 'Alien')
+                self.assertEqual(self.client.get(reverse('movies.page'), {'cursor': cursor}).status_code, 200)
+        response = self.client.get(reverse('movies.index'), {'search': 'alien', 'cursor': encode_cursor(['x', 1])})
+        self.assertEqual(response.status_code, 200)
+
+class MovieSearchTests(TestCase):
+    def setUp(self):
+        self.inception = Movie.objects.create(name='Inception', price=5, description='A thief enters dreams', image='movie_images/a.jpg')
+        self.heat = Movie.objects.create(name='Heat', price=5, description='An incredible heist', image='movie_images/a.jpg')
+        self.up = Movie.objects.create(name='Up', price=5, description='A flying house', image='movie_images/a.jpg')
+
+    def test_prefix_search_ranks_name_matches_first(self):
+        movies, _ = catalog_page('inc', None)
+        self.assertEqual(movies, [self.inception, self.heat])
+
+        movies, _ = catalog_page('dream', None)
+        self.assertEqual(movies, [self.inception])
+
+    def test_index_follows_movie_changes(self):
+        self.up.name = 'Upside'
+        self.up.save()
+        self.heat.delete()
+
+        self.assertEqual(catalog_page('upsi', None)[0], [self.up])
+        self.assertEqual(catalog_page('heist', None)[0], [])
+
+    def test_ranked_results_paginate(self):
+        for i in range(30):
+            Movie.objects.create(name=f'Dream {i}', price=5, description='', image='movie_images/a.jpg')
+        call_command('rebuild_search_index', stdout=StringIO())
+
+        first, cursor = catalog_page('dream', None)
+        second, cursor = catalog_page('dream', cursor)
+        self.assertIsNone(cursor)
+        self.assertEqual(len(first) + len(second), 31)
+        self.assertEqual(second[-1], self.inception)
+
+    def test_typeahead(self):
+        response = self.client.get(reverse('movies.typeahead'), {'q': 'he'})
+        self.assertEqual(response.json()['results'], [
+            {'id': self.heat.id, 'name': 'Heat', 'url': reverse('movies.show', args=[self.heat.id])},
+        ])
+
+class MoviePageCacheTests(TestCase):
+    def setUp(self):
+        self.movie = Movie.objects.create(name='Inception', price=12, description='Dreams', image='movie_images/a.jpg')
+        self.user = User.objects.create_user(username='critic', password='secret-pass')
+        Review.objects.create(movie=self.movie, user=self.user, comment='Great')
+        get_cache().clear()
+
+    def test_repeat_views_are_served_from_cache(self):
+        url = reverse('movies.show', args=[self.movie.id])
+        hits = cache_stats['show']['hits']
+        self.client.get(url)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertContains(response, 'Review by critic')
+        self.assertEqual(cache_stats['show']['hits'], hits + 1)
+
+    def test_reviews_and_ratings_invalidate_the_page(self):
+        url = reverse('movies.show', args=[self.movie.id])
+        self.client.get(url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(movie=self.movie, user=self.user, comment='Even better the second time')
+        self.assertContains(self.client.get(url), 'Even better the second time')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Rating.objects.create(movie=self.movie, user=self.user, stars=4)
+        self.assertContains(self.client.get(url), '(4.0/5.0)')
+
+    def test_per_user_rating_is_rendered_live(self):
+        Rating.objects.create(movie=self.movie, user=self.user, stars=2)
+        self.client.get(reverse('movies.show', args=[self.movie.id]))
+        self.client.force_login(self.user)
+
+        response = self.client.get(reverse('movies.show', args=[self.movie.id]))
+        self.assertEqual(response.context['template_data']['current_user_rating'].stars, 2)
+        self.assertContains(response, 'Update Rating')
+
+class ReviewFeedTests(TestCase):
+    def setUp(self):
+        self.movie = Movie.objects.create(name='Inception', price=12, description='Dreams', image='movie_images/a.jpg')
+        self.users = [User.objects.create_user(username=f'critic{i}', password='secret-pass') for i in range(3)]
+        for i in range(25):
+            Review.objects.create(movie=self.movie, user=self.users[i % 3], comment=f'Review {i}')
+        get_cache().clear()
+
+    def test_show_page_renders_only_the_newest_reviews(self):
+        response = self.client.get(reverse('movies.show', args=[self.movie.id]))
+        reviews = response.context['template_data']['reviews']
+        self.assertEqual([review.comment for review in reviews], [f'Review {i}' for i in range(24, 14, -1)])
+        self.assertContains(response, 'More reviews')
+
+    def test_feed_ignores_mistyped_cursors(self):
+        url = reverse('movies.reviews', args=[self.movie.id])
+        for values in (['not-a-date', 'x'], [1, 'x'], ['2024-13-40T00:00:00', 1], ['2024-01-01T00:00:00+00:00', '1']):
+            with self.subTest(values=values):
+                result = self.client.get(url, {'cursor': encode_cursor(values)}).json()
+                self.assertEqual(result['reviews'][0]['comment'], 'Review 24')
+
+    def test_feed_streams_the_remaining_reviews(self):
+        response = self.client.get(reverse('movies.show', args=[self.movie.id]))
+        cursor = response.context['template_data']['reviews_cursor']
+        comments = []
+        while cursor:
+            with self.assertNumQueries(1):
+                result = self.client.get(reverse('movies.reviews', args=[self.movie.id]), {'cursor': cursor}).json()
+            comments += [review['comment'] for review in result['reviews']]
+            cursor = result['next_cursor']
+
+        self.assertEqual(comments, [f'Review {i}' for i in range(14, -1, -1)])
+        self.assertEqual(set(result['reviews'][0]), {'id', 'user_id', 'user', 'comment', 'date'})
+
+    def test_feed_of_unknown_movie_is_404(self):
+        self.assertEqual(self.client.get(reverse('movies.reviews', args=[999])).status_code, 404)
+
+class AsyncEndpointTests(TestCase):
+    def setUp(self):
+        self.movie = Movie.objects.create(name='Night Train', price=10, description='Rails', image='movie_images/a.jpg')
+        user = User.objects.create_user(username='critic', password='secret-pass')
+        Review.objects.create(movie=self.movie, user=user, comment='Great')
+        order = Order.objects.create(user=user, state='Texas', total=10)
+        items = [Item.objects.create(order=order, movie=self.movie, price=10, quantity=2)]
+        record_state_sales(order, items)
+        get_cache().clear()
+
+    async def test_read_endpoints_are_served_through_the_asgi_handler(self):
+        response = await self.async_client.get(reverse('movies.trending_movies_api'))
+        self.assertEqual(response.json()['data']['Texas']['movie'], 'Night Train')
+        self.assertIn('Server-Timing', response)
+        response = await self.async_client.get(
+            reverse('movies.trending_movies_api'), headers={'If-None-Match': response['ETag']},
+        )
+        self.assertEqual(response.status_code, 304)
+
+        response = await self.async_client.get(reverse('movies.typeahead'), {'q': 'nig'})
+        self.assertEqual([movie['name'] for movie in response.json()['results']], ['Night Train'])
+
+        response = await self.async_client.get(reverse('movies.reviews', args=[self.movie.id]))
+        self.assertEqual([review['comment'] for review in response.json()['reviews']], ['Great'])
+
+        response = await self.async_client.get(reverse('movies.page'), {'search': 'night'})
+        self.assertIn('Night Train', response.json()['html'])
+
+class ThumbnailTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        thumbnails._existing.clear()
+        thumbnails._missing.clear()
+
+    def upload(self, name, color='red'):
+        output = BytesIO()
+        Image.new('RGB', (600, 900), color).save(output, 'PNG')
+        with self.captureOnCommitCallbacks(execute=True):
+            return Movie.objects.create(
+                name=name, price=10, description='', image=SimpleUploadedFile(f'{name}.png', output.getvalue()),
+            )
+
+    def test_uploads_get_content_hashed_thumbnails(self):
+        movie = self.upload('Heat')
+
+        self.assertEqual(len(movie.image_hash), 16)
+        for height in thumbnails.THUMBNAIL_HEIGHTS:
+            with default_storage.open(thumbnails.thumbnail_name(movie.image_hash, height, 'webp')) as thumbnail:
+                self.assertEqual(Image.open(thumbnail).size, (round(height * 2 / 3), height))
+
+        # The same picture uploaded again shares the thumbnails
+        self.assertEqual(self.upload('Heat again').image_hash, movie.image_hash)
+        self.assertEqual(len(default_storage.listdir(thumbnails.THUMBNAIL_DIR)[1]), 6)
+
+    def test_pages_emit_srcsets_and_show_the_original_until_thumbnails_exist(self):
+        movie = self.upload('Heat')
+        response = self.client.get(reverse('movies.index'))
+        self.assertContains(response, f'<source type="image/webp" srcset="/media/thumbnails/{movie.image_hash}-200.webp 1x, '
+                                      f'/media/thumbnails/{movie.image_hash}-400.webp 2x">')
+
+        shutil.rmtree(default_storage.path(thumbnails.THUMBNAIL_DIR))
+        thumbnails._existing.clear()
+        response = self.client.get(reverse('movies.index'))
+        self.assertContains(response, f'<img src="{movie.image.url}"')
+        self.assertNotContains(response, '/media/thumbnails/')
+        # Rendering never writes thumbnails; the command does
+        self.assertFalse(default_storage.exists(thumbnails.thumbnail_name(movie.image_hash, 200, 'webp')))
+        # and the missing ones are not looked for again on every render
+        with mock.patch.object(default_storage, 'exists') as exists:
+            self.client.get(reverse('movies.index'))
+        exists.assert_not_called()
+
+        call_command('generate_thumbnails', workers=1, stdout=StringIO())
+        with mock.patch.object(thumbnails, 'MISSING_RECHECK_SECONDS', 0):
+            response = self.client.get(reverse('movies.show', args=[movie.id]))
+        self.assertContains(response, f'/media/thumbnails/{movie.image_hash}-800.jpg 2x')
+
+    def test_command_hashes_and_generates_the_catalog(self):
+        movie = self.upload('Heat', color='blue')
+        Movie.objects.filter(id=movie.id).update(image_hash='')
+        shutil.rmtree(default_storage.path(thumbnails.THUMBNAIL_DIR))
+        Movie.objects.create(name='Missing', price=10, description='', image='movie_images/missing.png')
+
+        output = StringIO()
+        call_command('generate_thumbnails', workers=1, stdout=output, stderr=StringIO())
+
+        self.assertIn('6 thumbnails generated for 1 images (1 newly hashed, 1 failed).', output.getvalue())
+        self.assertEqual(Movie.objects.get(id=movie.id).image_hash, movie.image_hash)
+
+class LeaderboardTests(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create_user(username=f'user{i}', password='secret-pass') for i in range(3)]
+        self.movie = Movie.objects.create(name='Inception', price=12, description='Dreams', image='movie_images/a.jpg')
+        self.other = Movie.objects.create(name='Heat', price=8, description='Heist', image='movie_images/b.jpg')
+        self.petition = Petition.objects.create(movie_title='Alien', description='Please', created_by=self.users[0])
+        get_cache().clear()
+        leaderboards.clear()
+
+    def board(self, name, window='all'):
+        return [(entry['name'], entry['score'], entry['count']) for entry in leaderboards.build(name, window)]
+
+    def test_boards_follow_purchases_ratings_and_votes(self):
+        place_order(self.users[0], {self.movie.id: 1, self.other.id: 3}, 'Texas')
+        place_order(self.users[1], {self.movie.id: 1}, 'Ohio')
+        self.assertEqual(self.board('top_sellers'), [('Heat', 3, 3), ('Inception', 2, 2)])
+        self.assertEqual(self.board('top_revenue'), [('Heat', 24, 3), ('Inception', 24, 2)])
+
+        for user, stars in zip(self.users, (5, 4, 2)):
+            Rating.objects.create(movie=self.movie, user=user, stars=stars)
+        Rating.objects.create(movie=self.other, user=self.users[0], stars=5)
+        self.assertEqual(self.board('top_rated'), [('Inception', 3.67, 3)])
+        Rating.objects.filter(movie=self.movie, user=self.users[2]).update(stars=2)
+        Rating.objects.update_or_create(movie=self.movie, user=self.users[2], defaults={'stars': 5})
+        self.assertEqual(self.board('top_rated'), [('Inception', 4.67, 3)])
+        Rating.objects.filter(movie=self.movie, user=self.users[0]).delete()
+        self.assertEqual(self.board('top_rated'), [])
+
+        self.petition.votes.add(*self.users)
+        self.users[1].delete()
+        self.assertEqual(self.board('most_petitioned'), [('Alien', 2, 2)])
+        self.petition.votes.clear()
+        self.assertEqual(self.board('most_petitioned'), [])
+
+        self.other.delete()
+        self.assertEqual(self.board('top_sellers'), [('Inception', 2, 2)])
+
+    def test_windows_sum_day_buckets(self):
+        today = timezone.localdate()
+        LeaderboardBucket.add(LeaderboardBucket.SALES, {self.movie.id: (12, 1)}, day=today - timedelta(days=10))
+        LeaderboardBucket.add(LeaderboardBucket.SALES, {self.other.id: (16, 2)}, day=today - timedelta(days=1))
+        self.assertEqual(self.board('top_sellers', '7d'), [('Heat', 2, 2)])
+        self.assertEqual(self.board('top_sellers', '30d'), [('Heat', 2, 2), ('Inception', 1, 1)])
+        self.assertEqual(self.board('top_sellers', 'all'), [('Heat', 2, 2), ('Inception', 1, 1)])
+
+    def test_rescoring_an_old_rating_moves_it_to_the_current_window(self):
+        for user in self.users:
+            Rating.objects.create(movie=self.movie, user=user, stars=2)
+        month_ago = timezone.now() - timedelta(days=40)
+        Rating.objects.update(updated_at=month_ago)
+        call_command('rebuild_leaderboards', stdout=StringIO())
+        self.assertEqual(self.board('top_rated', '30d'), [])
+
+        for user, stars in zip(self.users, (4, 5, 5)):
+            Rating.objects.update_or_create(movie=self.movie, user=user, defaults={'stars': stars})
+        self.assertEqual(self.board('top_rated', '7d'), [('Inception', 4.67, 3)])
+        self.assertEqual(self.board('top_rated'), [('Inception', 4.67, 3)])
+
+        Rating.objects.filter(user=self.users[0]).delete()
+        self.assertEqual(set(LeaderboardBucket.objects.filter(board=LeaderboardBucket.RATINGS).values_list(
+            'day', 'value', 'count'
+        )), {
+            (timezone.localdate(month_ago), 0, 0), (timezone.localdate(), 10, 2), (LeaderboardBucket.ALL_TIME, 10, 2),
+        })
+
+    def test_reads_are_served_from_memory_until_the_board_is_old(self):
+        place_order(self.users[0], {self.movie.id: 1}, 'Texas')
+        self.assertEqual(len(leaderboards.top('top_sellers')), 1)
+        with self.assertNumQueries(0):
+            leaderboards.top('top_sellers')
+
+        # Changes show up once the board is REFRESH_SECONDS old, not before
+        LeaderboardBucket.add(LeaderboardBucket.SALES, {self.other.id: (16, 2)})
+        self.assertEqual(len(leaderboards.top('top_sellers')), 1)
+        with mock.patch.object(leaderboards, 'REFRESH_SECONDS', 0):
+            self.assertEqual([entry['name'] for entry in leaderboards.top('top_sellers')], ['Heat', 'Inception'])
+
+        with self.assertRaises(KeyError):
+            leaderboards.top('top_sellers', '365d')
+
+    def test_rebuild_matches_incremental_buckets(self):
+        place_order(self.users[0], {self.movie.id: 2, self.other.id: 1}, 'Texas')
+        Rating.objects.create(movie=self.movie, user=self.users[0], stars=4)
+        self.petition.votes.add(self.users[0])
+        expected = set(LeaderboardBucket.objects.values_list('board', 'day', 'item_id', 'value', 'count'))
+
+        LeaderboardBucket.objects.filter(day=LeaderboardBucket.ALL_TIME).update(value=0, count=0)
+        call_command('rebuild_leaderboards', stdout=StringIO())
+        self.assertEqual(set(LeaderboardBucket.objects.values_list('board', 'day', 'item_id', 'value', 'count')), expected)
+
+    def test_leaderboard_page_and_api(self):
+        place_order(self.users[0], {self.movie.id: 1}, 'Texas')
+        response = self.client.get(reverse('movies.leaderboards'), {'window': '7d'})
+        self.assertContains(response, 'Inception', count=2)
+
+        response = self.client.get(reverse('movies.leaderboard_api', args=['top_revenue']), {'window': '30d'})
+        self.assertEqual(response.json()['entries'], [{'id': self.movie.id, 'name': 'Inception', 'score': 12, 'count': 1}])
+        self.assertEqual(self.client.get(reverse('movies.leaderboard_api', args=['worst'])).status_code, 404)
+
+class SimilarMovieTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='buyer', password='secret-pass')
+        descriptions = {
+            'Alien': 'A crew of space miners is hunted by a deadly alien creature',
+            'Aliens': 'Space marines fight a colony of deadly alien creatures',
+            'Heat': 'A detective hunts a crew of professional bank robbers in Los Angeles',
+            'Ronin': 'Mercenaries chase a briefcase through France in car chases',
+        }
+        self.movies = {
+            name: Movie.objects.create(name=name, price=10, description=description, image='movie_images/a.jpg')
+            for name, description in descriptions.items()
+        }
+
+    def neighbors(self, name):
+        return list(SimilarMovie.objects.filter(movie=self.movies[name]).order_by('rank').values_list(
+            'neighbor__name', flat=True
+        ))
+
+    def test_neighbors_blend_descriptions_and_co_purchases(self):
+        call_command('build_similar_movies', '--full', stdout=StringIO())
+        self.assertEqual(self.neighbors('Alien')[0], 'Aliens')
+        self.assertNotIn('Ronin', self.neighbors('Alien'))
+
+        # Ronin shares no words with Heat but is always bought with it
+        for _ in range(3):
+            place_order(self.user, {self.movies['Heat'].id: 1, self.movies['Ronin'].id: 1}, 'Texas')
+        call_command('build_similar_movies', '--full', stdout=StringIO())
+        self.assertEqual(self.neighbors('Ronin'), ['Heat'])
+        self.assertEqual(self.neighbors('Heat')[0], 'Ronin')
+
+    def test_incremental_build_matches_full_build(self):
+        call_command('build_similar_movies', stdout=StringIO())
+        Movie.objects.create(
+            name='Prometheus', price=10, image='movie_images/a.jpg',
+            description='Explorers in space find the deadly alien creature that made mankind',
+        )
+        call_command('build_similar_movies', stdout=StringIO())
+        incremental = {name: self.neighbors(name) for name in self.movies}
+
+        call_command('build_similar_movies', '--full', stdout=StringIO())
+        self.assertEqual({name: self.neighbors(name) for name in self.movies}, incremental)
+        self.assertIn('Prometheus', incremental['Alien'])
+
+        out = StringIO()
+        call_command('build_similar_movies', stdout=out)
+        self.assertIn('up to date', out.getvalue())
+
+    def test_show_page_lists_similar_movies(self):
+        call_command('build_similar_movies', stdout=StringIO())
+        get_cache().clear()
+        response = self.client.get(reverse('movies.show', args=[self.movies['Alien'].id]))
+        self.assertEqual([movie.name for movie in response.context['template_data']['similar_movies']][:1], ['Aliens'])
+        self.assertContains(response, 'Similar movies')
+
+class RecommendationTests(TestCase):
+    def setUp(self):
+        self.movies = {
+            name: Movie.objects.create(name=name, price=10, description=name, image='movie_images/a.jpg')
+            for name in 'ABCD'
+        }
+        self.users = [User.objects.create_user(username=f'user{i}', password='secret-pass') for i in range(4)]
+        for user, stars in zip(self.users, ('5513', '4523', '1253', '5')):
+            for name, star in zip('ABCD', stars):
+                Rating.objects.create(user=user, movie=self.movies[name], stars=int(star))
+
+    def recommended(self, user):
+        return list(Recommendation.objects.filter(user=user).order_by('rank').values_list('movie__name', flat=True))
+
+    def test_recommends_unrated_movies_liked_by_similar_raters(self):
+        call_command('build_recommendations', stdout=StringIO())
+        # Whoever likes A likes B, and C is rated the other way round
+        self.assertEqual(self.recommended(self.users[3]), ['B'])
+        self.assertEqual(self.recommended(self.users[0]), [])
+
+    def test_incremental_run_rescores_only_users_who_rated(self):
+        call_command('build_recommendations', stdout=StringIO())
+        Recommendation.objects.filter(user=self.users[3]).update(score=-1)
+        out = StringIO()
+        call_command('build_recommendations', stdout=out)
+        self.assertIn('up to date', out.getvalue())
+
+        Rating.objects.update_or_create(user=self.users[2], movie=self.movies['A'], defaults={'stars': 2})
+        out = StringIO()
+        call_command('build_recommendations', stdout=out)
+        self.assertIn('for 1 users (incremental)', out.getvalue())
+        self.assertEqual(Recommendation.objects.get(user=self.users[3]).score, -1)
+
+        call_command('build_recommendations', '--full', stdout=StringIO())
+        self.assertGreater(Recommendation.objects.get(user=self.users[3]).score, 0)
+
+    def test_home_page_shows_recommendations_with_one_query(self):
+        call_command('build_recommendations', stdout=StringIO())
+        self.client.force_login(self.users[3])
+        # The user and the recommendations; the session comes from the cache
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('home.index'))
+        self.assertContains(response, 'Recommended for you')
+        self.assertEqual([movie.name for movie in response.context['template_data']['recommended_movies']], ['B'])
+
+class ImportMoviesTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        for name, color in (('red.png', 'red'), ('copy.png', 'red'), ('blue.png', 'blue')):
+            Image.new('RGB', (60, 90), color).save(f'{self.directory}/{name}', 'PNG')
+        self.catalog = f'{self.directory}/catalog.jsonl'
+
+    def write_catalog(self, rows, mode='w'):
+        with open(self.catalog, mode) as catalog:
+            for row in rows:
+                catalog.write(json.dumps(row) + '\n')
+
+    def import_movies(self, *args):
+        out = StringIO()
+        call_command('import_movies', self.catalog, '--batch-size', '2', *args, stdout=out, stderr=StringIO())
+        return out.getvalue()
+
+    def test_imports_valid_rows_and_stores_each_image_once(self):
+        self.write_catalog([
+            {'name': 'Heat', 'price': 8, 'description': 'Heist', 'image': 'red.png'},
+            {'name': 'Heat 2', 'price': '9', 'description': 'Sequel', 'image': f'{self.directory}/copy.png'},
+            {'name': 'Ronin', 'price': 'cheap', 'description': 'Chase', 'image': 'red.png'},
+            {'name': 'Alien', 'price': 10, 'description': 'Space horror', 'image': 'blue.png'},
+            {'name': 'Aliens', 'price': 10, 'description': 'Space war', 'image': 'missing.png'},
+        ])
+        self.assertIn('Imported 3 movies', self.import_movies())
+
+        movies = {movie.name: movie for movie in Movie.objects.all()}
+        self.assertEqual(sorted(movies), ['Alien', 'Heat', 'Heat 2'])
+        self.assertEqual(movies['Heat'].image.name, movies['Heat 2'].image.name)
+        self.assertEqual(movies['Heat'].image.name, f"movie_images/{movies['Heat'].image_hash}.png")
+        self.assertEqual(len(default_storage.listdir('movie_images')[1]), 2)
+        self.assertEqual(MovieImport.objects.get().rows_done, 5)
+        if search.fts_enabled():
+            self.assertContains(self.client.get(reverse('movies.typeahead'), {'q': 'alien'}), 'Alien')
+
+    def test_resumes_from_the_last_committed_batch(self):
+        self.write_catalog([
+            {'name': f'Movie {i}', 'price': i, 'description': 'A movie', 'image': 'red.png'} for i in range(5)
+        ])
+        with mock.patch.object(search, 'index_movies', side_effect=[None, RuntimeError('crash')]):
+            with self.assertRaises(RuntimeError):
+                self.import_movies()
+        self.assertEqual(Movie.objects.count(), 2)
+        self.assertEqual(MovieImport.objects.get().rows_done, 2)
+
+        self.assertIn('Resuming after row 2', self.import_movies())
+        self.assertEqual(Movie.objects.count(), 5)
+        self.assertIn('Imported 0 movies', self.import_movies())
+
+        self.write_catalog([{'name': 'Movie 5', 'price': 5, 'description': 'A movie', 'image': 'blue.png'}], 'a')
+        self.import_movies()
+        self.assertEqual(Movie.objects.count(), 6)
+        self.import_movies('--restart')
+        self.assertEqual(Movie.objects.count(), 12)
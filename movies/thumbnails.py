@@ -0,0 +1,118 @@
+"""
+Resized variants of movie images.
+
+Every movie image gets WebP and JPEG thumbnails at the heights in
+THUMBNAIL_HEIGHTS. Thumbnails are named after a hash of the source image
+content (``thumbnails/<hash>-<height>.<ext>``), so a URL always refers to
+the same bytes and can be cached forever, and identical uploads share
+their thumbnails.
+
+Thumbnails are generated after a movie image is saved, or for the whole
+catalog with ``manage.py generate_thumbnails``, never while a page is
+rendered: until an image's thumbnails exist, pages show the image itself.
+"""
+import hashlib
+import time
+from io import BytesIO
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image
+
+THUMBNAIL_DIR = 'thumbnails'
+
+# Cards are 200px high and the movie page image 400px; 800 covers the
+# movie page on high density screens
+THUMBNAIL_HEIGHTS = (200, 400, 800)
+
+# Extension -> (Pillow format, MIME type, save options), best format first
+THUMBNAIL_FORMATS = {
+    'webp': ('WEBP', 'image/webp', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', 'image/jpeg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+# Thumbnails known to exist, so rendering a page does not stat every file
+_existing = set()
+
+# Image hashes found without all their thumbnails -> when that was checked.
+# They are checked again after MISSING_RECHECK_SECONDS, since the thumbnails
+# may be generated by another process
+_missing = {}
+
+MISSING_RECHECK_SECONDS = 60
+
+def content_hash(file):
+    """Return a short hash of a file's content, leaving it rewound"""
+    digest = hashlib.sha256()
+    file.seek(0)
+    for chunk in file.chunks():
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()[:16]
+
+def thumbnail_name(image_hash, height, extension):
+    return f'{THUMBNAIL_DIR}/{image_hash}-{height}.{extension}'
+
+def render_thumbnail(image, height, extension):
+    """Return the bytes of ``image`` scaled down to ``height`` pixels"""
+    image_format, _, options = THUMBNAIL_FORMATS[extension]
+    thumbnail = image.copy()
+    # thumbnail() keeps the aspect ratio and never enlarges
+    thumbnail.thumbnail((height * 10, height), Image.LANCZOS)
+    if image_format == 'JPEG' and thumbnail.mode != 'RGB':
+        thumbnail = thumbnail.convert('RGB')
+    elif thumbnail.mode not in ('RGB', 'RGBA'):
+        thumbnail = thumbnail.convert('RGBA')
+    output = BytesIO()
+    thumbnail.save(output, image_format, **options)
+    return output.getvalue()
+
+def generate_thumbnails(image_name, image_hash, force=False, storage=default_storage):
+    """Create the missing thumbnails of an image and return how many were written"""
+    names = {
+        (height, extension): thumbnail_name(image_hash, height, extension)
+        for height in THUMBNAIL_HEIGHTS for extension in THUMBNAIL_FORMATS
+    }
+    if not force:
+        names = {key: name for key, name in names.items() if not storage.exists(name)}
+    if names:
+        with storage.open(image_name) as source, Image.open(source) as image:
+            image.load()
+            for (height, extension), name in names.items():
+                if force and storage.exists(name):
+                    storage.delete(name)
+                storage.save(name, ContentFile(render_thumbnail(image, height, extension)))
+    _existing.update(
+        thumbnail_name(image_hash, height, extension)
+        for height in THUMBNAIL_HEIGHTS for extension in THUMBNAIL_FORMATS
+    )
+    _missing.pop(image_hash, None)
+    return len(names)
+
+def thumbnail_srcsets(movie, height):
+    """
+    Return ``[(mime type, srcset)]`` for a movie shown ``height`` pixels
+    high, best format first. Returns an empty list if any of them has not
+    been generated yet, so the original image is shown instead.
+    """
+    if not movie.image_hash or not movie.image:
+        return []
+    densities = [(size, f'{size // height}x') for size in THUMBNAIL_HEIGHTS if size in (height, 2 * height)]
+    if not densities:
+        return []
+    wanted = [thumbnail_name(movie.image_hash, size, extension) for size, _ in densities for extension in THUMBNAIL_FORMATS]
+    if not _existing.issuperset(wanted):
+        checked_at = _missing.get(movie.image_hash)
+        if checked_at is not None and time.monotonic() - checked_at < MISSING_RECHECK_SECONDS:
+            return []
+        if not all(default_storage.exists(name) for name in wanted):
+            _missing[movie.image_hash] = time.monotonic()
+            return []
+        _missing.pop(movie.image_hash, None)
+        _existing.update(wanted)
+    return [
+        (mime_type, ', '.join(
+            f'{default_storage.url(thumbnail_name(movie.image_hash, size, extension))} {density}'
+            for size, density in densities
+        ))
+        for extension, (_, mime_type, _) in THUMBNAIL_FORMATS.items()
+    ]
@@ -4,7 +4,10 @@ from . import views
 
 urlpatterns = [
     path('', views.index, name='movies.index'),
+    path('page/', views.movies_page, name='movies.page'),
+    path('search/', views.typeahead, name='movies.typeahead'),
     path('<int:id>/', views.show, name='movies.show'),
+    path('<int:id>/reviews/', views.reviews, name='movies.reviews'),
     path('<int:id>/review/create/', views.create_review, name='movies.create_review'),
     path('<int:id>/review/<int:review_id>/edit/', views.edit_review, name='movies.edit_review'),
     path('<int:id>/review/<int:review_id>/delete/', views.delete_review, name='movies.delete_review'),
@@ -14,5 +17,7 @@ urlpatterns = [
     path('petitions/<int:petition_id>/vote/', views.vote_petition, name='movies.vote_petition'),
     path('local-popularity-map/', views.local_popularity_map, name='movies.local_popularity_map'),
     path('api/trending-movies/', views.trending_movies_api, name='movies.trending_movies_api'),
+    path('leaderboards/', views.leaderboards, name='movies.leaderboards'),
+    path('api/leaderboards/<str:name>/', views.leaderboard_api, name='movies.leaderboard_api'),
     path('<int:id>/rate/', views.add_rating, name='movies.add_rating'),
 ]
@@ -3,28 +3,130 @@ from django.shortcuts import render, redirect, get_object_or_404
 from .models import Movie, Review, Petition, Rating
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse
+from django.http import Http404, HttpResponse, JsonResponse
+from django.template.loader import render_to_string
+from django.urls import reverse
 from django.utils import timezone
-from django.db.models import Count, Sum
-from cart.models import Order, Item
-from datetime import datetime, timedelta
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from django.views.decorators.cache import cache_control
+from django.db import transaction
+from django.db.models import Q, Sum
+from cart.models import StateMovieSales
+from core.routers import primary_reads
+from datetime import timedelta
+import json
+from .caching import aget_version, get_cache, get_or_set, movie_cache_namespace
+from . import leaderboards as boards, search
 from .forms import RatingForm
+from .pagination import akeyset_page, keyset_page
 
-def index(request):
-    search_term = request.GET.get('search')
+MOVIES_PAGE_SIZE = 24
+TYPEAHEAD_SIZE = 8
+REVIEWS_PAGE_SIZE = 10
+
+TRENDING_CACHE_NAMESPACE = 'trending'
+
+US_STATES = [
+    'Alabama', 'Alaska', 'Arizona', 'Arkansas', 'California', 'Colorado', 'Connecticut', 'Delaware',
+    'Florida', 'Georgia', 'Hawaii', 'Idaho', 'Illinois', 'Indiana', 'Iowa', 'Kansas', 'Kentucky',
+    'Louisiana', 'Maine', 'Maryland', 'Massachusetts', 'Michigan', 'Minnesota', 'Mississippi',
+    'Missouri', 'Montana', 'Nebraska', 'Nevada', 'New Hampshire', 'New Jersey', 'New Mexico',
+    'New York', 'North Carolina', 'North Dakota', 'Ohio', 'Oklahoma', 'Oregon', 'Pennsylvania',
+    'Rhode Island', 'South Carolina', 'South Dakota', 'Tennessee', 'Texas', 'Utah', 'Vermont',
+    'Virginia', 'Washington', 'West Virginia', 'Wisconsin', 'Wyoming'
+]
+
+def catalog_movies():
+    # Cards never show the description, so leave the TEXT column unloaded
+    return Movie.objects.only('id', 'name', 'price', 'image', 'image_hash', 'average_rating')
+
+def catalog_page(search_term, cursor):
+    """Return a page of movie cards ordered by name and the next page's cursor"""
+    movies = catalog_movies()
     if search_term:
-        movies = Movie.objects.filter(name__icontains=search_term)
-    else:
-        movies = Movie.objects.all()
+        if search.fts_enabled():
+            return search.search_page(movies, search_term, cursor, MOVIES_PAGE_SIZE)
+        movies = movies.filter(name__icontains=search_term)
+    return keyset_page(movies, ('name', 'id'), cursor, MOVIES_PAGE_SIZE)
+
+async def acatalog_page(search_term, cursor):
+    """Async version of catalog_page"""
+    movies = catalog_movies()
+    if search_term:
+        if await search.afts_enabled():
+            return await search.asearch_page(movies, search_term, cursor, MOVIES_PAGE_SIZE)
+        movies = movies.filter(name__icontains=search_term)
+    return await akeyset_page(movies, ('name', 'id'), cursor, MOVIES_PAGE_SIZE)
+
+def index(request):
+    search_term = request.GET.get('search', '')
+    movies, next_cursor = catalog_page(search_term, request.GET.get('cursor'))
 
     template_data = {}
     template_data['title'] = 'Movies'
     template_data['movies'] = movies
+    template_data['search_term'] = search_term
+    template_data['next_cursor'] = next_cursor
     return render(request, 'movies/index.html', {'template_data': template_data})
 
+async def movies_page(request):
+    """JSON fragment with the next page of movie cards for infinite scroll"""
+    movies, next_cursor = await acatalog_page(request.GET.get('search', ''), request.GET.get('cursor'))
+    return JsonResponse({
+        'html': render_to_string('movies/movie_cards.html', {'movies': movies}),
+        'next_cursor': next_cursor,
+    })
+
+async def typeahead(request):
+    """JSON suggestions for the catalog search box, best match first"""
+    term = request.GET.get('q', '').strip()
+    suggestions = []
+    if term:
+        if await search.afts_enabled():
+            movies, _ = await search.asearch_page(Movie.objects.only('id', 'name'), term, None, TYPEAHEAD_SIZE)
+        else:
+            movies = [
+                movie async for movie in
+                Movie.objects.only('id', 'name').filter(name__icontains=term).order_by('name')[:TYPEAHEAD_SIZE]
+            ]
+        suggestions = [
+            {'id': movie.id, 'name': movie.name, 'url': reverse('movies.show', args=[movie.id])}
+            for movie in movies
+        ]
+    return JsonResponse({'results': suggestions})
+
+def movie_reviews(movie_id):
+    return Review.objects.filter(movie_id=movie_id).select_related('user').only(
+        'id', 'comment', 'date', 'movie_id', 'reported', 'user__id', 'user__username'
+    )
+
+def review_page(movie_id, cursor):
+    """Return a page of a movie's reviews, newest first, and the next page's cursor"""
+    return keyset_page(movie_reviews(movie_id), ('-date', '-id'), cursor, REVIEWS_PAGE_SIZE)
+
+def show_page_data(id):
+    """The parts of the movie page that are the same for every visitor"""
+    movie = get_object_or_404(Movie, id=id)
+    reviews, next_cursor = review_page(movie.id, None)
+    return {
+        'movie': movie, 'reviews': reviews, 'reviews_cursor': next_cursor,
+        'similar_movies': similar_movies(movie.id),
+    }
+
+def similar_movies(movie_id):
+    # Reads the precomputed neighbors through the (movie, rank) unique index
+    return list(catalog_movies().filter(neighbor_of__movie_id=movie_id).order_by('neighbor_of__rank'))
+
+def recommended_movies(user_id):
+    # Reads the precomputed recommendations through the (user, rank) unique index
+    return list(catalog_movies().filter(recommended__user_id=user_id).order_by('recommended__rank'))
+
 def show(request, id):
-    movie =  Movie.objects.get(id=id)
-    reviews = Review.objects.filter(movie=movie)
+    # The movie, its rating summary and its reviews come from the cache until
+    # a review, rating or the movie itself changes
+    page_data = get_or_set(movie_cache_namespace(id), 'show', lambda: show_page_data(id))
+    movie = page_data['movie']
     
     # Add the rating form to the context
     rating_form = RatingForm()
@@ -32,17 +134,40 @@ def show(request, id):
     template_data = {}
     template_data['title'] = movie.name
     template_data['movie'] = movie
-    template_data['reviews'] = reviews
+    template_data['reviews'] = page_data['reviews']
+    template_data['reviews_cursor'] = page_data['reviews_cursor']
+    template_data['similar_movies'] = page_data['similar_movies']
     template_data['rating_form'] = rating_form # <-- Add this
 
     # Also check if the user has already rated this movie to display their current rating
     if request.user.is_authenticated:
-        current_user_rating = Rating.objects.filter(movie=movie, user=request.user).first()
+        current_user_rating = Rating.objects.filter(movie_id=id, user=request.user).first()
         template_data['current_user_rating'] = current_user_rating
 
     return render(request, 'movies/show.html',
         {'template_data': template_data})
 
+async def reviews(request, id):
+    """Compact JSON feed of a movie's reviews, newest first"""
+    reviews, next_cursor = await akeyset_page(
+        movie_reviews(id), ('-date', '-id'), request.GET.get('cursor'), REVIEWS_PAGE_SIZE
+    )
+    if not reviews and not await Movie.objects.filter(id=id).aexists():
+        raise Http404('No Movie matches the given query.')
+    return JsonResponse({
+        'reviews': [
+            {
+                'id': review.id,
+                'user_id': review.user.id,
+                'user': review.user.username,
+                'comment': review.comment,
+                'date': review.date.isoformat(),
+            }
+            for review in reviews
+        ],
+        'next_cursor': next_cursor,
+    })
+
 @login_required
 def create_review(request, id):
     if request.method == 'POST' and request.POST['comment'] != '':
@@ -106,12 +231,13 @@ def add_rating(request, id): # <-- Make sure 'id' is here
     return redirect('movies.show', id=id)
 
 def petitions(request):
-    petitions = Petition.objects.all().order_by('-created_date')
+    petitions = Petition.objects.select_related('created_by').order_by('-created_date')
     
     # Add vote status for each petition if user is authenticated
     if request.user.is_authenticated:
+        voted_ids = set(request.user.petition_votes.values_list('id', flat=True))
         for petition in petitions:
-            petition.user_has_voted = petition.has_user_voted(request.user)
+            petition.user_has_voted = petition.id in voted_ids
     
     template_data = {}
     template_data['title'] = 'Movie Petitions'
@@ -143,12 +269,14 @@ def create_petition(request):
 def vote_petition(request, petition_id):
     petition = get_object_or_404(Petition, id=petition_id)
     
-    if petition.has_user_voted(request.user):
-        petition.votes.remove(request.user)
-        messages.info(request, 'Your vote has been removed.')
-    else:
-        petition.votes.add(request.user)
-        messages.success(request, 'Thank you for voting!')
+    # The vote and its counter update are committed together
+    with transaction.atomic():
+        if petition.has_user_voted(request.user):
+            petition.votes.remove(request.user)
+            messages.info(request, 'Your vote has been removed.')
+        else:
+            petition.votes.add(request.user)
+            messages.success(request, 'Thank you for voting!')
     
     return redirect('movies.petitions')
 
@@ -157,82 +285,103 @@ def local_popularity_map(request):
     template_data['title'] = 'Local Popularity Map'
     return render(request, 'movies/local_popularity_map.html', {'template_data': template_data})
 
-def trending_movies_api(request):
+async def trending_movies_data():
     """
-    API endpoint that returns trending movies data by state.
-    Calculates real data from purchase history.
+    Calculate the most popular movie of every state from the daily state
+    sales rollup with a single grouped query.
     """
-    # Get all US states
-    us_states = [
-        'Alabama', 'Alaska', 'Arizona', 'Arkansas', 'California', 'Colorado', 'Connecticut', 'Delaware',
-        'Florida', 'Georgia', 'Hawaii', 'Idaho', 'Illinois', 'Indiana', 'Iowa', 'Kansas', 'Kentucky',
-        'Louisiana', 'Maine', 'Maryland', 'Massachusetts', 'Michigan', 'Minnesota', 'Mississippi',
-        'Missouri', 'Montana', 'Nebraska', 'Nevada', 'New Hampshire', 'New Jersey', 'New Mexico',
-        'New York', 'North Carolina', 'North Dakota', 'Ohio', 'Oklahoma', 'Oregon', 'Pennsylvania',
-        'Rhode Island', 'South Carolina', 'South Dakota', 'Tennessee', 'Texas', 'Utah', 'Vermont',
-        'Virginia', 'Washington', 'West Virginia', 'Wisconsin', 'Wyoming'
-    ]
-    
+    # Consider the last 30 days of sales when deciding if a movie is trending
+    thirty_days_ago = timezone.localdate() - timedelta(days=30)
+    movie_purchases = StateMovieSales.objects.filter(
+        state__in=US_STATES
+    ).values('state', 'movie__name').annotate(
+        total_quantity=Sum('quantity'),
+        recent_quantity=Sum('quantity', filter=Q(day__gte=thirty_days_ago))
+    ).order_by('state', '-total_quantity')
+
+    # Rows come ordered by state then popularity, so the first row seen for
+    # a state is its most popular movie
+    most_popular = {}
+    async for row in movie_purchases:
+        most_popular.setdefault(row['state'], row)
+
     state_movie_data = {}
-    
-    # Calculate trending movies for each state
-    for state in us_states:
-        # Get all orders from this state
-        state_orders = Order.objects.filter(state=state)
-        
-        if state_orders.exists():
-            # Get movie purchase counts for this state
-            movie_purchases = Item.objects.filter(
-                order__state=state
-            ).values('movie__name').annotate(
-                total_quantity=Sum('quantity'),
-                total_orders=Count('order', distinct=True)
-            ).order_by('-total_quantity')
-            
-            if movie_purchases.exists():
-                # Get the most popular movie
-                most_popular = movie_purchases.first()
-                movie_name = most_popular['movie__name']
-                total_purchases = most_popular['total_quantity']
-                
-                # Calculate if it's trending (purchases in last 30 days vs total)
-                thirty_days_ago = timezone.now() - timedelta(days=30)
-                recent_purchases = Item.objects.filter(
-                    order__state=state,
-                    order__date__gte=thirty_days_ago,
-                    movie__name=movie_name
-                ).aggregate(recent_total=Sum('quantity'))['recent_total'] or 0
-                
-                # Consider trending if recent purchases are > 30% of total
-                trending_threshold = total_purchases * 0.3
-                is_trending = recent_purchases > trending_threshold
-                
-                state_movie_data[state] = {
-                    'movie': movie_name,
-                    'purchases': total_purchases,
-                    'trending': is_trending
-                }
-            else:
-                # No purchases in this state
-                state_movie_data[state] = {
-                    'movie': 'No purchases',
-                    'purchases': 0,
-                    'trending': False
-                }
-        else:
-            # No orders from this state
+    for state in US_STATES:
+        row = most_popular.get(state)
+        if row is None:
+            # No purchases in this state
             state_movie_data[state] = {
                 'movie': 'No purchases',
                 'purchases': 0,
                 'trending': False
             }
-    
-    return JsonResponse({
+            continue
+
+        total_purchases = row['total_quantity']
+        recent_purchases = row['recent_quantity'] or 0
+
+        # Consider trending if recent purchases are > 30% of total
+        trending_threshold = total_purchases * 0.3
+        state_movie_data[state] = {
+            'movie': row['movie__name'],
+            'purchases': total_purchases,
+            'trending': recent_purchases > trending_threshold
+        }
+
+    return {
         'success': True,
         'data': state_movie_data,
         'message': 'Trending movies data calculated from purchase history',
         'timestamp': str(timezone.now()),
         'api_version': '2.0',
         'total_states': len(state_movie_data),
-        'calculation_method': 'Real-time purchase analysis'
-    })
+        'calculation_method': 'Daily state sales rollup'
+    }
+
+async def trending_movies_etag():
+    # Orders bump the version; the date covers the 30 day trending window
+    return f'{await aget_version(TRENDING_CACHE_NAMESPACE)}-{timezone.localdate().isoformat()}'
+
+@cache_control(no_cache=True)
+async def trending_movies_api(request):
+    """
+    API endpoint that returns trending movies data by state.
+    The serialized response is cached until the next order is placed.
+    """
+    etag = await trending_movies_etag()
+    response = get_conditional_response(request, etag=quote_etag(etag))
+    if response is None:
+        cache = get_cache()
+        cache_key = f'{TRENDING_CACHE_NAMESPACE}:{etag}'
+        content = await cache.aget(cache_key)
+        if content is None:
+            # Cached under the new version, so never from a lagging replica
+            with primary_reads():
+                content = json.dumps(await trending_movies_data())
+            await cache.aset(cache_key, content)
+        response = HttpResponse(content, content_type='application/json')
+    response['ETag'] = quote_etag(etag)
+    return response
+
+def leaderboards(request):
+    window = request.GET.get('window', '30d')
+    if window not in boards.WINDOWS:
+        window = '30d'
+    template_data = {}
+    template_data['title'] = 'Leaderboards'
+    template_data['window'] = window
+    template_data['windows'] = list(boards.WINDOWS)
+    template_data['boards'] = [
+        {'name': name, 'title': title, 'ranked': ranked, 'entries': boards.top(name, window)}
+        for name, (_, title, ranked) in boards.LEADERBOARDS.items()
+    ]
+    return render(request, 'movies/leaderboards.html', {'template_data': template_data})
+
+def leaderboard_api(request, name):
+    """Return one leaderboard as JSON, e.g. /movies/api/leaderboards/top_sellers/?window=7d"""
+    window = request.GET.get('window', 'all')
+    try:
+        entries = boards.top(name, window)
+    except KeyError:
+        raise Http404('Unknown leaderboard')
+    return JsonResponse({'name': name, 'window': window, 'entries': entries})
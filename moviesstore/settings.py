@@ -42,11 +42,15 @@ INSTALLED_APPS = [
     'movies',
     'accounts',
     'cart',
+    'core',
 ]
 
 MIDDLEWARE = [
+    'core.instrumentation.InstrumentationMiddleware',
+    'core.routers.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'cart.middleware.CartMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -54,6 +58,15 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Request instrumentation (core.instrumentation). Metrics are served to staff
+# at /diagnostics/metrics/; set a threshold in ms to log slow requests.
+
+INSTRUMENTATION_ENABLED = True
+
+INSTRUMENTATION_SERVER_TIMING = True
+
+INSTRUMENTATION_SLOW_REQUEST_MS = 500
+
 ROOT_URLCONF = 'moviesstore.urls'
 
 TEMPLATES = [
@@ -78,13 +91,125 @@ WSGI_APPLICATION = 'moviesstore.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
+# Seconds to keep a database connection open between requests. Under ASGI
+# each request runs its sync code on a thread of its own, so a persistent
+# connection would never be reused and is closed after every request
+# instead: moviesstore/asgi.py sets MOVIESSTORE_CONN_MAX_AGE to 0.
+CONN_MAX_AGE = int(os.environ.get('MOVIESSTORE_CONN_MAX_AGE', 600))
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Keep connections open between requests instead of reconnecting
+        'CONN_MAX_AGE': CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+    }
+}
+
+# Optional read replica, enabled by pointing MOVIESSTORE_REPLICA_DB at a copy
+# of the database kept up to date with "manage.py sync_replica". Reads of
+# safe requests go to it (core.routers); clients that just wrote something
+# read from the primary for REPLICA_STICKY_SECONDS.
+DATABASE_REPLICA_ALIAS = 'replica'
+
+if os.environ.get('MOVIESSTORE_REPLICA_DB'):
+    DATABASES[DATABASE_REPLICA_ALIAS] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ['MOVIESSTORE_REPLICA_DB'],
+        'CONN_MAX_AGE': CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        'TEST': {'MIRROR': 'default'},
     }
+
+DATABASE_ROUTERS = ['core.routers.PrimaryReplicaRouter']
+
+REPLICA_STICKY_SECONDS = 10
+
+# Pragmas applied to every new SQLite connection (core.sqlite), chosen with
+# the MOVIESSTORE_DB_PROFILE environment variable. "concurrent" uses
+# write-ahead logging so reads are not blocked while orders are written;
+# "safe" keeps SQLite's rollback journal and fully synchronous writes.
+SQLITE_PROFILES = {
+    'safe': {
+        'journal_mode': 'delete',
+        'synchronous': 'full',
+        'busy_timeout': 5000,
+    },
+    'concurrent': {
+        'journal_mode': 'wal',
+        'synchronous': 'normal',
+        'busy_timeout': 5000,
+        'cache_size': -64000,
+        'mmap_size': 268435456,
+        'temp_store': 'memory',
+    },
 }
 
+SQLITE_PRAGMAS = SQLITE_PROFILES[os.environ.get('MOVIESSTORE_DB_PROFILE', 'concurrent')]
+
+# Databases whose journal mode is left alone. journal_mode is stored in the
+# database file, so switching the checked-in development database to WAL
+# would rewrite it, and leave -wal and -shm files next to it, on every
+# manage.py run. The other pragmas only last for the connection.
+SQLITE_KEEP_JOURNAL_MODE = [str(BASE_DIR / 'db.sqlite3')]
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+#
+# The 'api' cache holds serialized API responses and the version stamps
+# (movies.caching) their cache keys and ETags are built from. Every process
+# serving the site must share it, or a write handled by one worker never
+# invalidates what the others cached and clients keep getting 304s for stale
+# data. It defaults to the file based backend when WEB_CONCURRENCY (read by
+# gunicorn and uvicorn) asks for several workers; MOVIESSTORE_API_CACHE
+# overrides the choice, and the core.E001 system check rejects the
+# per-process locmem backend with several workers. Management commands that
+# bump versions, e.g. generate_thumbnails, also need a shared backend to
+# reach running servers.
+
+API_CACHE_ALIAS = 'api'
+
+WEB_WORKERS = int(os.environ.get('WEB_CONCURRENCY', 1))
+
+API_CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'moviesstore-api',
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, '.cache', 'api'),
+    },
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    API_CACHE_ALIAS: {
+        **API_CACHE_BACKENDS[os.environ.get('MOVIESSTORE_API_CACHE', 'file' if WEB_WORKERS > 1 else 'locmem')],
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_ENTRIES': 500,
+        },
+    },
+}
+
+# Sessions are read through the default cache and only hit the database on
+# writes (logins, messages)
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+# Carts (cart.store) live outside the session so browsing never writes to
+# the database. Other stores: cart.store.SessionCartStore, and
+# cart.store.MemoryCartStore for tests.
+CART_STORE = 'cart.store.SignedCookieCartStore'
+
+CART_COOKIE_NAME = 'cart'
+
+CART_COOKIE_AGE = 60 * 60 * 24 * 14
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -122,6 +247,34 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# How static files are served, from the MOVIESSTORE_ASSETS environment
+# variable. "dev" serves them from the app directories through runserver.
+# "manifest" serves the output of collectstatic, whose file names carry a
+# content hash, with far-future caching (run collectstatic first; hashed
+# names are only used with DEBUG off).
+ASSET_MODE = os.environ.get('MOVIESSTORE_ASSETS', 'dev')
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': (
+            'django.contrib.staticfiles.storage.ManifestStaticFilesStorage' if ASSET_MODE == 'manifest'
+            else 'django.contrib.staticfiles.storage.StaticFilesStorage'
+        ),
+    },
+}
+
+# Let the front-end server send static and media files (core.assets):
+# "X-Sendfile" for Apache/lighttpd, or "X-Accel-Redirect" for nginx with an
+# internal location at SENDFILE_URL_PREFIX mapping back to the files
+SENDFILE_HEADER = os.environ.get('MOVIESSTORE_SENDFILE') or None
+
+SENDFILE_URL_PREFIX = '/internal'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 